@@ -0,0 +1,180 @@
+import numpy as np
+from itertools import islice
+
+# Marker groups of each recording, in file order, and the header field holding its frame count
+RECORDINGS = {
+    "CALREADINGS": (("D", "A", "C"), 3),
+    "EMPIVOT": (("G",), 1),
+    "OPTPIVOT": (("Dp", "H"), 2),
+}
+
+def read_header(path):
+    """Read the header fields of a data file"""
+    with open(path) as f:
+        return [field.strip() for field in f.readline().split(",")]
+
+
+def read_groups(path, n_groups):
+    """
+    Read a comma separated tracker data file into one array per marker group
+    :param path: Path of the data file
+    :param n_groups: Number of leading header fields giving the marker count of each group
+    :return: The header fields, and a contiguous array of shape (nframes, n, 3) per group
+    :rtype: (list, list)
+    """
+    with open(path) as f:
+        header = [field.strip() for field in f.readline().split(",")]
+        values = np.array(f.read().replace(",", " ").split(), dtype=np.float64)
+
+    sizes = [int(n) for n in header[:n_groups]]
+    frames = values.reshape((-1, sum(sizes), 3))
+
+    # Copy each group out once so every group is contiguous and per-frame slices are views
+    offsets = np.cumsum([0] + sizes)
+    groups = [np.ascontiguousarray(frames[:, offsets[i]:offsets[i+1]]) for i in range(n_groups)]
+    return header, groups
+
+
+def stream_groups(path, n_groups):
+    """
+    Read a comma separated tracker data file one frame at a time
+    :param path: Path of the data file
+    :param n_groups: Number of leading header fields giving the marker count of each group
+    :return: Generator of the marker groups of each frame, one (n, 3) array per group
+    """
+    with open(path) as f:
+        header = [field.strip() for field in f.readline().split(",")]
+        sizes = [int(n) for n in header[:n_groups]]
+        offsets = np.cumsum([0] + sizes)
+
+        while True:
+            lines = list(islice(f, offsets[-1]))
+            if len(lines) < offsets[-1]:
+                return
+            frame = np.array("".join(lines).replace(",", " ").split(), dtype=np.float64).reshape((-1, 3))
+            yield [frame[offsets[i]:offsets[i+1]] for i in range(n_groups)]
+
+
+class FrameStore():
+    """
+    Columnar storage of the marker data of a procedure. Each marker group is held as one contiguous array of shape
+    (nframes, n, 3), and the markers of a single frame are read as views into it.
+
+    Calibration body (marker positions in body coordinates, shared by every frame):
+        d: optical markers on the EM tracker, a: optical markers on the calibration object,
+        c: EM markers on the calibration object
+    Calibration readings: D, A (optical tracker) and C (EM tracker)
+    EM pivot: G, the EM markers on the EM probe
+    Optical pivot: Dp, the optical markers on the EM tracker, and H, the optical markers on the optical probe
+    """
+
+    def __init__(self, name, stream=False):
+        """
+        :param name: Path prefix of the procedure's data files
+        :param stream: Only load the calibration body; recordings are then read frame by frame through stream()
+        """
+        self.name = name
+        self.revision = 0             # Incremented whenever marker data changes, invalidating derived quantities
+
+        # Calibration body: a single frame
+        _, (d, a, c) = read_groups(f"{name}-CALBODY.TXT", 3)
+        self.d, self.a, self.c = d[0], a[0], c[0]
+        self.Nd, self.Na, self.Nc = len(self.d), len(self.a), len(self.c)
+
+        # Frame count of each recording, from the file headers
+        self.frame_counts = {}
+        for recording, (groups, field) in RECORDINGS.items():
+            self.frame_counts[recording] = int(read_header(self.path(recording))[field])
+        self.Ng = int(read_header(self.path("EMPIVOT"))[0])
+        self.Nh = int(read_header(self.path("OPTPIVOT"))[1])
+
+        if not stream:
+            for recording, (groups, field) in RECORDINGS.items():
+                _, arrays = read_groups(self.path(recording), len(groups))
+                for group, array in zip(groups, arrays):
+                    setattr(self, group, array)
+
+
+    def path(self, recording):
+        """Path of the data file of a recording, e.g. EMPIVOT"""
+        return f"{self.name}-{recording}.TXT"
+
+
+    @property
+    def Nf(self):
+        """Number of frames of the longest recording"""
+        return max(self.frame_counts.values())
+
+
+    def stream(self, recording):
+        """
+        Read the frames of a recording one at a time, sharing this store's calibration body
+        :param recording: "CALREADINGS", "EMPIVOT" or "OPTPIVOT"
+        :return: Generator of StreamedFrame, one per frame of the recording
+        """
+        groups = RECORDINGS[recording][0]
+        for arrays in stream_groups(self.path(recording), len(groups)):
+            yield StreamedFrame(self, dict(zip(groups, arrays)))
+
+
+    def points(self, group, fnum=None):
+        """
+        Position vectors of a marker group as columns (3 x n), for one frame or for the calibration body
+        :param group: Name of the group, e.g. "D" or "d"
+        :param fnum: Frame number, or None for the calibration body groups
+        :return: A view of the stored positions, or None if the recording has no such frame
+        """
+        data = getattr(self, group)
+        if fnum is None:
+            return data.T
+        if fnum >= len(data):
+            return None
+        return data[fnum].T
+
+
+    def set_points(self, group, values, fnum=None):
+        """
+        Replace the positions of a marker group, for one frame or for the calibration body
+        :param group: Name of the group, e.g. "D" or "d"
+        :param values: New position vectors as columns (3 x n)
+        :param fnum: Frame number, or None for the calibration body groups
+        """
+        data = getattr(self, group)
+        if fnum is None:
+            data[...] = np.asarray(values).T
+        else:
+            data[fnum] = np.asarray(values).T
+        self.revision += 1
+
+
+    def __repr__(self):
+        return f"FrameStore(name={self.name}, Nf={self.Nf})"
+
+
+class StreamedFrame():
+    """
+    The marker data of a single frame read from a recording, with the calibration body taken from the procedure's
+    FrameStore. Has the same points() interface as FrameStore, so a DataFrame can be built on either.
+    """
+
+    def __init__(self, body, groups):
+        self.body = body              # FrameStore holding the calibration body
+        self.groups = groups          # Marker groups of the frame, (n, 3) arrays keyed by group name
+
+
+    @property
+    def revision(self):
+        return self.body.revision
+
+
+    def points(self, group, fnum=None):
+        """
+        Position vectors of a marker group as columns (3 x n), of this frame or of the calibration body
+        :param group: Name of the group, e.g. "D" or "d"
+        :param fnum: Ignored for recorded groups, which only hold this frame; None for the calibration body groups
+        """
+        if fnum is None:
+            return self.body.points(group)
+        if group not in self.groups:
+            return None
+        return self.groups[group].T
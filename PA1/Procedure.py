@@ -1,62 +1,44 @@
 from DataFrame import DataFrame
+from FrameStore import FrameStore
 
 class Procedure():
-    def __init__(self, name):
-        
+    def __init__(self, name, stream=False):
+        """
+        :param name: Path prefix of the procedure's data files
+        :param stream: Parse frames on demand instead of loading every recording up front, so computations only
+                       hold one frame of marker data at a time
+        """
         self.name = name
-        self.dataframes = []
-
-        # Find data file paths
-        calbody = f"{self.name}-CALBODY.TXT"
-        calreadings = f"{self.name}-CALREADINGS.TXT"
-        empivot = f"{self.name}-EMPIVOT.TXT"
-        optpivot = f"{self.name}-OPTPIVOT.TXT"
-
-        # Load calibration data from the optical tracker
-        with open(calbody) as f:
-            linesCalBody = f.readlines()
-        metadata = linesCalBody[0].split(",")
-        self.Nd = int(metadata[0])
-        self.Na = int(metadata[1])
-        self.Nc = int(metadata[2])
-
-        # Load calibration data from the EM tracker
-        with open(calreadings) as f:
-            linesCalReadings = f.readlines()
-        self.Nf = int(linesCalReadings[0].split(",")[3])
-
-        # Load data about the EM post from the EM tracker
-        with open(empivot) as f:
-            linesEmPivot = f.readlines()
-        metadata = linesEmPivot[0].split(",")
-        self.Ng = int(metadata[0])
-
-        # Load data about the optical post from the optical tracker
-        with open(optpivot) as f:
-            linesOpPivot = f.readlines()
-        metadata = linesOpPivot[0].split(",")
-        Nh = int(metadata[1])
+        self.stream = stream
 
-        # Calculate the size of each data slice
-        scal = (self.Nd + self.Na + self.Nc)
-        sem = (self.Ng)
-        sop = (self.Nd + Nh)
+        # Load the calibration body, and the marker data of every recording unless streaming
+        self.store = FrameStore(name, stream)
+        self.Nd = self.store.Nd
+        self.Na = self.store.Na
+        self.Nc = self.store.Nc
+        self.Ng = self.store.Ng
+        self.Nf = self.store.frame_counts["CALREADINGS"]
 
         # Create a DataFrame for each frame number
-        for i in range(self.Nf):
-            df = DataFrame(i)
-            df.calibrate(self.Nd, self.Na, self.Nc, linesCalBody[1:])
-            df.calSensor(self.Nd, self.Na, self.Nc, linesCalReadings[i*scal+1:(i+1)*scal+1])
-            df.emProbe(self.Ng, linesEmPivot[i*sem+1:(i+1)*sem+1])
-            df.opProbe(self.Nd, Nh, linesOpPivot[i*sop+1:(i+1)*sop+1])
-            self.dataframes.append(df)
+        self.dataframes = [] if stream else [DataFrame(i, self.store) for i in range(self.store.Nf)]
+
+
+    def frames(self, recording):
+        """
+        The DataFrames holding each frame of a recording
+        :param recording: "CALREADINGS", "EMPIVOT" or "OPTPIVOT"
+        :return: Iterator of DataFrame; when streaming, each frame is parsed as it is reached
+        """
+        if self.stream:
+            return (DataFrame(i, frame) for i, frame in enumerate(self.store.stream(recording)))
+        return iter(self.dataframes[:self.store.frame_counts[recording]])
         
 
     def compute_expected(self):
         """Compute the expected positions of the calibration object's EM markers for each frame"""
         
         Ci = []
-        for frame in self.dataframes:
+        for frame in self.frames("CALREADINGS"):
             Ci.append(frame.compute_expected())
         return Ci
 
@@ -64,15 +46,18 @@ class Procedure():
         """Perform a pivot calibration"""
 
         if probeType.upper() == "EM":
-            probe0 = self.dataframes[0].emProbeCloud
-            probes = [df.emProbeCloud for df in self.dataframes[1:]]
+            frames = self.frames("EMPIVOT")
+            probe0 = next(frames).emProbeCloud
+            probes = (df.emProbeCloud for df in frames)
         elif probeType.upper() == "OP":
-            probe0 = self.dataframes[0].opProbeCloud
-            probes = [df.opProbeCloud for df in self.dataframes[1:]]
+            frames = self.frames("OPTPIVOT")
+            probe0 = next(frames).opProbeCloud
+            probes = (df.opProbeCloud for df in frames)
         else:
             raise Exception("ProbeType must be either EM or OP for the \
                 electromagnetic probe or optical probe, respectively.")
         
+        # PointCloud.pivot accumulates its normal equations one cloud at a time, so probes can stay lazy
         return probe0.pivot(probes)
     
 
@@ -1,6 +1,28 @@
 import unittest
 import numpy as np
-from PointCloud import PointCloud, pivot
+from PointCloud import PointCloud
+
+def rotation(axis, angle):
+    """ Rotation matrix of angle radians about axis (Rodrigues' formula) """
+    k = np.asarray(axis, dtype=float) / np.linalg.norm(axis)
+    K = np.array([[0, -k[2], k[1]],
+                  [k[2], 0, -k[0]],
+                  [-k[1], k[0], 0]])
+    return np.eye(3) + np.sin(angle) * K + (1 - np.cos(angle)) * K.dot(K)
+
+
+def probe_poses(markers, tip, pivot_point, rotations):
+    """
+    Poses of a probe whose tip rests on a fixed pivot point.
+
+    :param markers: Probe markers in probe coordinates (3, N).
+    :param tip: Tip position in probe coordinates (3, 1).
+    :param pivot_point: Pivot point in tracker coordinates (3, 1).
+    :param rotations: Probe orientation of every pose.
+    :return: The markers of every pose in tracker coordinates, as PointClouds.
+    """
+    return [PointCloud(R.dot(markers - tip) + pivot_point) for R in rotations]
+
 
 class TestPivotCalibration(unittest.TestCase):
 
@@ -8,27 +30,27 @@ class TestPivotCalibration(unittest.TestCase):
         """
         Setup the test cases with predefined point cloud data.
         """
-        self.point_clouds = []
+        # Four non-coplanar probe markers, in probe coordinates, and the tip at the end of the probe shaft
+        self.markers = np.array([[0, 10, 0, 0], [0, 0, 10, 0], [0, 0, 0, 10]], dtype=float)
+        self.tip = np.array([[2], [3], [-100]])
 
-        # Create synthetic point cloud data for different poses
-        points_1 = np.array([[1, 1, 1], [2, 2, 2], [3, 3, 3]])
-        points_2 = np.array([[2, 1, 1], [3, 2, 2], [4, 3, 3]])
-        points_3 = np.array([[1, 2, 1], [2, 3, 2], [3, 4, 3]])
+        # Ground truth calibration offset (the pivot post in tracker coordinates)
+        self.calibration_offset = np.array([[50], [-20], [200]])
 
-        # Store point clouds with slightly different poses
-        self.point_clouds.append([PointCloud(points_1)])
-        self.point_clouds.append([PointCloud(points_2)])
-        self.point_clouds.append([PointCloud(points_3)])
+        # The probe tilted by up to 30 degrees about several axes, starting from the probe orientation
+        axes = [[1, 0, 0], [0, 1, 0], [1, 1, 0], [1, -1, 0], [0, 1, 1], [1, 0, 1]]
+        angles = [0.2, -0.35, 0.5, 0.3, -0.45, 0.25]
+        self.rotations = [np.eye(3)] + [rotation(axis, angle) for axis, angle in zip(axes, angles)]
+        self.point_clouds = probe_poses(self.markers, self.tip, self.calibration_offset, self.rotations)
 
-        # Ground truth calibration offset and pivot point
-        self.calibration_offset = np.array([0.5, 0.5, 0.5])  # More realistic offset values
-        self.pivot_point = np.array([0, 0, 0])
+        # The pivot point is the tip relative to the centroid of the reference (first) cloud
+        self.pivot_point = self.tip - np.mean(self.markers, axis=1, keepdims=True)
 
     def test_pivot_stationary(self):
         """
         Test the pivot calibration with stationary probe data.
         """
-        calibration_offset, pivot_point = pivot(self.point_clouds, 0)
+        calibration_offset, pivot_point = self.point_clouds[0].pivot(self.point_clouds)
 
         # Check if the calculated calibration offset and pivot point match the ground truth
         np.testing.assert_allclose(calibration_offset, self.calibration_offset, atol=1e-3, err_msg="Calibration offset is incorrect")
@@ -36,35 +58,36 @@ class TestPivotCalibration(unittest.TestCase):
 
     def test_pivot_movement(self):
         """
-        Test the pivot calibration with a moving probe in a straight line.
+        Test the pivot calibration with a probe swept around a pivot post away from the origin, with marker noise.
         """
-        # Create linear movement points
-        points_1 = np.array([[0, 0, 0], [1, 1, 1], [2, 2, 2]])
-        points_2 = np.array([[1, 1, 1], [2, 2, 2], [3, 3, 3]])
-        points_3 = np.array([[2, 2, 2], [3, 3, 3], [4, 4, 4]])
+        # Sweep the probe around a cone of 20 degrees about its shaft
+        calibration_offset = np.array([[-150], [80], [-40]])
+        rotations = [rotation([np.cos(a), np.sin(a), 0], np.radians(20)) for a in np.linspace(0, 2 * np.pi, 12, endpoint=False)]
+        self.point_clouds = probe_poses(self.markers, self.tip, calibration_offset, [np.eye(3)] + rotations)
 
-        self.point_clouds = []
-        self.point_clouds.append([PointCloud(points_1)])
-        self.point_clouds.append([PointCloud(points_2)])
-        self.point_clouds.append([PointCloud(points_3)])
+        # Jitter every marker
+        np.random.seed(42)
+        for cloud in self.point_clouds[1:]:
+            cloud.points[...] += np.random.normal(scale=0.01, size=cloud.points.shape)
 
-        calibration_offset, pivot_point = pivot(self.point_clouds, 0)
+        calibration_offset_fit, pivot_point = self.point_clouds[0].pivot(self.point_clouds)
 
         # Check if the calculated calibration offset and pivot point match the expected values
-        np.testing.assert_allclose(calibration_offset, np.array([0, 0, 0]), atol=1e-3, err_msg="Calibration offset is incorrect for movement")
-        np.testing.assert_allclose(pivot_point, np.array([1, 1, 1]), atol=1e-3, err_msg="Pivot point is incorrect for movement")
+        np.testing.assert_allclose(calibration_offset_fit, calibration_offset, atol=0.1, err_msg="Calibration offset is incorrect for movement")
+        np.testing.assert_allclose(pivot_point, self.pivot_point, atol=0.1, err_msg="Pivot point is incorrect for movement")
 
     def test_single_frame(self):
         """
         Test pivot calibration with only a single frame.
         """
-        single_frame_clouds = [[PointCloud(np.array([[1, 1, 1], [2, 2, 2], [3, 3, 3]]))]]
+        single_frame_clouds = self.point_clouds[:1]
 
-        calibration_offset, pivot_point = pivot(single_frame_clouds, 0)
+        calibration_offset, pivot_point = single_frame_clouds[0].pivot(single_frame_clouds)
 
-        # For a single frame, the pivot point and offset should be zero
-        np.testing.assert_allclose(calibration_offset, np.zeros(3), atol=1e-3, err_msg="Calibration offset should be zero for a single frame")
-        np.testing.assert_allclose(pivot_point, np.zeros(3), atol=1e-3, err_msg="Pivot point should be zero for a single frame")
+        # A single pose does not fix the tip along any direction, but the solution must still place the tip on the
+        # pivot point in that pose
+        centroid = np.mean(single_frame_clouds[0].points, axis=1, keepdims=True)
+        np.testing.assert_allclose(calibration_offset - pivot_point, centroid, atol=1e-3, err_msg="Tip is not on the pivot point for a single frame")
 
     def test_random_movement(self):
         """
@@ -77,11 +100,11 @@ class TestPivotCalibration(unittest.TestCase):
         points_3 = np.random.rand(3, 3) * 10
 
         self.point_clouds = []
-        self.point_clouds.append([PointCloud(points_1)])
-        self.point_clouds.append([PointCloud(points_2)])
-        self.point_clouds.append([PointCloud(points_3)])
+        self.point_clouds.append(PointCloud(points_1))
+        self.point_clouds.append(PointCloud(points_2))
+        self.point_clouds.append(PointCloud(points_3))
 
-        calibration_offset, pivot_point = pivot(self.point_clouds, 0)
+        calibration_offset, pivot_point = self.point_clouds[0].pivot(self.point_clouds)
 
         # Check if the calculated calibration offset and pivot point do not return nonsensical values
         np.testing.assert_array_less(np.abs(calibration_offset), 100, err_msg="Calibration offset should be within reasonable bounds")
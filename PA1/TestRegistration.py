@@ -1,6 +1,7 @@
 import unittest
 import numpy as np
-from FrameOperations import Frame, PointCloud
+from FrameOperations import Frame
+from PointCloud import PointCloud
 
 def generate_random_rotation():
     """ Generate a random 3x3 rotation matrix """
@@ -66,7 +67,8 @@ class TestRegistration(unittest.TestCase):
 
     def test_case_3_small_rotation_large_translation(self):
         """ Test a small rotation combined with large translation """
-        source_points = np.array([[1, 2, 3], [4, 5, 6], [6, 7, 8]]) 
+        # The source points (the array columns) must not be collinear, or any rotation about their line fits them
+        source_points = np.array([[1, 2, 3], [4, 5, 6], [6, 7, 10]]) 
         rotation_matrix = np.array([[0.9998477, -0.0174524, 0], [0.0174524, 0.9998477, 0], [0, 0, 1]]) 
         translation_vector = np.array([[100], [200], [300]])  
         target_points = rotation_matrix.dot(source_points) + translation_vector
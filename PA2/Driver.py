@@ -3,7 +3,8 @@ import calc_Bj as p4
 import distortion_correction as d
 import calc_Freg as p5
 import compute_tip_loc as p6
-import test
+import stage_cache
+import profiling
 
 
 def main():
@@ -20,26 +21,27 @@ def main():
     emfiducialss = None
     emnav = None
 
-    # Add 'test' command line option
+    # Add 'test' command line option; the tests are only imported here, so importing Driver does not load them
     if str(sys.argv[1]) == 'test':
-        if len(sys.argv) == 3:
+        import unit_testing as test
+        if len(sys.argv) >= 3:
             empivot = sys.argv[2]
         else:
             empivot = "PA12 - Student Data/pa2-debug-a-empivot.txt"
         if len(sys.argv) == 4:
             tolerance = float(sys.argv[3])
-            test.test_reg(tolerance)
+            test.test_register(tolerance)
             test.test_pivot_cal(empivot, tolerance)
-            test.test_normalization()
+            test.test_normalize()
             test.test_f()
-            test.test_solve_linear_sys(tolerance)
+            test.test_solve_fcu(tolerance)
 
         else:
-            test.test_reg()
+            test.test_register()
             test.test_pivot_cal(empivot)
-            test.test_normalization()
+            test.test_normalize()
             test.test_f()
-            test.test_solve_linear_sys()
+            test.test_solve_fcu()
 
         sys.exit(0)
 
@@ -60,11 +62,20 @@ def main():
 
     outname = sys.argv[1].split('/')[-1].rsplit('-', 1)[0] + '-output2.txt'
 
+    # Optional '--profile <file.json>' to record per-stage timings and memory
+    if '--profile' in sys.argv:
+        profiling.enable(sys.argv[sys.argv.index('--profile') + 1])
+
+    # Optional '--cache <dir>' to reuse stage results across runs
+    cache = None
+    if '--cache' in sys.argv:
+        cache = stage_cache.StageCache(sys.argv[sys.argv.index('--cache') + 1])
+
     # Run code for probelms 4 - 6 and save output
-    tofile(outname, calbody, calreadings, empivot, ctfiducials, emfiducialss, emnav)
+    tofile(outname, calbody, calreadings, empivot, ctfiducials, emfiducialss, emnav, cache)
 
 
-def tofile(outfile, calbody, calreadings, empivot, ctfiducials, emfiducialss, emnav):
+def tofile(outfile, calbody, calreadings, empivot, ctfiducials, emfiducialss, emnav, cache=None):
     """
     Runs methods for questions 4-6 and writes output file with solutions.
     :param outfile: File name/path for output file
@@ -76,6 +87,8 @@ def tofile(outfile, calbody, calreadings, empivot, ctfiducials, emfiducialss, em
                          relative to the EM tracker.
     :param emnav: The file name/path of the file with marker positions when the pointer is in an arbitrary position,
                   relative to the EM tracker.
+    :param cache: Optional cache of stage results. Stages whose input files and upstream results are unchanged are
+                  loaded from it instead of being recomputed.
 
     :type outfile: str
     :type calbody: str
@@ -84,25 +97,42 @@ def tofile(outfile, calbody, calreadings, empivot, ctfiducials, emfiducialss, em
     :type ctfiducials: str
     :type emfiducialss: str
     :type emnav: str
+    :type cache: stage_cache.StageCache
 
-    :return: None
+    :return: The pivot calibration (tip in pointer and EM tracker coordinates) and the CT tip positions written
+    :rtype: (tuple, PointCloud.PointCloud)
     """
-    p_ans, C, qmi, qma, qmis, qmas = d.distortion_calculation(calbody, calreadings, empivot)
-
-    Cs = p4.tip_in_EM(empivot, emfiducialss, p_ans[0], C, qmi, qma, qmis, qmas)
-
-    F = p5.find_freg(ctfiducials, Cs)
-
-    CT = p6.tip_pointer(empivot, emnav, p_ans[0], F, C, qmi, qma, qmis, qmas)
-
-    f = open(outfile, 'w')
-    h, t = os.path.split(outfile)
-    f.write('{0}, {1}\n'.format(CT.data.shape[1], t))
-    for i in range(CT.data.shape[1]):
-        f.write('{0:>10},{1:>10},{2:>10}\n'.format(format(CT.data[0][i], '.2f'),
-                                               format(CT.data[1][i], '.2f'),
-                                               format(CT.data[2][i], '.2f')))
-    f.close()
+    with profiling.stage('distortion'):
+        distortion, distortion_key = stage_cache.run(cache, 'distortion', d.distortion_calculation,
+                                                     (calbody, calreadings, empivot),
+                                                     files=(calbody, calreadings, empivot))
+    p_ans, C, qmi, qma, qmis, qmas = distortion
+
+    with profiling.stage('tip_in_EM'):
+        Cs, Cs_key = stage_cache.run(cache, 'tip_in_EM', p4.tip_in_EM,
+                                     (empivot, emfiducialss, p_ans[0], C, qmi, qma, qmis, qmas),
+                                     files=(empivot, emfiducialss), upstream=(distortion_key,))
+
+    with profiling.stage('freg'):
+        F, F_key = stage_cache.run(cache, 'freg', p5.find_freg, (ctfiducials, Cs),
+                                   files=(ctfiducials,), upstream=(Cs_key,))
+
+    with profiling.stage('tip_pointer'):
+        CT, _ = stage_cache.run(cache, 'tip_pointer', p6.tip_pointer,
+                                (empivot, emnav, p_ans[0], F, C, qmi, qma, qmis, qmas),
+                                files=(empivot, emnav), upstream=(distortion_key, F_key))
+
+    with profiling.stage('write'):
+        f = open(outfile, 'w')
+        h, t = os.path.split(outfile)
+        f.write('{0}, {1}\n'.format(CT.data.shape[1], t))
+        for i in range(CT.data.shape[1]):
+            f.write('{0:>10},{1:>10},{2:>10}\n'.format(format(CT.data[0][i], '.2f'),
+                                                   format(CT.data[1][i], '.2f'),
+                                                   format(CT.data[2][i], '.2f')))
+        f.close()
+
+    return p_ans, CT
 
 
 if __name__ == '__main__':
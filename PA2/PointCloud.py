@@ -1,41 +1,45 @@
+import sys, os
 import numpy as np
 import scipy.linalg as scialg
-import pandas as pd
 import Frame_Transformation
+import profiling
+import registration
 
+# PointCloud is shared with PA1 and PA3 through the geometry package at the repository root
+import repo_paths
+from geometry import PointCloud
 
-class PointCloud:
+
+class RegistrationTemplate:
     """
-    Class representing a point cloud. Consists of a numpy array of column vectors representing each point in the
-    cloud, and pertinent methods for frame transformations, file IO, etc.
+    A fixed model point cloud (a calibration body, a pivot reference, ...) that many frames are registered against.
+    The model's centroid and demeaned coordinates are computed once, and because the demeaned model sums to zero
+    the targets never need to be demeaned: the cross-covariance is taken with the raw target points and only the
+    target centroid is needed for the translation.
     """
-    def __init__(self, data=None):
+    def __init__(self, source, backend='arun'):
         """
-        Initializes the point cloud, either empty or with the data provided
-        :param data: Numpy array of column vectors, with each column representing each point in the point cloud
-        :type data: numpy.array([numpy.float64][]), M x N (usually 3 x N)
+        :param source: Numpy array of column vectors for the model cloud, or a PointCloud
+        :param backend: Batch registration backend (see registration.BACKENDS), or 'auto' to pick the fastest
+                        accurate backend for the batch size by registration.select_backend
+        :type source: numpy.array, 3 x N
+        :type backend: str
         """
-        self.data = data
-
-    def register(self, target_cloud):
+        self.backend = backend
+        if isinstance(source, PointCloud):
+            source = source.data
+        self.data = np.asarray(source, dtype=np.float64)
+        self.centroid = np.mean(self.data, axis=1, keepdims=True)
+        self.demeaned = self.data - self.centroid
+
+    def rotation(self, cross_covariance):
         """
-        Performs rigid-body registration with respect to another point cloud target_cloud, and returns the corresponding frame
-        transformation.
-        :param target_cloud: The point cloud being mapped to
-        :type target_cloud: PointCloud
+        Rotation maximizing the alignment for a cross-covariance matrix, with the SVD method of PointCloud.register.
+        :param cross_covariance: Cross-covariance of the demeaned model with a target, 3 x 3
 
-        :return: The Frame transformation F = [rot_matrix, trans_vector] from current frame to target_cloud
-        :rtype: Frame.Frame
+        :return: The rotation matrix
+        :rtype: numpy.array, 3 x 3
         """
-        # Calculate centroids of self and target clouds
-        centroid_self = np.mean(self.data, axis=1, keepdims=True)
-        centroid_target = np.mean(target_cloud.data, axis=1, keepdims=True)
-
-        demeaned_self = self.data - centroid_self
-        demeaned_target = target_cloud.data - centroid_target
-
-        # Compute cross-covariance matrix and solve for rotation using SVD
-        cross_covariance = demeaned_self.dot(demeaned_target.T)
         u_mat, singular_vals, v_t_mat = scialg.svd(cross_covariance)
 
         u_mat = u_mat.T
@@ -44,40 +48,179 @@ class PointCloud:
         reflection_adjustment = np.identity(v_t_mat.shape[1])
         reflection_adjustment[-1, -1] = scialg.det(v_t_mat.dot(u_mat))
 
-        rot_matrix = v_t_mat.dot(reflection_adjustment.dot(u_mat))
-        
-        trans_vector = centroid_target - rot_matrix.dot(centroid_self)
+        return v_t_mat.dot(reflection_adjustment.dot(u_mat))
+
+    def register(self, target_cloud):
+        """
+        Registers the model to one target cloud.
+        :param target_cloud: The point cloud being mapped to, or its data
+        :type target_cloud: PointCloud
 
+        :return: The Frame transformation F = [rot_matrix, trans_vector] from the model to target_cloud
+        :rtype: Frame.Frame
+        """
+        target = target_cloud.data if isinstance(target_cloud, PointCloud) else target_cloud
+        rot_matrix = self.rotation(self.demeaned.dot(target.T))
+        trans_vector = np.mean(target, axis=1, keepdims=True) - rot_matrix.dot(self.centroid)
         return Frame_Transformation.Frame(rot_matrix, trans_vector)
 
-    def transform(self, frame_transformation):
+    def register_batch(self, targets):
         """
-        Evaluate a frame transformation applied to the current point cloud.
-        :param frame_transformation: The Frame transformation frame_transformation = [rot_matrix, trans_vector] to transform with
-        :type frame_transformation: Frame.Frame
+        Registers the model to a stack of target clouds at once with the template's backend, every frame's solve
+        done as a single array operation.
+        :param targets: Stack of target clouds, one per frame, each laid out like PointCloud.data
+        :type targets: numpy.array, F x 3 x N
 
-        :return: The resulting point cloud
-        :rtype: PointCloud
+        :return: The rotation matrices and translation vectors mapping the model onto each target
+        :rtype: (numpy.array F x 3 x 3, numpy.array F x 3 x 1)
         """
-        transformed_points = frame_transformation.rotation.dot(self.data) + frame_transformation.translation
-        return PointCloud(transformed_points)
+        targets = np.asarray(targets, dtype=np.float64)
+        backend = self.backend
+        if backend == 'auto':
+            backend = registration.select_backend(self.data.shape[1], targets.shape[0])
+
+        rot_matrices = registration.BACKENDS[backend](self.demeaned, targets)
+        trans_vectors = np.mean(targets, axis=2, keepdims=True) - rot_matrices @ self.centroid
+
+        return rot_matrices, trans_vectors
 
-    def add(self, new_cloud):
+
+def register_batch(source, targets):
+    """
+    Registers one source point cloud to a stack of target point clouds at once, using the same SVD method as
+    PointCloud.register. Callers registering against the same source repeatedly should keep a RegistrationTemplate.
+    :param source: Numpy array of column vectors for the source cloud, 3 x N
+    :param targets: Stack of target clouds, one per frame, each laid out like PointCloud.data
+    :type source: numpy.array, 3 x N
+    :type targets: numpy.array, F x 3 x N
+
+    :return: The rotation matrices and translation vectors mapping source onto each target
+    :rtype: (numpy.array F x 3 x 3, numpy.array F x 3 x 1)
+    """
+    return RegistrationTemplate(source).register_batch(targets)
+
+
+class PointBuffer:
+    """
+    Growable buffer of column vectors for collecting per-frame results. Unlike PointCloud.add, which copies every
+    point collected so far on each call, the buffer doubles its storage when it runs out of room, so appending is
+    amortized O(1). If the number of points is known in advance, pass it as the capacity to avoid regrowing at all.
+    """
+    def __init__(self, capacity=16, dim=3):
         """
-        Adds the data in the PointCloud new_cloud to the current PointCloud, and outputs their union.
+        Initializes an empty buffer.
+        :param capacity: Number of points to preallocate room for
+        :param dim: Dimension of each point (usually 3)
+
+        :type capacity: int
+        :type dim: int
+        """
+        self.storage = np.empty((dim, max(capacity, 1)))
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, points):
+        """
+        Appends points after the ones already in the buffer.
+        :param points: The points to append
+        :type points: PointCloud or numpy.array of column vectors, M x N
+
+        :return: None
+        """
+        if isinstance(points, PointCloud):
+            points = points.data
+        count = np.shape(points)[1]
+
+        if self.size + count > self.storage.shape[1]:
+            grown = np.empty((self.storage.shape[0], max(2 * self.storage.shape[1], self.size + count)))
+            grown[:, :self.size] = self.storage[:, :self.size]
+            self.storage = grown
 
-        :param new_cloud: The PointCloud to add
-        :type new_cloud: PointCloud
+        self.storage[:, self.size:self.size + count] = points
+        self.size += count
 
-        :return: The union of the two PointClouds, with the data from new_cloud after the data of the original
+    @property
+    def data(self):
+        """
+        The points appended so far, as a view into the buffer's storage.
+        :rtype: numpy.array, M x size
+        """
+        return self.storage[:, :self.size]
+
+    def to_cloud(self):
+        """
+        :return: A PointCloud of the points appended so far
         :rtype: PointCloud
         """
-        combined_cloud = PointCloud()
-        if self.data is None:
-            combined_cloud.data = new_cloud.data
-        else:
-            combined_cloud = PointCloud(np.concatenate((self.data, new_cloud.data), axis=1))
-        return combined_cloud
+        return PointCloud(self.data)
+
+
+# Parsed data files, keyed by absolute path; each entry also records the file's mtime so edits are picked up
+_frame_cache = {}
+
+# Files holding a single frame; every other file type has its frame count as the last header number
+_single_frame_keys = ('calbody', 'fiducials')
+
+
+def parse_header(line):
+    """
+    Parse the first line of a tracker data file.
+    :param line: The header line, e.g. "8, 8, 27, 125, pa2-debug-a-calreadings.txt"
+    :type line: str
+
+    :return: The file type key (e.g. 'calreadings'), the number of points in each marker group and the number of frames
+    :rtype: (str, [int], int)
+    """
+    fields = [field.strip() for field in line.split(',')]
+    file_key = fields[-1].split('.')[0].split('-')[-1]
+    counts = [int(field) for field in fields[:-1]]
+
+    if file_key in _single_frame_keys:
+        return file_key, counts, 1
+    return file_key, counts[:-1], counts[-1]
+
+
+def read_frames(filepath):
+    """
+    Read a tracker data file into a single array of frames. Results are cached per path and modification time, so
+    loading the same unchanged file again is free. The returned array is read-only since it is shared between callers.
+    :param filepath: The file path to the input data.
+    :type filepath: str
+
+    :return: An array of shape (nframes, npoints, 3) holding every point of every frame, and the offsets of each marker
+             group within a frame, so that group i of frame f is frames[f, offsets[i]:offsets[i + 1]]
+    :rtype: (numpy.array, [int])
+    """
+    path = os.path.abspath(filepath)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _frame_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1], cached[2]
+
+    with profiling.stage('parse'), open(path) as f:
+        file_key, group_sizes, nframes = parse_header(f.readline())
+        values = np.array(f.read().replace(',', ' ').split(), dtype=np.float64)
+
+    offsets = [0]
+    for size in group_sizes:
+        offsets.append(offsets[-1] + size)
+
+    npoints = offsets[-1]
+    frames = values[:nframes * npoints * 3].reshape((nframes, npoints, 3))
+    frames.flags.writeable = False
+
+    _frame_cache[path] = (mtime, frames, offsets)
+    return frames, offsets
+
+
+def clear_cache():
+    """
+    Drop every parsed file from the read_frames cache.
+    :return: None
+    """
+    _frame_cache.clear()
 
 
 def inp_file(filepath):
@@ -91,37 +234,10 @@ def inp_file(filepath):
 
     :rtype: [PointCloud][]
     """
+    frames, offsets = read_frames(filepath)
 
-    header_data = pd.read_csv(filepath, header=None, nrows=1)
-    file_key = header_data.values[0, header_data.shape[1] - 1].split('.')[0].split('-')[-1]
-
-    frame_counts = {'calbody': 1, 'calreadings': header_data.values[0, -2], 'empivot': header_data.values[0, -2],
-                    'optpivot': header_data.values[0, -2], 'output1': header_data.values[0, -2], 'fiducials': 1,
-                    'fiducialss': header_data.values[0, -2], 'nav': header_data.values[0, -2], 'output2': header_data.values[0, -2]}
-
-    point_data = pd.read_csv(filepath, header=None, names=['x', 'y', 'z'], skiprows=1)
-
-    initialize = True
     all_frames = []
-    column_indices = None
-    single_frame_size = None
-
-    for frame_index in range(frame_counts[file_key]):
-        if initialize:
-            initialize = False
-            column_indices = [0]
-            offset = 0 if frame_counts[file_key] == 1 else 1
-            for col_index in range(header_data.shape[1] - 1 - offset):
-                column_indices.append(column_indices[col_index] + header_data.values[0, col_index])
-
-            single_frame_size = column_indices[-1]
-
-        frame_cloud_list = []
-        for cloud_index in range(len(column_indices) - 1):
-            frame_cloud_list.append(PointCloud(
-                point_data.values[column_indices[cloud_index] + single_frame_size * frame_index:
-                                  column_indices[cloud_index + 1] + single_frame_size * frame_index, :].T))
-
-        all_frames.append(frame_cloud_list)
+    for frame in frames:
+        all_frames.append([PointCloud(frame[offsets[i]:offsets[i + 1]].T) for i in range(len(offsets) - 1)])
 
     return all_frames
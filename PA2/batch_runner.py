@@ -0,0 +1,127 @@
+import sys, os
+import argparse
+import glob
+import json
+import time
+import traceback
+import concurrent.futures
+import Driver
+
+# File suffixes making up one dataset, in the order Driver.tofile takes them
+DATASET_FILES = ('calbody', 'calreadings', 'empivot', 'ct-fiducials', 'em-fiducialss', 'EM-nav')
+
+
+def find_datasets(directory):
+    """
+    Finds every dataset prefix in a directory, e.g. 'pa2-debug-a' ... 'pa2-unknown-k'.
+    :param directory: Directory containing the data files
+    :type directory: str
+
+    :return: Sorted dataset prefixes, one per calbody file found
+    :rtype: [str]
+    """
+    suffix = '-calbody.txt'
+    return sorted(os.path.basename(path)[:-len(suffix)] for path in glob.glob(os.path.join(directory, '*' + suffix)))
+
+
+def run_dataset(directory, prefix, outdir):
+    """
+    Runs the full pipeline for one dataset and writes its output2 file. Any error is caught and reported in the
+    result, so one bad dataset does not stop the others.
+    :param directory: Directory containing the data files
+    :param prefix: Dataset prefix, e.g. 'pa2-debug-a'
+    :param outdir: Directory to write the output file to
+
+    :return: Summary of the run: prefix, status ('ok' or 'failed'), elapsed seconds, output path and error message
+    :rtype: dict
+    """
+    start = time.perf_counter()
+    result = {'prefix': prefix, 'status': 'ok', 'output': None, 'error': None}
+    try:
+        files = [os.path.join(directory, '{0}-{1}.txt'.format(prefix, name)) for name in DATASET_FILES]
+        missing = [path for path in files if not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError('missing ' + ', '.join(os.path.basename(path) for path in missing))
+
+        outfile = os.path.join(outdir, prefix + '-output2.txt')
+        Driver.tofile(outfile, *files)
+        result['output'] = outfile
+    except Exception:
+        result['status'] = 'failed'
+        result['error'] = traceback.format_exc(limit=3)
+    result['elapsed'] = time.perf_counter() - start
+    return result
+
+
+def run_all(directory, outdir, workers=None):
+    """
+    Runs every dataset in a directory across a process pool.
+    :param directory: Directory containing the data files
+    :param outdir: Directory to write the output files to
+    :param workers: Number of worker processes (default: one per CPU)
+
+    :return: One summary per dataset, in prefix order
+    :rtype: [dict]
+    """
+    os.makedirs(outdir, exist_ok=True)
+    prefixes = find_datasets(directory)
+    results = {}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_dataset, directory, prefix, outdir): prefix for prefix in prefixes}
+        for future in concurrent.futures.as_completed(futures):
+            prefix = futures[future]
+            try:
+                results[prefix] = future.result()
+            except Exception as e:
+                # The worker process itself died (e.g. out of memory)
+                results[prefix] = {'prefix': prefix, 'status': 'failed', 'output': None, 'error': repr(e),
+                                   'elapsed': None}
+
+    return [results[prefix] for prefix in prefixes]
+
+
+def report(results):
+    """
+    Formats a summary table of a batch run.
+    :param results: Output of run_all
+    :type results: [dict]
+
+    :return: The report text
+    :rtype: str
+    """
+    lines = ['{0:<20}{1:<8}{2:>10}'.format('dataset', 'status', 'time (s)')]
+    for result in results:
+        elapsed = '-' if result['elapsed'] is None else format(result['elapsed'], '.2f')
+        lines.append('{0:<20}{1:<8}{2:>10}'.format(result['prefix'], result['status'], elapsed))
+    failed = [result for result in results if result['status'] != 'ok']
+    lines.append('{0} datasets, {1} failed'.format(len(results), len(failed)))
+    for result in failed:
+        lines.append('\n{0}:\n{1}'.format(result['prefix'], result['error']))
+    return '\n'.join(lines)
+
+
+def main():
+    """
+    Command line entry point, e.g.
+        python batch_runner.py "PA12 - Student Data" --outdir output --workers 4 --json summary.json
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Run the pipeline for every dataset in a directory')
+    parser.add_argument('directory')
+    parser.add_argument('--outdir', default='output')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--json', help='also write the summary to this JSON file')
+    args = parser.parse_args()
+
+    results = run_all(args.directory, args.outdir, args.workers)
+    print(report(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    sys.exit(0 if all(result['status'] == 'ok' for result in results) else 1)
+
+
+if __name__ == '__main__':
+    main()
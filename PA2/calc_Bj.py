@@ -1,6 +1,7 @@
 import numpy as np
 import PointCloud as pc
 import distortion_correction as d
+import profiling
 
 def tip_in_EM(empivot_path, emfiducials_path, pointer_tip, deformation_coeffs, min_input, max_input, min_output, max_output):
     """
@@ -25,14 +26,16 @@ def tip_in_EM(empivot_path, emfiducials_path, pointer_tip, deformation_coeffs, m
     # Calculate the mean of the original pivot data for normalization
     pivot_mean = np.mean(pivot_data[0][0].data, axis=0, keepdims=True)
     normalizationd_pivot_data = pivot_data[0][0].data - pivot_mean
+    pivot_template = pc.RegistrationTemplate(normalizationd_pivot_data)
 
     # Prepare to accumulate transformed point clouds
-    tip_locations = pc.PointCloud()
+    tip_locations = pc.PointBuffer(len(fiducial_data))
 
     # Transform the pointer tip location using each frame's registration
-    for fiducial_frame in fiducial_data:
-        registration = pc.PointCloud(normalizationd_pivot_data).register(fiducial_frame[0])
-        transformed_tip = pc.PointCloud(pointer_tip.reshape((3, 1))).transform(registration)
-        tip_locations = tip_locations.add(transformed_tip)
+    with profiling.stage('tip_transform'):
+        for fiducial_frame in fiducial_data:
+            registration = pivot_template.register(fiducial_frame[0])
+            transformed_tip = pc.PointCloud(pointer_tip.reshape((3, 1))).transform(registration)
+            tip_locations.append(transformed_tip)
 
-    return tip_locations
+    return tip_locations.to_cloud()
@@ -15,14 +15,18 @@ def c_expected(calbody, calreading):
     tracker_data = pc.inp_file(calreading)
     object_data = pc.inp_file(calbody)
 
+    # The calibration body is the same in every frame, so its centroid and demeaned markers are computed once
+    template_d = pc.RegistrationTemplate(object_data[0][0])
+    template_a = pc.RegistrationTemplate(object_data[0][1])
+
     # List to store the computed expected marker positions
     expected_positions = []
 
     # Iterate over each frame of tracker data
     for tracker_frame in tracker_data:
         # Register frames from object data to corresponding tracker frames
-        frame_registration_d = object_data[0][0].register(tracker_frame[0])
-        frame_registration_a = object_data[0][1].register(tracker_frame[1])
+        frame_registration_d = template_d.register(tracker_frame[0])
+        frame_registration_a = template_a.register(tracker_frame[1])
 
         # Compute the transformation required to map object data to tracker frame
         transformation = frame_registration_d.inv.compose(frame_registration_a)
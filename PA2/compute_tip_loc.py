@@ -1,6 +1,8 @@
 import numpy as np
 import PointCloud as pc
+import Frame_Transformation
 import distortion_correction as d
+import profiling
 
 def tip_pointer(empivot, emnav, ptip, F_reg, coeffs, q_min, q_max, q_star_min, q_star_max):
     """
@@ -29,19 +31,15 @@ def tip_pointer(empivot, emnav, ptip, F_reg, coeffs, q_min, q_max, q_star_min, q
     
     # normalization the pivot data by subtracting the centroid
     normalizationd_pivot = correctioned_pivot_data[0][0].data - reference_point
+    pivot_template = pc.RegistrationTemplate(normalizationd_pivot)
 
-    # Initialize a PointCloud object to accumulate results
-    accumulated_pointcloud = pc.PointCloud()
+    # Process every frame of correctioned navigation data at once
+    with profiling.stage('tip_transform'):
+        # Register the normalizationd pivot data to each navigation frame
+        nav_markers = np.stack([nav_frame[0].data for nav_frame in correctioned_nav_data])
+        registrations = Frame_Transformation.FrameBatch(*pivot_template.register_batch(nav_markers))
 
-    # Process each frame of correctioned navigation data
-    for nav_frame in correctioned_nav_data:
-        # Register the normalizationd pivot data to the current navigation frame
-        transformation = pc.PointCloud(normalizationd_pivot).register(nav_frame[0])
-        
-        # Transform the pointer tip using the computed transformation and additional registration
-        transformed_tip = pc.PointCloud(ptip.reshape((3, 1))).transform(transformation).transform(F_reg)
-        
-        # Add the transformed tip to the accumulated results
-        accumulated_pointcloud = accumulated_pointcloud.add(transformed_tip)
+        # Collapse the registration and F_reg into one homogeneous matrix per frame, so the tip is transformed once
+        tips = Frame_Transformation.collapse(F_reg, registrations).apply(ptip.reshape(3))
 
-    return accumulated_pointcloud
+    return pc.PointCloud(tips.T)
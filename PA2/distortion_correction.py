@@ -1,6 +1,7 @@
 import PointCloud as pc
 import pivot_calibration as piv
 import calc_expected_Ci as p1
+import profiling
 import numpy as np
 from scipy.special import comb
 import math
@@ -26,38 +27,28 @@ def distortion_calculation(calbody, calreading, empivot):
     c = [frame[2] for frame in tracker_frames]
     
     # Get calculated expected calibration points
-    c_exp = p1.c_expected(calbody, calreading)
+    with profiling.stage('c_expected'):
+        c_exp = p1.c_expected(calbody, calreading)
     
-    # Define points per frame and total frame count
-    pPerFrame = np.shape(c[0].data)[1]    
-    nFrames = len(c)
-    
-    # Initialize concatenated data arrays for both current and expected calibration data
-    concatc = c[0].data
-    concatc_exp = c_exp[0].data
-    for i in range(1, nFrames):
-        # Concatenate data across all frames for streamlined calculations
-        concatc = np.concatenate((concatc, c[i].data), axis=1)
-        concatc_exp = np.concatenate((concatc_exp, c_exp[i].data), axis=1)
-    
-    # Identify min and max ranges for coordinates in experimental and expected datasets
-    q_min, q_max, q_star_min, q_star_max = calc_q(concatc, concatc_exp)
-    
-    # normalization data points to fall within 0-1 range, based on reference dataset bounds
-    u_s_star = normalization(pPerFrame * nFrames, concatc_exp, q_star_min, q_star_max)
-    u_s = normalization(pPerFrame * nFrames, concatc, q_min, q_max)
-    
-    # Construct the matrix of calc_berstein polynomials for scaled experimental data
-    F_mat = normalized_matrix(u_s, 5)
-    
-    # Solve for the distortion correctionion coefficients using least squares
-    coeff_mat = solve_linear_sys(F_mat, u_s_star)
+    with profiling.stage('distortion_fit'):
+        # Identify min and max ranges for coordinates in experimental and expected datasets, stacking every frame once
+        q_min, q_max, q_star_min, q_star_max = calc_q(np.concatenate([frame.data for frame in c], axis=1),
+                                                      np.concatenate([frame.data for frame in c_exp], axis=1))
+
+        # Fold each frame into the least squares fit instead of building the full calc_berstein matrix
+        fitter = DistortionFitter(q_min, q_max, q_star_min, q_star_max, 5)
+        for c_frame, c_exp_frame in zip(c, c_exp):
+            fitter.add_frame(c_frame.data, c_exp_frame.data)
+
+        # Solve for the distortion correctionion coefficients using least squares
+        coeff_mat = fitter.solve()
     
     # Apply correctionion to the EM pivot positions, using the calculated coefficients
     EMcorrection = correction(empivot, coeff_mat, q_min, q_max, q_star_min, q_star_max)
     
     # Generate the final correctioned pivot calibration
-    pivotanswer = piv.pivot(EMcorrection, 0)
+    with profiling.stage('pivot'):
+        pivotanswer = piv.pivot(EMcorrection, 0)
     
     return pivotanswer, coeff_mat, q_min, q_max, q_star_min, q_star_max
 
@@ -84,23 +75,33 @@ def correction(inputs, coeffs, q_min, q_max, q_star_min, q_star_max):
     for p in range(len(inputcloud)):
         outputcloud.append(inputcloud[p])
     
-    # Get number of points per frame
-    points = np.shape(inputcloud[0][0].data)[1]
-    
     # Adjust each input point cloud using the distortion correctionion matrix
-    for k in range(len(inputcloud)):
-        outputcloud[k][0].data = normalized_matrix(normalization(points, inputcloud[k][0].data, q_min, q_max), 5).dot(coeffs)
-        for i in range(points):
-            for j in range(3):
-                # Scale correctioned points back to original range based on reference dataset bounds
-                outputcloud[k][0].data[i, j] = (outputcloud[k][0].data[i, j]) * (q_star_max[j] - q_star_min[j]) + q_star_min[j]
-
-        # Transpose data for consistency in format
-        outputcloud[k][0].data = outputcloud[k][0].data.T
+    with profiling.stage('correction'):
+        for k in range(len(inputcloud)):
+            outputcloud[k][0].data = correct_points(inputcloud[k][0].data, coeffs, q_min, q_max, q_star_min, q_star_max)
 
     return outputcloud
 
 
+def correct_points(points, coeffs, q_min, q_max, q_star_min, q_star_max):
+    """
+    Applies distortion correctionion to an array of points.
+
+    :param points: Points to correction, 3 x N
+    :param coeffs: Matrix containing distortion correctionion coefficients
+    :param q_min: Minimum coordinate values in the original data
+    :param q_max: Maximum coordinate values in the original data
+    :param q_star_min: Minimum coordinate values in the reference data
+    :param q_star_max: Maximum coordinate values in the reference data
+
+    :return: Correctioned points, 3 x N
+    """
+    corrected = normalized_matrix(normalization(np.shape(points)[1], points, q_min, q_max), 5).dot(coeffs)
+
+    # Scale correctioned points back to original range based on reference dataset bounds
+    return (corrected * (q_star_max - q_star_min) + q_star_min).T
+
+
 def normalization(pPerFrame, c, q_min, q_max):
     """
     Scales data to a normalizationd range between 0 and 1.
@@ -113,13 +114,8 @@ def normalization(pPerFrame, c, q_min, q_max):
     :return: u_s: normalizationd data matrix
     """
     
-    # Initialize normalizationd data array
-    u_s = np.zeros([pPerFrame, 3])
-
     # Scale each data point between q_min and q_max for uniformity
-    for k in range(pPerFrame):
-        for i in range(3):
-            u_s[k][i] = (c[i][k] - q_min[i]) / (q_max[i] - q_min[i])
+    u_s = (np.asarray(c)[:, :pPerFrame].T - q_min) / (q_max - q_min)
 
     return u_s
 
@@ -135,11 +131,92 @@ def solve_linear_sys(F, U):
     """
     
     # Solve using least-squares to estimate the coefficient matrix for data correctionion
-    C = np.linalg.lstsq(F, U)
+    C = np.linalg.lstsq(F, U, rcond=None)
 
     return C[0]
 
 
+class DistortionFitter:
+    """
+    Fits the distortion correctionion coefficients incrementally, one calibration frame at a time.
+
+    Instead of stacking the calc_berstein matrix F for every frame and solving F C = U at the end, the fitter keeps
+    only the triangular factor of a running QR factorization of [F | U]. New frames are buffered until they add up to
+    block_rows rows and are then folded in by refactoring that (small) triangle stacked on top of them, so memory
+    stays constant in the number of frames and the model can be re-solved whenever new calibration frames arrive.
+
+    The normalization bounds have to be fixed up front (e.g. from calc_q or a previous calibration), since the
+    polynomial basis depends on them.
+    """
+    def __init__(self, q_min, q_max, q_star_min, q_star_max, deg=5, block_rows=1024):
+        """
+        :param q_min, q_max: Min and max values per axis used to normalization the measured data
+        :param q_star_min, q_star_max: Min and max values per axis used to normalization the expected data
+        :param deg: Polynomial degree
+        :param block_rows: Number of buffered rows that triggers a QR update
+        """
+        self.q_min = q_min
+        self.q_max = q_max
+        self.q_star_min = q_star_min
+        self.q_star_max = q_star_max
+        self.deg = deg
+        self.n_coeffs = int(math.pow(deg + 1, 3))
+        self.n_points = 0
+
+        # Upper triangular factor R of [F | U]; its top-right block holds Q^T U
+        self.r_aug = None
+        self.block_rows = block_rows
+        self.pending = []
+        self.n_pending = 0
+
+    def add_frame(self, c, c_exp):
+        """
+        Adds the measured and expected positions of one calibration frame to the fit.
+
+        :param c: Measured EM marker positions, 3 x N
+        :param c_exp: Expected EM marker positions, 3 x N
+
+        :return: None
+        """
+        n_points = np.shape(c)[1]
+        F = normalized_matrix(normalization(n_points, c, self.q_min, self.q_max), self.deg)
+        U = normalization(n_points, c_exp, self.q_star_min, self.q_star_max)
+
+        self.pending.append(np.hstack((F, U)))
+        self.n_pending += n_points
+        self.n_points += n_points
+        if self.n_pending >= self.block_rows:
+            self.flush()
+
+    def flush(self):
+        """
+        Folds the buffered rows into the QR factorization.
+
+        :return: None
+        """
+        if not self.pending:
+            return
+        blocks = self.pending if self.r_aug is None else [self.r_aug] + self.pending
+        self.r_aug = np.linalg.qr(np.vstack(blocks), mode='r')
+        self.pending = []
+        self.n_pending = 0
+
+    def solve(self):
+        """
+        Solves for the distortion coefficients from the frames added so far.
+
+        :return: C: Matrix of computed distortion coefficients
+        """
+        self.flush()
+        if self.r_aug is None:
+            raise ValueError("No calibration frames have been added to the fit")
+
+        # min ||F C - U|| has the same solution as min ||R C - Q^T U||
+        R = self.r_aug[:self.n_coeffs, :self.n_coeffs]
+        QtU = self.r_aug[:self.n_coeffs, self.n_coeffs:]
+        return solve_linear_sys(R, QtU)
+
+
 def calc_q(c, c_exp):
     """
     Determines the range (min and max) of each axis in experimental and reference datasets.
@@ -204,18 +281,13 @@ def normalized_matrix(u, deg):
     :return: f_mat: Matrix of polynomial values for data distortion correctionion
     """
     
-    # Total points in normalizationd dataset
-    nPoints = np.shape(u)[0]
-
-    # Initialize matrix to hold polynomial values
-    f_mat = np.zeros([nPoints, int(math.pow(deg + 1, 3))])
-
-    # Populate the matrix with polynomial terms for each data point
-    for n in range(nPoints):
-        c = 0
-        for i in range(deg + 1):
-            for j in range(deg + 1):
-                for k in range(deg + 1):
-                    f_mat[n][c] = f_ijk(deg, i, j, k, u[n][0], u[n][1], u[n][2]) ; c += 1
+    # calc_berstein polynomial of every degree k evaluated at every coordinate, shape (points, 3, deg + 1)
+    u = np.asarray(u, dtype=np.float64)[:, :, np.newaxis]
+    k = np.arange(deg + 1)
+    binomials = np.array([comb(deg, i, exact=True) for i in k], dtype=np.float64)
+    B = binomials * np.power(1 - u, deg - k) * np.power(u, k)
+
+    # Column (i, j, k) holds B_i(u_x) * B_j(u_y) * B_k(u_z), in the same order as f_ijk was looped over
+    f_mat = np.einsum('ni,nj,nk->nijk', B[:, 0], B[:, 1], B[:, 2]).reshape((u.shape[0], -1))
 
     return f_mat
@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+import PointCloud as pc
+import Frame_Transformation
+import distortion_correction as d
+import calc_Bj as p4
+import calc_Freg as p5
+
+
+class NavigationModel:
+    """
+    Everything needed to locate the pointer tip in CT coordinates from a single frame of EM marker positions: the
+    distortion correctionion fit, the pointer's marker geometry, the pivot calibrated tip and the registration F_reg.
+    """
+    def __init__(self, coeffs, q_min, q_max, q_star_min, q_star_max, reference, pointer_tip, F_reg):
+        """
+        :param coeffs: Distortion correctionion coefficients (Output of distortion.distortion_calculation)
+        :param q_min, q_max: Input bounds for distortion correctionion (Output of distortion.distortion_calculation)
+        :param q_star_min, q_star_max: Output bounds for distortion correctionion (Output of distortion.distortion_calculation)
+        :param reference: Pointer marker positions in pointer coordinates, 3 x N
+        :param pointer_tip: The tip of the pointer in pointer coordinates (Output of pivot_calibration.pivot)
+        :param F_reg: Frame transformation from EM tracker coordinates to CT coordinates (Output of calc_Freg.find_freg)
+        """
+        self.coeffs = coeffs
+        self.q_min = q_min
+        self.q_max = q_max
+        self.q_star_min = q_star_min
+        self.q_star_max = q_star_max
+        self.reference = reference
+        self.template = pc.RegistrationTemplate(reference)
+        self.pointer_tip = np.reshape(pointer_tip, (3, 1))
+        self.F_reg = F_reg
+
+    @classmethod
+    def fit(cls, calbody, calreadings, empivot, ctfiducials, emfiducialss):
+        """
+        Runs the calibration stages of Driver.tofile and keeps their results.
+        :param calbody: File name/path for the calibration object data file
+        :param calreadings: File name/path for the readings from the trackers
+        :param empivot: File name/path for EM pivot poses
+        :param ctfiducials: File name/path of the fiducial pin positions in the CT frame
+        :param emfiducialss: File name/path of the marker positions with the pointer on the fiducials
+
+        :return: The fitted navigation model
+        :rtype: NavigationModel
+        """
+        p_ans, C, qmi, qma, qmis, qmas = d.distortion_calculation(calbody, calreadings, empivot)
+        Cs = p4.tip_in_EM(empivot, emfiducialss, p_ans[0], C, qmi, qma, qmis, qmas)
+        F = p5.find_freg(ctfiducials, Cs)
+
+        # Pointer geometry taken from the first correctioned pivot frame, centred the same way as in tip_pointer
+        pivot_frame = d.correction(empivot, C, qmi, qma, qmis, qmas)[0][0].data
+        reference = pivot_frame - np.mean(pivot_frame, axis=0, keepdims=True)
+
+        return cls(C, qmi, qma, qmis, qmas, reference, p_ans[0], F)
+
+    def save(self, path):
+        """
+        Saves the model to a .npz file.
+        :param path: File name/path to save to
+        :type path: str
+
+        :return: None
+        """
+        np.savez(path, coeffs=self.coeffs, q_min=self.q_min, q_max=self.q_max, q_star_min=self.q_star_min,
+                 q_star_max=self.q_star_max, reference=self.reference, pointer_tip=self.pointer_tip,
+                 freg_rotation=self.F_reg.rotation, freg_translation=self.F_reg.translation)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a model written by save.
+        :param path: File name/path of the .npz file
+        :type path: str
+
+        :rtype: NavigationModel
+        """
+        with np.load(path) as f:
+            F_reg = Frame_Transformation.Frame(f['freg_rotation'], f['freg_translation'])
+            return cls(f['coeffs'], f['q_min'], f['q_max'], f['q_star_min'], f['q_star_max'], f['reference'],
+                       f['pointer_tip'], F_reg)
+
+    def locate(self, markers):
+        """
+        Computes the CT position of the pointer tip for one frame: distortion correctionion, registration of the pointer
+        markers and the F_reg transform.
+        :param markers: EM marker positions of the pointer for the frame, 3 x N
+        :type markers: numpy.array
+
+        :return: The pointer tip in CT coordinates
+        :rtype: numpy.array of shape (3,)
+        """
+        corrected = d.correct_points(markers, self.coeffs, self.q_min, self.q_max, self.q_star_min, self.q_star_max)
+        rotations, translations = self.template.register_batch(corrected[np.newaxis])
+        tip = rotations[0].dot(self.pointer_tip) + translations[0]
+        return (self.F_reg.rotation.dot(tip) + self.F_reg.translation).ravel()
+
+
+class NavigationService:
+    """
+    Asyncio service that reads EM frames from a stream and answers with the CT tip position for each one.
+
+    The protocol is one JSON object per line. Clients send {"seq": n, "markers": [[x, y, z], ...]} and receive
+    {"seq": n, "tip": [x, y, z], "received": t0, "done": t1} where t0 and t1 are wall-clock timestamps. A line that is
+    not valid JSON, or a frame the tip cannot be located from, is answered with {"seq": n, "error": message} and the
+    service carries on with the next frame. Frames wait in
+    a bounded queue between the reader and the solver. When it is full the service either stops reading (so the
+    transport pushes back on the sender) or, with drop_stale, discards the oldest queued frame and answers it with
+    {"seq": n, "dropped": true}, keeping the reported positions current.
+    """
+    def __init__(self, model, queue_size=64, drop_stale=False):
+        """
+        :param model: The model used to locate the tip
+        :param queue_size: Number of frames that may wait to be processed
+        :param drop_stale: Drop the oldest waiting frame instead of blocking the reader when the queue is full
+
+        :type model: NavigationModel
+        :type queue_size: int
+        :type drop_stale: bool
+        """
+        self.model = model
+        self.queue_size = queue_size
+        self.drop_stale = drop_stale
+        self.processed = 0
+        self.dropped = 0
+
+    async def handle(self, reader, writer):
+        """
+        Serves one client connection until it closes.
+        :param reader: Stream the frames are read from
+        :param writer: Stream the tip positions are written to
+
+        :return: None
+        """
+        queue = asyncio.Queue(self.queue_size)
+        solver = asyncio.ensure_future(self.solve(queue, writer))
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    writer.write((json.dumps({'seq': None, 'error': 'invalid JSON: {0}'.format(e)}) + '\n').encode())
+                    continue
+                if not isinstance(request, dict):
+                    writer.write((json.dumps({'seq': None, 'error': 'expected a JSON object'}) + '\n').encode())
+                    continue
+                request['received'] = time.time()
+
+                if queue.full() and self.drop_stale:
+                    stale = queue.get_nowait()
+                    queue.task_done()
+                    self.dropped += 1
+                    writer.write((json.dumps({'seq': stale.get('seq'), 'dropped': True}) + '\n').encode())
+                await queue.put(request)
+
+            # Stop waiting if the solver fails (e.g. the client went away), rather than waiting on frames it never takes
+            finished = asyncio.ensure_future(queue.join())
+            await asyncio.wait([finished, solver], return_when=asyncio.FIRST_COMPLETED)
+            finished.cancel()
+            if solver.done() and not solver.cancelled():
+                solver.result()
+        finally:
+            solver.cancel()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def solve(self, queue, writer):
+        """
+        Takes frames off the queue, locates the tip and writes the answers back.
+        :param queue: Frames waiting to be processed
+        :param writer: Stream the tip positions are written to
+
+        :return: None
+        """
+        while True:
+            request = await queue.get()
+            try:
+                tip = self.model.locate(np.asarray(request['markers'], dtype=np.float64).T)
+                response = {'seq': request.get('seq'), 'tip': tip.tolist(), 'received': request['received'],
+                            'done': time.time()}
+                self.processed += 1
+            except Exception as e:
+                # A malformed frame must not stop the service; the client is told which frame failed
+                response = {'seq': request.get('seq'), 'error': '{0}: {1}'.format(type(e).__name__, e)}
+            finally:
+                queue.task_done()
+            writer.write((json.dumps(response) + '\n').encode())
+
+            # Wait for the client to catch up before taking more work
+            await writer.drain()
+
+
+async def open_stream(host, port, unix):
+    """
+    Opens a client connection to a running service, over a unix socket if a path is given.
+    """
+    if unix:
+        return await asyncio.open_unix_connection(unix)
+    return await asyncio.open_connection(host, port)
+
+
+async def replay(emnav, host='127.0.0.1', port=8765, unix=None, rate=None):
+    """
+    Stands in for the tracker: streams the frames of an EM-nav file to the service and collects the answers.
+    :param emnav: The file name/path of the EM-nav recording
+    :param host: Host the service listens on
+    :param port: Port the service listens on
+    :param unix: Path of the service's unix socket, used instead of host/port when given
+    :param rate: Frames per second to send at, or None to send as fast as possible
+
+    :return: The service's answers, in order, each with the round-trip latency in seconds added as 'latency'. Answers
+        that match no sent frame (seq None for lines the service could not read) get an 'error' and a latency of None.
+    :rtype: [dict]
+    """
+    frames, offsets = pc.read_frames(emnav)
+    reader, writer = await open_stream(host, port, unix)
+    sent = {}
+
+    async def send():
+        start = time.perf_counter()
+        for seq, frame in enumerate(frames):
+            if rate:
+                delay = start + seq / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            sent[seq] = time.perf_counter()
+            writer.write((json.dumps({'seq': seq, 'markers': frame[offsets[0]:offsets[1]].tolist()}) + '\n').encode())
+            await writer.drain()
+
+    sender = asyncio.ensure_future(send())
+    answers = []
+    pending = len(frames)
+    while pending:
+        line = await reader.readline()
+        if not line:
+            break
+        answer = json.loads(line)
+        seq = answer.get('seq')
+        if isinstance(seq, int) and seq in sent:
+            answer['latency'] = time.perf_counter() - sent[seq]
+            pending -= 1
+        else:
+            # Not an answer to any frame sent, so there is no latency to measure; report it rather than fail the replay
+            answer.setdefault('error', 'answer for unknown frame {0!r}'.format(seq))
+            answer['latency'] = None
+        answers.append(answer)
+
+    await sender
+    writer.close()
+    await writer.wait_closed()
+    return answers
+
+
+async def serve(model, host='127.0.0.1', port=8765, unix=None, queue_size=64, drop_stale=False):
+    """
+    Runs the navigation service until cancelled.
+    """
+    service = NavigationService(model, queue_size, drop_stale)
+    if unix:
+        server = await asyncio.start_unix_server(service.handle, unix)
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    """
+    Command line entry point, e.g.
+        python nav_service.py fit model.npz <calbody> <calreadings> <empivot> <ct-fiducials> <em-fiducialss>
+        python nav_service.py serve model.npz --port 8765
+        python nav_service.py replay <EM-nav> --port 8765 --rate 40
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Real-time EM pointer navigation service')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    fit = commands.add_parser('fit', help='fit a navigation model from calibration files')
+    fit.add_argument('model')
+    fit.add_argument('files', nargs=5, metavar='file')
+
+    for name in ('serve', 'replay'):
+        command = commands.add_parser(name)
+        command.add_argument('path', help='model file to serve, or EM-nav file to replay')
+        command.add_argument('--host', default='127.0.0.1')
+        command.add_argument('--port', type=int, default=8765)
+        command.add_argument('--unix', help='unix socket path to use instead of host/port')
+        if name == 'serve':
+            command.add_argument('--queue-size', type=int, default=64)
+            command.add_argument('--drop-stale', action='store_true')
+        else:
+            command.add_argument('--rate', type=float, help='frames per second (default: as fast as possible)')
+
+    args = parser.parse_args()
+
+    if args.command == 'fit':
+        NavigationModel.fit(*args.files).save(args.model)
+    elif args.command == 'serve':
+        model = NavigationModel.load(args.path)
+        asyncio.run(serve(model, args.host, args.port, args.unix, args.queue_size, args.drop_stale))
+    else:
+        answers = asyncio.run(replay(args.path, args.host, args.port, args.unix, args.rate))
+        for answer in answers:
+            if answer.get('dropped'):
+                print('{0:>6}   dropped'.format(answer['seq']))
+            elif 'error' in answer:
+                print('{0!s:>6}   error: {1}'.format(answer.get('seq'), answer['error']))
+            else:
+                print('{0:>6}{1:>10}{2:>10}{3:>10}   {4:.3f} ms'.format(
+                    answer['seq'], *[format(x, '.2f') for x in answer['tip']], 1000 * answer['latency']))
+
+
+if __name__ == '__main__':
+    main()
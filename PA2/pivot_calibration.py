@@ -1,5 +1,7 @@
 import numpy as np
 import PointCloud as pc
+import Frame_Transformation
+
 
 def pivot(point_groups, frame_idx, debug=False):
     """
@@ -16,28 +18,147 @@ def pivot(point_groups, frame_idx, debug=False):
     centroid = np.mean(initial_points, axis=0)
     adjusted_points = initial_points - centroid
 
-    num_frames = len(point_groups)
-    assembly_matrix = np.zeros((3 * num_frames, 6))
-    solution_vector = np.zeros(3 * num_frames)
-
-    frame_transformations = []
-
-    # Construct the assembly matrix for the least squares solution.
-    for i in range(num_frames):
-        transformation = pc.PointCloud(adjusted_points).register(point_groups[i][frame_idx])
-        if debug:
-            frame_transformations.append(transformation)
-        rotation_matrix, position_vector = transformation.rotation, transformation.translation
-        for j in range(3):
-            assembly_matrix[3 * i + j, :3] = rotation_matrix[j]
-            assembly_matrix[3 * i + j, 3 + j] = -1
-            solution_vector[3 * i + j] = -position_vector[j]
-
-    # Solve the least squares problem to find the calibration points.
-    calibration_solution = np.linalg.lstsq(assembly_matrix, solution_vector, rcond=None)
-    pointer_tip = calibration_solution[0][:3]
-    tracker_tip = calibration_solution[0][3:6]
+    # Stack the marker positions of every frame so they can be registered together.
+    markers = np.stack([group[frame_idx].data for group in point_groups])
+    pointer_tip, tracker_tip = pivot_batched(markers, adjusted_points)
 
     if debug:
+        rotations, translations = pc.RegistrationTemplate(adjusted_points).register_batch(markers)
+        frame_transformations = [Frame_Transformation.Frame(r, t) for r, t in zip(rotations, translations)]
         return pointer_tip, tracker_tip, frame_transformations
     return pointer_tip, tracker_tip
+
+
+def pivot_batched(markers, reference=None, chunk_size=4096):
+    """
+    Pivot calibration over a stack of frames. Frames are registered chunk_size at a time with PointCloud.register_batch
+    and folded into the 6 x 6 normal equations of the pivot system, so memory does not grow with the number of poses.
+
+    :param markers: Marker positions for every frame, each laid out like PointCloud.data. A (nframes, npoints, 3) array
+                    from PointCloud.read_frames or a Recording can be passed as markers.transpose(0, 2, 1).
+    :param reference: Marker positions in pointer coordinates. Defaults to the first frame, centred as in pivot.
+    :param chunk_size: Number of frames registered at a time.
+
+    :type markers: numpy.array, F x 3 x N
+    :type reference: numpy.array, 3 x N
+    :type chunk_size: int
+
+    :return: Positions of the pointer tip in pointer and EM tracker coordinates.
+    """
+    if reference is None:
+        reference = markers[0] - np.mean(markers[0], axis=0)
+    template = pc.RegistrationTemplate(reference)
+
+    AtA = np.zeros((6, 6))
+    Atb = np.zeros(6)
+    for start in range(0, len(markers), chunk_size):
+        rotations, translations = template.register_batch(markers[start:start + chunk_size])
+        chunk_AtA, chunk_Atb, _ = normal_equations(rotations, translations)
+        AtA += chunk_AtA
+        Atb += chunk_Atb
+
+    calibration_solution = np.linalg.lstsq(AtA, Atb, rcond=None)
+    return calibration_solution[0][:3], calibration_solution[0][3:6]
+
+
+def normal_equations(rotations, translations):
+    """
+    Builds the normal equations of the pivot system [R_k | -I] [t_pointer; t_tracker] = -p_k for a set of frames.
+
+    :param rotations: Rotation matrices of each frame's registration.
+    :param translations: Translation vectors of each frame's registration.
+
+    :type rotations: numpy.array, F x 3 x 3
+    :type translations: numpy.array, F x 3 x 1
+
+    :return: A^T A (6 x 6), A^T b (6,) and b^T b for the stacked system.
+    """
+    n_frames = rotations.shape[0]
+    translations = translations.reshape((n_frames, 3))
+    rotation_sum = rotations.sum(axis=0)
+
+    # Each frame adds [[R^T R, -R^T], [-R, I]]; R^T R = I for a rotation
+    AtA = np.zeros((6, 6))
+    AtA[:3, :3] = n_frames * np.eye(3)
+    AtA[:3, 3:] = -rotation_sum.T
+    AtA[3:, :3] = -rotation_sum
+    AtA[3:, 3:] = n_frames * np.eye(3)
+
+    Atb = np.concatenate((-np.einsum('fji,fj->i', rotations, translations), translations.sum(axis=0)))
+    btb = np.sum(translations ** 2)
+
+    return AtA, Atb, btb
+
+
+class PivotCalibrator:
+    """
+    Streaming pivot calibration. Each EM frame is registered as it arrives and folded into the 6 x 6 normal equations
+    of the pivot system as a rank-3 update, so the estimate can be refreshed in constant time per frame. After every
+    frame the residual RMS and the condition number of the system are available, so pose collection can stop as soon
+    as the estimate has converged.
+
+    The residual is computed from the accumulated normal equations rather than from the frames, which are not kept.
+    Expanding ||Ax - b||^2 that way cancels terms of size b^T b, so the RMS is only accurate to about sqrt(eps) times
+    the RMS of the registration translations b: ~3e-6 mm for translations of ~200 mm. Below that it reads as noise
+    (a single frame, whose exact residual is 0, gives ~2e-6 mm on the debug data), so max_rms should stay well above it.
+    """
+    def __init__(self, reference):
+        """
+        :param reference: Marker positions in pointer coordinates, as passed to pivot_batched (for example the first
+                          frame centred as in pivot).
+        :type reference: numpy.array, 3 x N
+        """
+        self.reference = reference
+        self.template = pc.RegistrationTemplate(reference)
+        self.n_frames = 0
+        self.AtA = np.zeros((6, 6))
+        self.Atb = np.zeros(6)
+        self.btb = 0.0
+
+        self.pointer_tip = None
+        self.tracker_tip = None
+        self.rms = np.inf
+        self.condition = np.inf
+
+    def add_frame(self, markers):
+        """
+        Adds one EM frame and updates the estimate.
+
+        :param markers: Marker positions for the frame
+        :type markers: numpy.array, 3 x N, or PointCloud.PointCloud
+
+        :return: Positions of the pointer tip in pointer and EM tracker coordinates, the residual RMS and the
+                 condition number of the normal equations.
+        """
+        if isinstance(markers, pc.PointCloud):
+            markers = markers.data
+
+        rotations, translations = self.template.register_batch(markers[np.newaxis])
+        frame_AtA, frame_Atb, frame_btb = normal_equations(rotations, translations)
+        self.AtA += frame_AtA
+        self.Atb += frame_Atb
+        self.btb += frame_btb
+        self.n_frames += 1
+
+        solution = np.linalg.lstsq(self.AtA, self.Atb, rcond=None)[0]
+        self.pointer_tip, self.tracker_tip = solution[:3], solution[3:6]
+
+        # ||Ax - b||^2 = x^T A^T A x - 2 x^T A^T b + b^T b, accurate to about eps * b^T b (see the class docstring)
+        residual = solution.dot(self.AtA).dot(solution) - 2 * solution.dot(self.Atb) + self.btb
+        self.rms = np.sqrt(max(residual, 0.0) / (3 * self.n_frames))
+        self.condition = np.linalg.cond(self.AtA)
+
+        return self.pointer_tip, self.tracker_tip, self.rms, self.condition
+
+    def converged(self, max_rms, max_condition=1e3, min_frames=3):
+        """
+        Whether the estimate is good enough to stop collecting poses.
+
+        :param max_rms: Largest acceptable residual RMS; keep it well above sqrt(eps) times the translation magnitudes
+        :param max_condition: Largest acceptable condition number; poses that barely rotate leave the system ill-posed
+        :param min_frames: Fewest frames to accept
+
+        :return: True when all three criteria are met
+        :rtype: bool
+        """
+        return self.n_frames >= min_frames and self.rms <= max_rms and self.condition <= max_condition
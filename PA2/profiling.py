@@ -0,0 +1,133 @@
+import sys, os
+import atexit
+import contextlib
+import json
+import time
+import tracemalloc
+
+# Shared no-op context manager handed out while profiling is disabled
+_DISABLED = contextlib.nullcontext()
+
+# The active Profile, or None when profiling is disabled
+_profile = None
+
+
+class Profile:
+    """
+    Wall time, CPU time and peak allocation of named pipeline stages. Stages may be nested; each is recorded under
+    its path (e.g. 'distortion/c_expected/parse') and repeated entries of the same path are summed.
+    """
+    def __init__(self, trace_memory=True):
+        """
+        :param trace_memory: Record peak allocations with tracemalloc, which must be tracing. Without it only times
+                             are recorded, and the stages run at full speed.
+        :type trace_memory: bool
+        """
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self._stack = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Measures the code run inside the with block as one entry of the stage name.
+        :param name: Name of the stage
+        :type name: str
+        """
+        # Fold the parent's peak so far into its record before the child resets the tracemalloc peak
+        if self._stack and self.trace_memory:
+            parent = self._stack[-1]
+            parent['peak'] = max(parent['peak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+
+        path = '/'.join([entry['name'] for entry in self._stack] + [name])
+        start = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        entry = {'name': name, 'path': path, 'start': start, 'peak': start}
+        self._stack.append(entry)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self._stack.pop()
+            if self.trace_memory:
+                entry['peak'] = max(entry['peak'], tracemalloc.get_traced_memory()[1])
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], entry['peak'])
+
+            record = self.stages.setdefault(path, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peak_alloc': 0})
+            record['calls'] += 1
+            record['wall'] += wall
+            record['cpu'] += cpu
+            record['peak_alloc'] = max(record['peak_alloc'], entry['peak'] - entry['start'])
+
+    def write(self, path):
+        """
+        Writes the profile as JSON, with stages sorted by path so profiles of different runs can be diffed.
+        :param path: File name/path to write to
+        :type path: str
+
+        :return: None
+        """
+        with open(path, 'w') as f:
+            json.dump({'argv': sys.argv, 'stages': dict(sorted(self.stages.items()))}, f, indent=2)
+
+
+def enable(path):
+    """
+    Starts profiling; the profile is written to path when the interpreter exits.
+    :param path: File name/path of the JSON profile
+    :type path: str
+
+    :return: The active profile
+    :rtype: Profile
+    """
+    global _profile
+    if _profile is None:
+        tracemalloc.start()
+        _profile = Profile()
+        atexit.register(_profile.write, path)
+    return _profile
+
+
+@contextlib.contextmanager
+def session(trace_memory=False):
+    """
+    Collects a fresh profile for the duration of the with block, e.g. for one run of a regression harness, and
+    restores the previous state afterwards.
+    :param trace_memory: Also record peak allocations (slows the stages down)
+    :type trace_memory: bool
+
+    :return: Context manager yielding the Profile being filled
+    """
+    global _profile
+    previous = _profile
+    started = trace_memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    _profile = Profile(trace_memory)
+    try:
+        yield _profile
+    finally:
+        _profile = previous
+        if started:
+            tracemalloc.stop()
+
+
+def stage(name):
+    """
+    Context manager timing a pipeline stage. While profiling is disabled this returns a shared no-op context, so
+    instrumented code costs one function call.
+    :param name: Name of the stage
+    :type name: str
+    """
+    if _profile is None:
+        return _DISABLED
+    return _profile.stage(name)
+
+
+# Profiling can also be switched on from the environment: PA2_PROFILE=profile.json python Driver.py ...
+if os.environ.get('PA2_PROFILE'):
+    enable(os.environ['PA2_PROFILE'])
@@ -0,0 +1,132 @@
+import sys, os
+import json
+import itertools
+import numpy as np
+import PointCloud as pc
+
+
+def store_paths(store_dir, filepath):
+    """
+    Returns the paths of the binary data file and JSON header used to store a recording.
+    :param store_dir: Directory holding the binary recordings
+    :param filepath: The file name/path of the original text recording
+
+    :type store_dir: str
+    :type filepath: str
+
+    :return: The .npy and .json paths for the recording
+    :rtype: (str, str)
+    """
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    base = os.path.join(store_dir, name)
+    return base + '.npy', base + '.json'
+
+
+def convert(filepath, store_dir, chunk_frames=4096):
+    """
+    Converts a text tracker recording into a binary recording. The points are written to a (nframes, npoints, 3) .npy
+    file and the marker group sizes from the first line of the text file are kept in a small JSON header. The text
+    file is streamed chunk_frames frames at a time, so recordings larger than memory can be converted.
+
+    :param filepath: The file name/path of the text recording (calreadings, empivot, EM-nav, ...)
+    :param store_dir: Directory to write the binary recording to
+    :param chunk_frames: Number of frames to parse at a time
+
+    :type filepath: str
+    :type store_dir: str
+    :type chunk_frames: int
+
+    :return: The path of the JSON header of the new recording
+    :rtype: str
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    data_path, header_path = store_paths(store_dir, filepath)
+
+    with open(filepath) as f:
+        header_line = f.readline()
+        file_key, group_sizes, nframes = pc.parse_header(header_line)
+        npoints = sum(group_sizes)
+
+        frames = np.lib.format.open_memmap(data_path, mode='w+', dtype=np.float64, shape=(nframes, npoints, 3))
+        for start in range(0, nframes, chunk_frames):
+            stop = min(start + chunk_frames, nframes)
+            lines = list(itertools.islice(f, (stop - start) * npoints))
+            values = np.array(' '.join(lines).replace(',', ' ').split(), dtype=np.float64)
+            frames[start:stop] = values.reshape((stop - start, npoints, 3))
+        frames.flush()
+        del frames
+
+    header = {'source': os.path.basename(filepath), 'header': header_line.strip(), 'file_key': file_key,
+              'groups': group_sizes, 'nframes': nframes, 'npoints': npoints}
+    with open(header_path, 'w') as f:
+        json.dump(header, f, indent=2)
+
+    return header_path
+
+
+class Recording:
+    """
+    A binary tracker recording opened as a read-only memory map. Indexing and group slices return views into the
+    mapped file, so only the frames that are actually touched are read from disk.
+    """
+    def __init__(self, path):
+        """
+        Opens a recording written by convert.
+        :param path: Path of the recording's .json header or .npy data file
+        :type path: str
+        """
+        base = os.path.splitext(path)[0]
+        with open(base + '.json') as f:
+            self.header = json.load(f)
+
+        self.frames = np.load(base + '.npy', mmap_mode='r')
+        self.offsets = [0]
+        for size in self.header['groups']:
+            self.offsets.append(self.offsets[-1] + size)
+
+    def __len__(self):
+        return self.frames.shape[0]
+
+    def __getitem__(self, index):
+        """
+        :return: The points of the frame(s) selected by index, shape (npoints, 3) or (nframes, npoints, 3)
+        :rtype: numpy.memmap
+        """
+        return self.frames[index]
+
+    def group(self, group_index, start=None, stop=None):
+        """
+        Returns one marker group over a range of frames.
+        :param group_index: Index of the marker group, in the order of the file header
+        :param start: First frame of the range
+        :param stop: End (exclusive) of the range
+
+        :type group_index: int
+        :type start: int
+        :type stop: int
+
+        :return: View of shape (stop - start, group size, 3)
+        :rtype: numpy.memmap
+        """
+        return self.frames[start:stop, self.offsets[group_index]:self.offsets[group_index + 1]]
+
+    def clouds(self, frame_index):
+        """
+        Returns a frame in the same layout as an entry of PointCloud.inp_file.
+        :param frame_index: Index of the frame
+        :type frame_index: int
+
+        :return: One PointCloud per marker group
+        :rtype: [PointCloud.PointCloud]
+        """
+        frame = self.frames[frame_index]
+        return [pc.PointCloud(frame[self.offsets[i]:self.offsets[i + 1]].T) for i in range(len(self.offsets) - 1)]
+
+    def __repr__(self):
+        return f"Recording(source={self.header['source']}, nframes={len(self)})"
+
+
+if __name__ == '__main__':
+    # Usage: python recording_store.py <store_dir> <recording.txt> [<recording.txt> ...]
+    for arg in sys.argv[2:]:
+        print(convert(arg, sys.argv[1]))
@@ -0,0 +1,167 @@
+import argparse
+import time
+import numpy as np
+import repo_paths
+import geometry
+from geometry.registration import BACKENDS
+
+# Backends chosen by select_backend, keyed by (n_points, batch_size)
+_selected = {}
+
+# Whether each backend passes check_accuracy, computed on first use
+_accurate = {}
+
+
+def register(source, targets, backend='arun'):
+    """
+    Registers one source cloud to a stack of target clouds with the given backend.
+    :param source: Numpy array of column vectors for the source cloud, 3 x N
+    :param targets: Stack of target clouds, F x 3 x N
+    :param backend: Name of a backend in BACKENDS, or 'auto' to use select_backend
+
+    :return: The rotation matrices and translation vectors mapping source onto each target
+    :rtype: (numpy.array F x 3 x 3, numpy.array F x 3 x 1)
+    """
+    if backend == 'auto':
+        backend = select_backend(np.shape(source)[1], np.shape(targets)[0])
+    return geometry.register_batch(source, targets, backend)
+
+
+def rotation_about(axis, angle):
+    """Rotation matrix of angle radians about axis"""
+    axis = np.asarray(axis, dtype=np.float64) / np.linalg.norm(axis)
+    K = np.array([[0, -axis[2], axis[1]], [axis[2], 0, -axis[0]], [-axis[1], axis[0], 0]])
+    return np.eye(3) + np.sin(angle) * K + (1 - np.cos(angle)) * K.dot(K)
+
+
+def accuracy_cases():
+    """
+    The cases of PA1 TestRegistration as (source, rotation, translation). The source points of its cases 3 and 4 are
+    collinear, so the rotation about their line is not determined and which rotation a backend returns is arbitrary;
+    case 3 is left out and case 4 (the identity) uses the points of case 1 instead.
+
+    :return: List of test cases
+    """
+    rng = np.random.RandomState(0)
+    return [
+        # Arbitrary rotation and translation
+        (np.array([[2, 5, 1], [1, 3, 2], [7, 4, 8]], dtype=np.float64), rotation_about([1, 2, 3], 2.1),
+         np.array([[3.], [4.], [5.]])),
+        # Large translation without rotation
+        (np.array([[2, 3, 1], [1, 4, 2], [0, 2, 3]], dtype=np.float64), np.eye(3),
+         np.array([[100.], [200.], [300.]])),
+        # Identity
+        (np.array([[2, 5, 1], [1, 3, 2], [7, 4, 8]], dtype=np.float64), np.eye(3), np.zeros((3, 1))),
+        # Random rotation and translation of random points
+        (rng.uniform(0, 10, (3, 10)), rotation_about(rng.normal(size=3), rng.uniform(0, np.pi)),
+         rng.uniform(0, 10, (3, 1))),
+        # Half turn, where quaternion methods have to pick the right eigenvector
+        (rng.uniform(-50, 50, (3, 6)), rotation_about([0, 0, 1], np.pi), np.zeros((3, 1))),
+    ]
+
+
+def check_accuracy(backend, tolerance=1e-6):
+    """
+    Whether a backend recovers the rotation and translation of every accuracy case.
+    :param backend: Name of a backend in BACKENDS
+    :param tolerance: Largest acceptable absolute error of any rotation or translation component
+
+    :rtype: bool
+    """
+    for source, rotation, translation in accuracy_cases():
+        target = rotation.dot(source) + translation
+        rotations, translations = register(source, target[np.newaxis], backend)
+        if not (np.allclose(rotations[0], rotation, atol=tolerance) and
+                np.allclose(translations[0], translation, atol=tolerance)):
+            return False
+    return True
+
+
+def benchmark(n_points, batch_size, backends=None, repeat=5, min_time=0.1, max_rounds=1000):
+    """
+    Times each backend on random frames of a given size. Every backend is called once untimed first, so the first one
+    timed does not pay for cold caches and first-call allocations. The timed calls then go round the backends in turn,
+    so a burst of load from elsewhere slows them alike, and continue past repeat rounds until each backend has run for
+    min_time in total, so short calls are timed many times.
+    :param n_points: Number of points per cloud
+    :param batch_size: Number of target clouds per call
+    :param backends: Names of the backends to time (default: all)
+    :param repeat: Fewest timed calls per backend; the fastest is reported
+    :param min_time: Total timed seconds per backend to reach before stopping, unless max_rounds is reached first
+    :param max_rounds: Most timed calls per backend
+
+    :return: Seconds per call of each backend
+    :rtype: dict
+    """
+    rng = np.random.RandomState(1)
+    source = rng.uniform(-50, 50, (3, n_points))
+    targets = np.stack([rotation_about(rng.normal(size=3), rng.uniform(0, np.pi)).dot(source)
+                        for _ in range(batch_size)]) + rng.normal(scale=0.1, size=(batch_size, 3, n_points))
+
+    names = list(backends or BACKENDS)
+    for name in names:
+        register(source, targets, name)
+
+    timings = dict.fromkeys(names, np.inf)
+    spent = dict.fromkeys(names, 0.0)
+    rounds = 0
+    while rounds < repeat or (min(spent.values()) < min_time and rounds < max_rounds):
+        for name in names:
+            start = time.perf_counter()
+            register(source, targets, name)
+            elapsed = time.perf_counter() - start
+            timings[name] = min(timings[name], elapsed)
+            spent[name] += elapsed
+        rounds += 1
+    return timings
+
+
+def select_backend(n_points, batch_size, timings=None):
+    """
+    Picks the fastest backend that passes check_accuracy, by timing every backend at the given size with benchmark.
+    The choice is remembered, so each size is only benchmarked once per process.
+    :param n_points: Number of points per cloud
+    :param batch_size: Number of target clouds per call
+    :param timings: Results of benchmark at this size to choose from instead of timing the backends again
+
+    :return: Name of the chosen backend
+    :rtype: str
+    """
+    key = (n_points, batch_size)
+    if key not in _selected:
+        for name in BACKENDS:
+            if name not in _accurate:
+                _accurate[name] = check_accuracy(name)
+        candidates = [name for name in BACKENDS if _accurate[name]]
+        if timings is None:
+            timings = benchmark(n_points, batch_size, candidates)
+        _selected[key] = min(candidates, key=timings.get)
+    return _selected[key]
+
+
+def main():
+    """
+    Command line entry point, e.g.
+        python registration.py --points 6 --points 100 --batch 1 --batch 1000
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Check and time the registration backends')
+    parser.add_argument('--points', type=int, action='append', help='points per cloud; may be repeated')
+    parser.add_argument('--batch', type=int, action='append', help='clouds per call; may be repeated')
+    args = parser.parse_args()
+
+    for name in BACKENDS:
+        print('{0:<14}{1}'.format(name, 'accurate' if check_accuracy(name) else 'FAILED accuracy check'))
+
+    print('\n{0:>8}{1:>8}  '.format('points', 'batch') + ''.join('{0:>14}'.format(name) for name in BACKENDS) +
+          '  selected')
+    for n_points in args.points or [6, 100]:
+        for batch_size in args.batch or [1, 100, 10000]:
+            timings = benchmark(n_points, batch_size)
+            print('{0:>8}{1:>8}  '.format(n_points, batch_size) +
+                  ''.join('{0:>11.3f} ms'.format(1000 * timings[name]) for name in BACKENDS) +
+                  '  ' + select_backend(n_points, batch_size, timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+import os
+import sys
+import argparse
+import collections
+import importlib.util
+import time
+import numpy as np
+import PointCloud as pc
+
+# PA3 directory, holding the closest-point modules
+PA3_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'PA3')
+
+
+class ReplayReport:
+    """
+    Results of replaying a recording through a pipeline.
+    """
+    def __init__(self, rate, elapsed, latencies, dropped):
+        """
+        :param rate: The rate frames were replayed at, in frames per second, or None for as fast as possible
+        :param elapsed: Wall time of the whole replay in seconds
+        :param latencies: Time from each processed frame's arrival to the end of its processing, in seconds
+        :param dropped: Number of frames dropped because the queue was full when they arrived
+        """
+        self.rate = rate
+        self.elapsed = elapsed
+        self.latencies = np.asarray(latencies)
+        self.dropped = dropped
+
+    @property
+    def processed(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        """Processed frames per second over the whole replay"""
+        return self.processed / self.elapsed if self.elapsed > 0 else float('inf')
+
+    def percentile(self, q):
+        """Latency percentile q (0-100) in seconds"""
+        return float(np.percentile(self.latencies, q)) if self.processed else float('nan')
+
+    def __repr__(self):
+        rate = 'max' if self.rate is None else '{0:g} Hz'.format(self.rate)
+        return ('ReplayReport(rate={0}, processed={1}, dropped={2}, throughput={3:.1f} Hz, p50={4:.3f} ms, '
+                'p99={5:.3f} ms)').format(rate, self.processed, self.dropped, self.throughput,
+                                          1000 * self.percentile(50), 1000 * self.percentile(99))
+
+
+def replay(frames, process, rate=None, queue_size=1, repeat=1):
+    """
+    Replays frames as a timed stream and runs each one through a pipeline. Frame i arrives at i / rate seconds after
+    the start, like frames from a tracker sampling at that rate. Arrived frames wait in a queue of queue_size frames;
+    a frame that arrives while the queue is full is dropped, as a tracker's buffer would overflow.
+
+    :param frames: The frames to replay, in order
+    :param process: Pipeline called once per frame
+    :param rate: Frames per second, or None to feed the next frame as soon as the previous one is done
+    :param queue_size: Number of frames that may wait while the pipeline is busy
+    :param repeat: Number of times to cycle through the frames, for longer sustained runs
+
+    :type frames: sequence of numpy.array
+    :type process: callable
+    :type rate: float
+    :type queue_size: int
+    :type repeat: int
+
+    :return: Throughput, dropped frames and latency statistics of the run
+    :rtype: ReplayReport
+    """
+    n_frames = len(frames) * repeat
+    latencies = []
+    dropped = 0
+    queue = collections.deque()
+    arrived = 0
+
+    start = time.perf_counter()
+    while arrived < n_frames or queue:
+        now = time.perf_counter()
+
+        if rate is None:
+            # Free running: the next frame arrives as soon as the pipeline is idle
+            if not queue:
+                queue.append((arrived, now))
+                arrived += 1
+        else:
+            # Admit every frame whose arrival time has passed
+            while arrived < n_frames and start + arrived / rate <= now:
+                if len(queue) < queue_size:
+                    queue.append((arrived, start + arrived / rate))
+                else:
+                    dropped += 1
+                arrived += 1
+
+            if not queue:
+                time.sleep(max(start + arrived / rate - time.perf_counter(), 0))
+                continue
+
+        index, arrival = queue.popleft()
+        process(frames[index % len(frames)])
+        latencies.append(time.perf_counter() - arrival)
+
+    return ReplayReport(rate, time.perf_counter() - start, latencies, dropped)
+
+
+def import_pa3(name):
+    """
+    Imports a module of the PA3 directory from its file. PA2 has modules of the same names as some of PA3's (golden,
+    unit_testing), so PA3 is on the import path only while the module and the PA3 modules it imports are loaded.
+    :param name: Module name, e.g. 'computedk'
+
+    :return: The module
+    """
+    path = os.path.join(PA3_DIR, name + '.py')
+    module = sys.modules.get(name)
+    if module is not None:
+        if os.path.abspath(getattr(module, '__file__', '')) != path:
+            raise ImportError('a module named {0} other than {1} is already imported'.format(name, path))
+        return module
+
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    sys.path.insert(0, PA3_DIR)
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    finally:
+        sys.path.remove(PA3_DIR)
+    return module
+
+
+def tip_pipeline(model_path):
+    """
+    The PA2 tip pipeline: correctionion, registration and F_reg for one frame of pointer markers, as served by
+    nav_service.
+    :param model_path: File name/path of a model saved by nav_service.NavigationModel.save
+
+    :return: Callable taking a frame of marker positions (npoints, 3)
+    """
+    import nav_service
+    model = nav_service.NavigationModel.load(model_path)
+    return lambda frame: model.locate(frame.T)
+
+
+def closest_pipeline(bodyA, bodyB, meshFile, engine='sorted'):
+    """
+    The PA3 pipeline: d_k from one frame of body A and B markers, then the closest point on the mesh.
+    :param bodyA: Path to the body A definition file
+    :param bodyB: Path to the body B definition file
+    :param meshFile: Path to the .sur mesh file
+    :param engine: 'simple' or 'sorted' closest-point search
+
+    :return: Callable taking a frame of marker positions (npoints, 3)
+    """
+    computedk = import_pa3('computedk')
+    mesh = import_pa3('mesh')
+
+    DA, Pa = computedk.read_body(bodyA)
+    DB, Pb = computedk.read_body(bodyB)
+    na, nb = DA.data.shape[1], DB.data.shape[1]
+    DV, triangles = mesh.read_mesh(meshFile)
+
+    if engine == 'simple':
+        search_simple = import_pa3('simple').search_simple
+        search = lambda sk: search_simple(DV, triangles, sk)
+    else:
+        sorted_search = import_pa3('sorted')
+        kd_tree = sorted_search.build_tree(DV, triangles)
+        search = lambda sk: sorted_search.search_sorted(DV, triangles, kd_tree, sk)
+
+    def process(frame):
+        dk = computedk.compute_dk_frame(frame[:na].T, frame[na:na + nb].T, DA, DB, Pa)
+        return search(dk.reshape((3, 1)))
+    return process
+
+
+def read_recording(path, group=None):
+    """
+    Reads the frames of a PA2 tracker file or a PA3 sample readings file.
+    :param path: File name/path of the recording
+    :param group: Marker group to keep from a PA2 file, or None for every point of the frame
+
+    :return: Array of frames, (nframes, npoints, 3)
+    """
+    if 'SampleReadings' in os.path.basename(path):
+        return import_pa3('computedk').read_sample_frames(path)
+
+    frames, offsets = pc.read_frames(path)
+    if group is None:
+        return frames
+    return frames[:, offsets[group]:offsets[group + 1]]
+
+
+def main():
+    """
+    Command line entry point, e.g.
+        python replay.py "PA12 - Student Data/pa2-debug-a-EM-nav.txt" --model model.npz --rate 40 --rate 1000 --rate max
+        python replay.py ../PA3/PADATA/PA3-A-Debug-SampleReadingsTest.txt --pipeline closest
+            --bodies ../PA3/PADATA/Problem3-BodyA.txt ../PA3/PADATA/Problem3-BodyB.txt
+            --mesh ../PA3/PADATA/Problem3MeshFile.sur --rate max
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Replay a recorded session through a pipeline at a fixed rate')
+    parser.add_argument('recording')
+    parser.add_argument('--pipeline', choices=('tip', 'closest'), default='tip')
+    parser.add_argument('--model', help='navigation model for the tip pipeline (see nav_service.py fit)')
+    parser.add_argument('--group', type=int, default=0, help='marker group of a PA2 recording to replay')
+    parser.add_argument('--bodies', nargs=2, metavar=('BODY_A', 'BODY_B'))
+    parser.add_argument('--mesh')
+    parser.add_argument('--engine', choices=('simple', 'sorted'), default='sorted')
+    parser.add_argument('--rate', action='append', help='frames per second, or "max"; may be repeated')
+    parser.add_argument('--queue-size', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1, help='number of passes over the recording')
+    args = parser.parse_args()
+
+    if args.pipeline == 'tip':
+        frames = read_recording(args.recording, args.group)
+        process = tip_pipeline(args.model)
+    else:
+        frames = read_recording(args.recording)
+        process = closest_pipeline(args.bodies[0], args.bodies[1], args.mesh, args.engine)
+
+    for rate in args.rate or ['max']:
+        rate = None if rate == 'max' else float(rate)
+        print(replay(frames, process, rate, args.queue_size, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+"""
+Import path setup shared by the modules of this directory. The geometry package lives at the repository root, and
+the assignment directories are not packages, so every module that imports geometry imports this module first.
+"""
+import sys, os
+
+# Repository root, holding the geometry package
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,144 @@
+import sys, os
+import hashlib
+import pickle
+import types
+import repo_paths
+
+
+class StageCache:
+    """
+    On-disk cache of pipeline stage results. A stage's key is a hash of the stage name, the sources of the module
+    defining it and of every module of this repository that module imports, the contents of its input files, its
+    parameters and the keys of the stages it depends on, so a stage is only recomputed when something it depends on
+    has changed.
+    """
+    def __init__(self, directory):
+        """
+        :param directory: Directory holding the cached results; created if needed
+        :type directory: str
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._digests = {}
+        self._sources = {}
+        self.hits = 0
+        self.misses = 0
+
+    def file_digest(self, path):
+        """
+        Hash of a file's contents. Digests are remembered per path, size and mtime, so each file is read once.
+        :param path: File name/path
+        :type path: str
+
+        :return: Hex SHA-256 digest of the file
+        :rtype: str
+        """
+        stat = os.stat(path)
+        signature = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if signature not in self._digests:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            self._digests[signature] = digest.hexdigest()
+        return self._digests[signature]
+
+    def source_files(self, module_name):
+        """
+        Source files of a module and of every module of this repository it imports, directly or through other modules
+        (e.g. pivot_calibration, calc_expected_Ci, PointCloud and the geometry package for distortion_correction).
+        Modules are found through the module objects, functions and classes in each module's namespace; standard
+        library and third-party modules are left out.
+        :param module_name: Name of the module, e.g. func.__module__
+        :type module_name: str
+
+        :return: Source file paths, sorted
+        :rtype: [str]
+        """
+        if module_name not in self._sources:
+            files = set()
+            seen = set()
+            pending = [sys.modules.get(module_name)]
+            while pending:
+                module = pending.pop()
+                if module is None or module.__name__ in seen:
+                    continue
+                seen.add(module.__name__)
+                path = getattr(module, '__file__', None)
+                if not path or not os.path.abspath(path).startswith(repo_paths.ROOT + os.sep):
+                    continue
+                files.add(os.path.abspath(path))
+                for value in list(vars(module).values()):
+                    if isinstance(value, types.ModuleType):
+                        pending.append(value)
+                    elif isinstance(getattr(value, '__module__', None), str):
+                        pending.append(sys.modules.get(value.__module__))
+            self._sources[module_name] = sorted(files)
+        return self._sources[module_name]
+
+    def key(self, stage, func, files=(), params=(), upstream=()):
+        """
+        Computes the cache key of a stage.
+        :param stage: Name of the stage
+        :param func: Function computing the stage; the source files of its module and of the repository modules it
+                     imports (see source_files) are part of the key
+        :param files: Input file paths
+        :param params: Other inputs to the stage; must have a stable repr
+        :param upstream: Keys of the stages whose results are passed in
+
+        :return: Hex SHA-256 key
+        :rtype: str
+        """
+        digest = hashlib.sha256(stage.encode())
+        for path in self.source_files(func.__module__):
+            digest.update(self.file_digest(path).encode())
+        for path in files:
+            digest.update(self.file_digest(path).encode())
+        digest.update(repr(params).encode())
+        for key in upstream:
+            digest.update(key.encode())
+        return digest.hexdigest()
+
+    def run(self, stage, func, args, files=(), params=(), upstream=()):
+        """
+        Returns the cached result of a stage, computing and storing it first if it is not cached yet.
+        :param stage: Name of the stage
+        :param func: Function computing the stage
+        :param args: Arguments func is called with
+        :param files: Input file paths read by the stage
+        :param params: Other inputs to the stage that are not files or upstream results
+        :param upstream: Keys of the stages whose results are among args
+
+        :return: The stage result and its key, to pass on as upstream for later stages
+        :rtype: (object, str)
+        """
+        key = self.key(stage, func, files, params, upstream)
+        path = os.path.join(self.directory, '{0}-{1}.pkl'.format(stage, key[:32]))
+
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                self.hits += 1
+                return pickle.load(f), key
+
+        self.misses += 1
+        result = func(*args)
+
+        # Write to a temporary file first so an interrupted run never leaves a truncated entry behind
+        temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+        return result, key
+
+
+def run(cache, stage, func, args, files=(), params=(), upstream=()):
+    """
+    Runs a stage through cache, or directly when cache is None.
+
+    :return: The stage result and its key (None without a cache)
+    :rtype: (object, str)
+    """
+    if cache is None:
+        return func(*args), None
+    return cache.run(stage, func, args, files, params, upstream)
@@ -0,0 +1,375 @@
+import sys, os
+import argparse
+import time
+import numpy as np
+import distortion_correction as d
+
+import repo_paths
+from geometry.transforms import quaternion_to_rotation
+
+# Marker counts of the debug datasets: d, a, c on the calibration body, g on the EM probe, h on the optical probe and
+# b, the CT fiducials
+COUNTS = {'d': 8, 'a': 8, 'c': 27, 'g': 6, 'h': 8, 'b': 6}
+
+# Frame counts of the debug datasets
+FRAMES = {'calreadings': 125, 'empivot': 12, 'optpivot': 12, 'nav': 4}
+
+# File names of each layout. PA1 reads upper-case names and has no CT registration or navigation files.
+LAYOUTS = {
+    'pa2': {'calbody': '{0}-calbody.txt', 'calreadings': '{0}-calreadings.txt', 'empivot': '{0}-empivot.txt',
+            'optpivot': '{0}-optpivot.txt', 'ct-fiducials': '{0}-ct-fiducials.txt',
+            'em-fiducials': '{0}-em-fiducialss.txt', 'nav': '{0}-EM-nav.txt', 'output1': '{0}-output1.txt',
+            'output2': '{0}-output2.txt'},
+    'pa1': {'calbody': '{0}-CALBODY.TXT', 'calreadings': '{0}-CALREADINGS.TXT', 'empivot': '{0}-EMPIVOT.TXT',
+            'optpivot': '{0}-OPTPIVOT.TXT', 'output1': '{0}-OUTPUT1.TXT'},
+}
+
+# Row format of every data and answer file, e.g. "  201.69,   190.61,   207.96"
+ROW = '%8.2f,%9.2f,%9.2f'
+
+# Region of the EM tracker the distortion polynomial is defined over (mm). Points outside it are distorted like the
+# nearest point on its boundary.
+EM_BOX = (np.full(3, -300.0), np.full(3, 600.0))
+
+# Number of points the distortion is evaluated for at once, bounding the size of the Bernstein matrix
+DISTORT_BLOCK = 16384
+
+
+def random_rotations(rng, n, max_angle=None):
+    """
+    Random rotation matrices.
+    :param rng: Random number generator
+    :param n: Number of rotations
+    :param max_angle: Largest rotation angle in radians about a random axis, or None for rotations distributed
+                      uniformly over all orientations
+
+    :return: Rotation matrices, n x 3 x 3
+    :rtype: numpy.array
+    """
+    if max_angle is None:
+        q = rng.normal(size=(n, 4))
+    else:
+        axes = rng.normal(size=(n, 3))
+        angles = rng.uniform(-max_angle, max_angle, n)
+        q = np.concatenate((np.cos(angles / 2)[:, np.newaxis],
+                            np.sin(angles / 2)[:, np.newaxis] * axes / np.linalg.norm(axes, axis=1, keepdims=True)),
+                           axis=1)
+    return quaternion_to_rotation(q / np.linalg.norm(q, axis=1, keepdims=True))
+
+
+class GroundTruth:
+    """
+    The geometry behind a synthetic dataset: marker positions in body coordinates, the pivot and CT registration
+    answers and the EM distortion. The EM distortion is a Bernstein polynomial of the given degree over EM_BOX (the
+    basis distortion_correction fits), adding up to `distortion` mm to each coordinate.
+    """
+    def __init__(self, seed=0, counts=None, distortion=1.0, noise=0.0, degree=5):
+        """
+        :param seed: Seed of every random choice, so a seed always gives the same dataset
+        :param counts: Marker counts replacing those of COUNTS, keyed like COUNTS
+        :param distortion: Largest displacement of the EM distortion per coordinate (mm), 0 for none
+        :param noise: Standard deviation of the Gaussian noise added to every tracker reading (mm)
+        :param degree: Degree of the distortion polynomial
+
+        :type seed: int
+        :type counts: dict
+        :type distortion: float
+        :type noise: float
+        :type degree: int
+        """
+        self.seed = seed
+        self.counts = dict(COUNTS, **(counts or {}))
+        self.noise = noise
+        self.degree = degree
+        rng = np.random.RandomState(seed)
+
+        # Calibration body, probes and CT fiducials in their own coordinates
+        self.d = rng.uniform(0, 150, (3, self.counts['d']))
+        self.a = rng.uniform(0, 150, (3, self.counts['a']))
+        self.c = rng.uniform(0, 200, (3, self.counts['c']))
+        self.g = rng.uniform(-50, 50, (3, self.counts['g']))
+        self.h = rng.uniform(-50, 50, (3, self.counts['h']))
+        self.b = rng.uniform(0, 150, (3, self.counts['b']))
+
+        # Probe tips in probe coordinates and the pivot dimples in EM tracker coordinates
+        self.em_tip = rng.uniform(-20, 20, 3) + np.array([0.0, 0.0, -120.0])
+        self.em_dimple = rng.uniform(100, 200, 3)
+        self.opt_tip = rng.uniform(-20, 20, 3) + np.array([0.0, 0.0, -120.0])
+        self.opt_dimple = rng.uniform(100, 200, 3)
+
+        # Nominal pose of the EM tracker in optical tracker coordinates
+        self.base_rotation = random_rotations(rng, 1)[0]
+        self.base_translation = rng.uniform(-200, 200, 3) + np.array([0.0, 0.0, -1500.0])
+
+        # Registration from EM tracker to CT coordinates
+        self.reg_rotation = random_rotations(rng, 1)[0]
+        self.reg_translation = rng.uniform(-100, 100, 3)
+
+        self.coefficients = rng.uniform(-distortion, distortion, ((degree + 1) ** 3, 3))
+
+    def rng(self, stream):
+        """
+        Random number generator of one output file, so the frame count of one file does not change the others.
+        :param stream: Name of the file, e.g. 'calreadings'
+        :rtype: numpy.random.RandomState
+        """
+        return np.random.RandomState([self.seed, sum(map(ord, stream))])
+
+    def distort(self, points):
+        """
+        EM tracker reading of true EM positions, without noise.
+        :param points: True positions, 3 x N or F x 3 x N
+
+        :return: Distorted positions with the shape of points
+        :rtype: numpy.array
+        """
+        rows = np.moveaxis(points, -2, -1).reshape((-1, 3))
+        lo, hi = EM_BOX
+        distorted = np.empty_like(rows)
+        for start in range(0, len(rows), DISTORT_BLOCK):
+            block = rows[start:start + DISTORT_BLOCK]
+            u = np.clip((block - lo) / (hi - lo), 0.0, 1.0)
+            distorted[start:start + DISTORT_BLOCK] = block + d.normalized_matrix(u, self.degree).dot(self.coefficients)
+        return np.moveaxis(distorted.reshape(np.moveaxis(points, -2, -1).shape), -1, -2)
+
+    def measure(self, points, rng, em=False):
+        """
+        Tracker reading of true positions: distorted for the EM tracker, then with noise added.
+        :rtype: numpy.array
+        """
+        if em:
+            points = self.distort(points)
+        if self.noise:
+            points = points + rng.normal(scale=self.noise, size=points.shape)
+        return points
+
+    def base_poses(self, rng, n):
+        """
+        Poses of the EM tracker in optical tracker coordinates, jittering about the nominal pose between frames.
+        :return: Rotations n x 3 x 3 and translations n x 3 x 1
+        """
+        rotations = random_rotations(rng, n, np.radians(2)) @ self.base_rotation
+        translations = self.base_translation[:, np.newaxis] + rng.uniform(-5, 5, (n, 3, 1))
+        return rotations, translations
+
+    def probe_poses(self, rng, tips, probe_tip):
+        """
+        Probe poses placing the probe tip at given EM positions, tilted up to 30 degrees from upright.
+        :param tips: EM positions of the tip, n x 3
+        :param probe_tip: Tip in probe coordinates (3,)
+
+        :return: Rotations n x 3 x 3 and translations n x 3 x 1
+        """
+        rotations = random_rotations(rng, len(tips), np.radians(30))
+        translations = (tips - rotations @ probe_tip)[:, :, np.newaxis]
+        return rotations, translations
+
+    def to_ct(self, points):
+        """CT coordinates of EM tracker positions, N x 3"""
+        return points.dot(self.reg_rotation.T) + self.reg_translation
+
+    def save(self, path):
+        """
+        Writes the ground truth to a .npz file, e.g. to check a pipeline's distortion fit or registration against.
+        :param path: File name/path to write to
+        """
+        np.savez(path, seed=self.seed, noise=self.noise, degree=self.degree, em_box=np.stack(EM_BOX),
+                 coefficients=self.coefficients, d=self.d, a=self.a, c=self.c, g=self.g, h=self.h, b=self.b,
+                 em_tip=self.em_tip, em_dimple=self.em_dimple, opt_tip=self.opt_tip, opt_dimple=self.opt_dimple,
+                 reg_rotation=self.reg_rotation, reg_translation=self.reg_translation,
+                 **{'count_' + key: value for key, value in self.counts.items()})
+
+
+def chunks(n, chunk):
+    """Sizes of the chunks n frames are generated in"""
+    return [min(chunk, n - start) for start in range(0, n, chunk)]
+
+
+def stack_rows(*groups):
+    """Rows of a data file for a chunk of frames, from marker groups of shape F x 3 x N_i in file order"""
+    return np.concatenate(groups, axis=2).transpose(0, 2, 1).reshape((-1, 3))
+
+
+def calreadings(truth, n_frames, chunk):
+    """
+    Generates the calibration readings in chunks of frames.
+    :return: Generator of the file rows of each chunk and the true EM positions of its C markers (the expected C of
+             output1, F x 3 x N_C)
+    """
+    rng = truth.rng('calreadings')
+    for n in chunks(n_frames, chunk):
+        base_r, base_t = truth.base_poses(rng, n)
+        body_r = random_rotations(rng, n)
+        body_t = rng.uniform(0, 300, (n, 3, 1))
+
+        c_true = body_r @ truth.c + body_t
+        D = truth.measure(base_r @ truth.d + base_t, rng)
+        A = truth.measure(base_r @ (body_r @ truth.a + body_t) + base_t, rng)
+        C = truth.measure(c_true, rng, em=True)
+        yield stack_rows(D, A, C), c_true
+
+
+def empivot(truth, n_frames, chunk, stream='empivot', tips=None):
+    """
+    Generates EM probe readings in chunks of frames: pivoting about the EM dimple, or with the tip at given EM
+    positions.
+    :param stream: Name of the random stream
+    :param tips: EM tip positions, n_frames x 3, or None to pivot about the dimple
+    :return: Generator of the file rows of each chunk
+    """
+    rng = truth.rng(stream)
+    start = 0
+    for n in chunks(n_frames, chunk):
+        chunk_tips = np.tile(truth.em_dimple, (n, 1)) if tips is None else tips[start:start + n]
+        rotations, translations = truth.probe_poses(rng, chunk_tips, truth.em_tip)
+        yield stack_rows(truth.measure(rotations @ truth.g + translations, rng, em=True))
+        start += n
+
+
+def optpivot(truth, n_frames, chunk):
+    """
+    Generates optical pivot readings in chunks of frames, pivoting about the optical dimple.
+    :return: Generator of the file rows of each chunk
+    """
+    rng = truth.rng('optpivot')
+    for n in chunks(n_frames, chunk):
+        base_r, base_t = truth.base_poses(rng, n)
+        rotations, translations = truth.probe_poses(rng, np.tile(truth.opt_dimple, (n, 1)), truth.opt_tip)
+        D = truth.measure(base_r @ truth.d + base_t, rng)
+        H = truth.measure(base_r @ (rotations @ truth.h + translations) + base_t, rng)
+        yield stack_rows(D, H)
+
+
+def write_block(f, rows):
+    """
+    Writes rows in the format ROW. The whole block is formatted by one string operation, which is several times
+    faster than numpy.savetxt's loop over the rows.
+    :param f: Open file
+    :param rows: N x 3 array of rows
+    :return: None
+    """
+    f.write(((ROW + '\n') * len(rows)) % tuple(rows.ravel().tolist()))
+
+
+def write_rows(path, header, blocks):
+    """
+    Writes a data file from a header line and blocks of rows.
+    :param path: File name/path to write to
+    :param header: The header line, without the line break
+    :param blocks: Iterable of N x 3 arrays of rows
+    :return: None
+    """
+    with open(path, 'w') as f:
+        f.write(header + '\n')
+        for block in blocks:
+            write_block(f, block)
+
+
+def generate(outdir, prefix, frames=None, counts=None, distortion=1.0, noise=0.0, seed=0, layout='pa2',
+             chunk=10000):
+    """
+    Writes a synthetic dataset with its answer files and ground truth. Frames are generated and written in chunks,
+    so memory use does not grow with the frame counts.
+    :param outdir: Directory to write the files to
+    :param prefix: Dataset prefix, e.g. 'pa2-synthetic-a'
+    :param frames: Frame counts replacing those of FRAMES, keyed like FRAMES
+    :param counts: Marker counts replacing those of COUNTS, keyed like COUNTS
+    :param distortion: Largest displacement of the EM distortion per coordinate (mm)
+    :param noise: Standard deviation of the tracker noise (mm)
+    :param seed: Random seed
+    :param layout: 'pa2' for every PA2 file, or 'pa1' for the PA1 file names and files only
+    :param chunk: Number of frames generated at once
+
+    :return: The ground truth of the dataset
+    :rtype: GroundTruth
+    """
+    frames = dict(FRAMES, **(frames or {}))
+    names = {key: os.path.join(outdir, name.format(prefix)) for key, name in LAYOUTS[layout].items()}
+    truth = GroundTruth(seed, counts, distortion, noise)
+    n = truth.counts
+    os.makedirs(outdir, exist_ok=True)
+
+    def title(key):
+        return os.path.basename(names[key])
+
+    write_rows(names['calbody'], '{0}, {1}, {2}, {3}'.format(n['d'], n['a'], n['c'], title('calbody')),
+               [truth.d.T, truth.a.T, truth.c.T])
+
+    # The answers to the pivots are known up front, so output1 is written alongside the calibration readings
+    with open(names['calreadings'], 'w') as readings, open(names['output1'], 'w') as output1:
+        readings.write('{0}, {1}, {2}, {3}, {4}\n'.format(n['d'], n['a'], n['c'], frames['calreadings'],
+                                                         title('calreadings')))
+        output1.write('{0}, {1}, {2}\n'.format(n['c'], frames['calreadings'], title('output1')))
+        write_block(output1, np.stack((truth.em_dimple, truth.opt_dimple)))
+        for rows, c_true in calreadings(truth, frames['calreadings'], chunk):
+            write_block(readings, rows)
+            write_block(output1, c_true.transpose(0, 2, 1).reshape((-1, 3)))
+
+    write_rows(names['empivot'], '{0}, {1}, {2}'.format(n['g'], frames['empivot'], title('empivot')),
+               empivot(truth, frames['empivot'], chunk))
+    write_rows(names['optpivot'], '{0}, {1}, {2}, {3}'.format(n['d'], n['h'], frames['optpivot'], title('optpivot')),
+               optpivot(truth, frames['optpivot'], chunk))
+
+    if layout == 'pa2':
+        write_rows(names['ct-fiducials'], '{0},{1}'.format(n['b'], title('ct-fiducials')), [truth.b.T])
+
+        # The probe touches each fiducial, whose EM position is its CT position mapped back through the registration
+        fiducials = (truth.b.T - truth.reg_translation).dot(truth.reg_rotation)
+        write_rows(names['em-fiducials'], '{0},{1},{2}'.format(n['g'], n['b'], title('em-fiducials')),
+                   empivot(truth, n['b'], chunk, 'em-fiducials', fiducials))
+
+        # Navigation tips within the calibrated region; their CT positions are the answers of output2
+        tips = truth.rng('nav-tips').uniform(0, 300, (frames['nav'], 3))
+        write_rows(names['nav'], '{0},{1},{2}'.format(n['g'], frames['nav'], title('nav')),
+                   empivot(truth, frames['nav'], chunk, 'nav', tips))
+        write_rows(names['output2'], '{0}, {1}'.format(frames['nav'], title('output2')), [truth.to_ct(tips)])
+
+    truth.save(os.path.join(outdir, prefix + '-truth.npz'))
+    return truth
+
+
+def parse_counts(items, allowed):
+    """Parses repeated key=value options into a dict of ints"""
+    counts = {}
+    for item in items:
+        key, value = item.split('=')
+        if key not in allowed:
+            raise ValueError('unknown key {0}; expected one of {1}'.format(key, ', '.join(allowed)))
+        counts[key] = int(value)
+    return counts
+
+
+def main():
+    """
+    Command line entry point, e.g.
+        python synthetic.py synthetic --prefix pa2-synthetic-a --frames calreadings=100000 --count c=64 --noise 0.1
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Write a synthetic tracker dataset with known ground truth')
+    parser.add_argument('outdir', help='directory to write the files to')
+    parser.add_argument('--prefix', default='pa2-synthetic-a', help='dataset prefix')
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default='pa2', help='PA1 or PA2 file set')
+    parser.add_argument('--frames', action='append', default=[], metavar='FILE=N',
+                        help='frame count of one of {0}; may be repeated'.format(', '.join(FRAMES)))
+    parser.add_argument('--count', action='append', default=[], metavar='GROUP=N',
+                        help='marker count of one of {0}; may be repeated'.format(', '.join(COUNTS)))
+    parser.add_argument('--distortion', type=float, default=1.0, help='largest EM distortion per coordinate (mm)')
+    parser.add_argument('--noise', type=float, default=0.0, help='standard deviation of tracker noise (mm)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--chunk', type=int, default=10000, help='frames generated at once')
+    args = parser.parse_args()
+
+    try:
+        frames = parse_counts(args.frames, FRAMES)
+        counts = parse_counts(args.count, COUNTS)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    generate(args.outdir, args.prefix, frames, counts, args.distortion, args.noise, args.seed, args.layout,
+             args.chunk)
+    print('Wrote {0} to {1} in {2:.1f} s'.format(args.prefix, args.outdir, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
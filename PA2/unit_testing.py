@@ -1,8 +1,18 @@
+import os
+import asyncio
+import json
 import numpy as np
 import scipy.linalg as lin_alg
 import PointCloud as pc
-import pivot_cal as pivot
+import Frame_Transformation as ft
+import pivot_calibration as pivot
 import distortion_correction as distort
+import nav_service
+import registration
+from geometry.transforms import quaternion_to_rotation, rotation_to_quaternion
+
+# Debug datasets the file based tests run on
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'PA12 - Student Data')
 
 
 def test_register(tolerance=1e-4):
@@ -49,11 +59,100 @@ def test_register(tolerance=1e-4):
     print('\nRegistration test passed!')
 
 
-def test_pivot_cal(empivot, tolerance=1e-2):
+def test_registration_template(tolerance=1e-10):
+    """
+    Registers a fixed model to noisy rotated and translated copies of it with RegistrationTemplate, one frame at a
+    time and as a batch with every backend, and checks the results against PointCloud.register.
+
+    :param tolerance: Allowed deviation between the rotations and translations
+    :type tolerance: float
+
+    :return: None
+    """
+    print('\nRunning registration template test...')
+    rng = np.random.RandomState(0)
+    model = rng.uniform(-50, 50, (3, 8))
+    targets = np.stack([generate_rotation_matrix(rng.uniform(0, 2 * np.pi, 3)).dot(model) for _ in range(10)])
+    targets += rng.uniform(-100, 100, (10, 3, 1)) + rng.normal(scale=0.5, size=targets.shape)
+    expected = [pc.PointCloud(model).register(pc.PointCloud(target)) for target in targets]
+
+    template = pc.RegistrationTemplate(pc.PointCloud(model))
+    for target, frame in zip(targets, expected):
+        computed = template.register(pc.PointCloud(target))
+        assert np.all(np.abs(computed.r - frame.r) <= tolerance)
+        assert np.all(np.abs(computed.p - frame.p) <= tolerance)
+
+    for backend in registration.BACKENDS:
+        print('\nChecking the {0} backend...'.format(backend))
+        rotations, translations = pc.RegistrationTemplate(model, backend).register_batch(targets)
+        for rotation, translation, frame in zip(rotations, translations, expected):
+            assert np.all(np.abs(rotation - frame.r) <= tolerance)
+            assert np.all(np.abs(translation - frame.p) <= tolerance)
+    print('\nRegistration template test passed!')
+
+
+def test_quaternion_round_trip(tolerance=1e-12):
+    """
+    Converts random rotations, the identity and half turns about several axes to quaternions and back, and checks that
+    the rotations are recovered and the quaternions are unit length with a non-negative scalar part.
+
+    :param tolerance: Allowed deviation of the recovered rotations
+    :type tolerance: float
+
+    :return: None
+    """
+    print('\nRunning quaternion round trip test...')
+    rng = np.random.RandomState(0)
+    rotations = [generate_rotation_matrix(rng.uniform(0, 2 * np.pi, 3)) for _ in range(100)]
+    rotations += [np.eye(3)] + [registration.rotation_about(axis, np.pi) for axis in np.eye(3)]
+    rotations += [registration.rotation_about(rng.normal(size=3), np.pi - 1e-9) for _ in range(10)]
+    rotations = np.stack(rotations)
+
+    quaternions = rotation_to_quaternion(rotations)
+    assert np.all(np.abs(np.linalg.norm(quaternions, axis=1) - 1) <= tolerance)
+    assert np.all(quaternions[:, 0] >= 0)
+    print('\nLargest rotation error: {0:.2e}'.format(np.max(np.abs(quaternion_to_rotation(quaternions) - rotations))))
+    assert np.all(np.abs(quaternion_to_rotation(quaternions) - rotations) <= tolerance)
+    print('\nQuaternion round trip test passed!')
+
+
+def test_collapse(tolerance=1e-9):
+    """
+    Collapses a chain of a single frame, a batch of frames, a quaternion batch and another single frame, and checks
+    that applying the collapsed chain matches composing the frames one by one with Frame.compose and applying them.
+
+    :param tolerance: Allowed deviation of the transformed points
+    :type tolerance: float
+
+    :return: None
+    """
+    print('\nRunning transformation chain collapse test...')
+    rng = np.random.RandomState(0)
+
+    def random_frame():
+        return ft.Frame(generate_rotation_matrix(rng.uniform(0, 2 * np.pi, 3)), rng.uniform(-100, 100, (3, 1)))
+
+    F_reg = random_frame()
+    batch = ft.FrameBatch.from_frames([random_frame() for _ in range(5)])
+    quaternion_frames = [random_frame() for _ in range(5)]
+    quaternions = ft.QuaternionBatch.from_frames(ft.FrameBatch.from_frames(quaternion_frames))
+    offset = random_frame()
+    points = rng.uniform(-50, 50, (3, 7))
+
+    collapsed = ft.collapse(F_reg, batch, quaternions, offset)
+    assert len(collapsed) == 5
+    transformed = collapsed.apply(points)
+    for i in range(5):
+        frame = F_reg.compose(batch[i]).compose(quaternion_frames[i]).compose(offset)
+        assert np.all(np.abs(transformed[i] - frame.apply(points)) <= tolerance)
+    print('\nTransformation chain collapse test passed!')
+
+
+def test_pivot_cal(empivot=os.path.join(DATA_DIR, 'pa2-debug-a-empivot.txt'), tolerance=1e-2):
     """
     Validates pivot calibration by verifying transformation consistency.
 
-    :param empivot: Path to the empivot.txt file with EM tracker data
+    :param empivot: Path to the empivot.txt file with EM tracker data (default: debug dataset a)
     :param tolerance: Allowed error margin between expected and calculated values
     :type empivot: str
     :type tolerance: float
@@ -61,7 +160,7 @@ def test_pivot_cal(empivot, tolerance=1e-2):
     :return: None
     """
     print('\nRunning pivot calibration test...')
-    marker_frames = pc.fromfile(empivot)
+    marker_frames = pc.inp_file(empivot)
 
     print('\nExtracted marker points:')
     for i, frame in enumerate(marker_frames):
@@ -83,6 +182,69 @@ def test_pivot_cal(empivot, tolerance=1e-2):
     print('\nPivot calibration test passed!')
 
 
+def test_pivot_calibrator(tolerance=1e-8):
+    """
+    Feeds the frames of an empivot file to PivotCalibrator one at a time and checks the final estimate against
+    pivot_batched and against lstsq on the stacked pivot system, and its residual RMS against that of the stacked
+    system.
+
+    :param tolerance: Allowed difference between the tip positions
+    :type tolerance: float
+
+    :return: None
+    """
+    print('\nRunning streaming pivot calibration test...')
+    markers = np.stack([frame[0].data for frame in pc.inp_file(os.path.join(DATA_DIR, 'pa2-debug-a-empivot.txt'))])
+    reference = markers[0] - np.mean(markers[0], axis=0)
+
+    calibrator = pivot.PivotCalibrator(reference)
+    for frame in markers:
+        pointer_tip, tracker_tip, rms, condition = calibrator.add_frame(frame)
+    print('\nStreaming tips:\n', pointer_tip, tracker_tip, '\nRMS:', rms, '\nCondition:', condition)
+
+    batched = pivot.pivot_batched(markers, reference)
+    assert np.all(np.abs(np.concatenate(batched) - np.concatenate((pointer_tip, tracker_tip))) <= tolerance)
+
+    rotations, translations = pc.RegistrationTemplate(reference).register_batch(markers)
+    A = np.concatenate([np.hstack((rotation, -np.eye(3))) for rotation in rotations])
+    b = -translations.ravel()
+    solution = np.linalg.lstsq(A, b, rcond=None)[0]
+    print('\nStacked system tips:\n', solution[:3], solution[3:])
+    assert np.all(np.abs(solution - np.concatenate((pointer_tip, tracker_tip))) <= tolerance)
+
+    # The RMS from the normal equations is only accurate to ~sqrt(eps) times the translations (see PivotCalibrator)
+    assert np.abs(rms - np.sqrt(np.mean((A.dot(solution) - b) ** 2))) <= 1e-6
+    print('\nStreaming pivot calibration test passed!')
+
+
+def test_pivot_calibrator_converged():
+    """
+    Checks the three stopping criteria of PivotCalibrator.converged: the number of frames, the residual RMS, and the
+    condition number, which stays huge while every pose has the same orientation.
+
+    :return: None
+    """
+    print('\nRunning pivot calibration convergence test...')
+    markers = np.stack([frame[0].data for frame in pc.inp_file(os.path.join(DATA_DIR, 'pa2-debug-a-empivot.txt'))])
+    reference = markers[0] - np.mean(markers[0], axis=0)
+
+    calibrator = pivot.PivotCalibrator(reference)
+    for count, frame in enumerate(markers[:3], 1):
+        calibrator.add_frame(frame)
+        assert calibrator.converged(np.inf, np.inf) == (count >= 3)
+    print('\nRMS after 3 frames:', calibrator.rms, '\nCondition:', calibrator.condition)
+    assert calibrator.converged(2 * calibrator.rms, 2 * calibrator.condition)
+    assert not calibrator.converged(calibrator.rms / 2, 2 * calibrator.condition)
+    assert not calibrator.converged(2 * calibrator.rms, calibrator.condition / 2)
+
+    still = pivot.PivotCalibrator(reference)
+    for _ in range(5):
+        still.add_frame(markers[0])
+    print('\nCondition with one orientation:', still.condition)
+    assert not still.converged(np.inf)
+    print('\nPivot calibration convergence test passed!')
+
+
 def test_normalize():
     """
     Validates normalization of random data between 0 and 1.
@@ -92,7 +254,7 @@ def test_normalize():
     print('\nRandom data:\n', random_data)
 
     calculated_qs = distort.calc_q(random_data, random_data)
-    normalized_data = distort.normalize(10, random_data, calculated_qs[0], calculated_qs[1])
+    normalized_data = distort.normalization(10, random_data, calculated_qs[0], calculated_qs[1])
 
     print('\nNormalized data:\n', normalized_data)
     within_bounds = np.all(normalized_data >= 0) and np.all(normalized_data <= 1)
@@ -105,11 +267,11 @@ def test_f():
     Validates the Bernstein polynomial matrix calculation for distortion correction.
     """
     print('Running Bernstein polynomial matrix test for distortion correction...')
-    ones_matrix = np.ones((3, 10))
+    ones_matrix = np.ones((10, 3))
     print('\nInput matrix (ones):\n', ones_matrix)
 
-    poly_matrix = distort.f_matrix(ones_matrix, 5)
-    expected_shape = (3, 6 ** 3)
+    poly_matrix = distort.normalized_matrix(ones_matrix, 5)
+    expected_shape = (10, 6 ** 3)
     print('\nExpected shape:', expected_shape)
     print('Computed shape:', poly_matrix.shape)
     assert expected_shape == poly_matrix.shape
@@ -139,15 +301,120 @@ def test_solve_fcu(tolerance=1e-4):
     observed_normalized, true_normalized = normalize_data(observed_data, true_data)
 
     print('\nGenerating Bernstein polynomial matrix...')
-    polynomial_matrix = distort.f_matrix(observed_normalized, 5)
+    polynomial_matrix = distort.normalized_matrix(observed_normalized, 5)
 
     print('\nSolving for coefficient matrix...')
-    coefficients = distort.solve_fcu(polynomial_matrix, true_normalized)
+    coefficients = distort.solve_linear_sys(polynomial_matrix, true_normalized)
     distortion_corrected = np.all(np.abs(polynomial_matrix.dot(coefficients) - true_normalized) <= tolerance)
     assert distortion_corrected
     print('\nDistortion correction test passed!')
 
 
+def test_nav_service_malformed_frame():
+    """
+    Sends the navigation service a frame with too few coordinates, then a line that is not JSON, then a valid frame,
+    and checks that each one is answered: the first two with an error, the last with a tip position. Lines that are not
+    JSON are answered by the reader straight away, so the answers are matched by seq rather than by order.
+
+    :return: None
+    """
+    print('\nRunning navigation service malformed frame test...')
+    files = [os.path.join(DATA_DIR, 'pa2-debug-a-{0}.txt'.format(name))
+             for name in ('calbody', 'calreadings', 'empivot', 'ct-fiducials', 'em-fiducialss')]
+    model = nav_service.NavigationModel.fit(*files)
+    frames, offsets = pc.read_frames(os.path.join(DATA_DIR, 'pa2-debug-a-EM-nav.txt'))
+    markers = frames[0, offsets[0]:offsets[1]]
+
+    async def exchange():
+        server = await asyncio.start_server(nav_service.NavigationService(model).handle, '127.0.0.1', 0)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(b'{"seq": 0, "markers": [[1, 2]]}\n')
+            writer.write(b'not json\n')
+            writer.write((json.dumps({'seq': 1, 'markers': markers.tolist()}) + '\n').encode())
+            writer.write_eof()
+            answers = [json.loads(line) for line in (await asyncio.wait_for(reader.read(), 10)).splitlines()]
+            writer.close()
+            await writer.wait_closed()
+        return answers
+
+    answers = asyncio.run(exchange())
+    print('\nAnswers:\n', answers)
+    assert len(answers) == 3
+    by_seq = {answer['seq']: answer for answer in answers}
+    assert 'error' in by_seq[0] and 'error' in by_seq[None]
+    assert np.allclose(by_seq[1]['tip'], model.locate(markers.T))
+    print('\nNavigation service malformed frame test passed!')
+
+
+def test_nav_replay_error_answers():
+    """
+    Replays an EM-nav file against a service that also answers with errors that match no frame (seq None, as for a line
+    that is not JSON) or a seq that was never sent, and checks that replay reports them as error rows and still
+    collects the answer of every frame.
+
+    :return: None
+    """
+    print('\nRunning navigation replay error answer test...')
+    emnav = os.path.join(DATA_DIR, 'pa2-debug-a-EM-nav.txt')
+    frames, offsets = pc.read_frames(emnav)
+
+    async def handle(reader, writer):
+        writer.write(b'{"seq": null, "error": "invalid JSON"}\n')
+        writer.write(b'{"seq": -1}\n')
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            writer.write((json.dumps({'seq': json.loads(line)['seq'], 'tip': [0, 0, 0]}) + '\n').encode())
+        writer.close()
+
+    async def exchange():
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        async with server:
+            return await asyncio.wait_for(nav_service.replay(emnav, *server.sockets[0].getsockname()[:2]), 10)
+
+    answers = asyncio.run(exchange())
+    errors = [answer for answer in answers if 'error' in answer]
+    print('\nError answers:\n', errors)
+    assert [answer['seq'] for answer in errors] == [None, -1]
+    assert all(answer['latency'] is None for answer in errors)
+    assert sorted(answer['seq'] for answer in answers if 'tip' in answer) == list(range(len(frames)))
+    print('\nNavigation replay error answer test passed!')
+
+
+def test_distortion_fitter(tolerance=1e-8):
+    """
+    Fits random distorted frames with DistortionFitter, one frame at a time, and checks the coefficients against
+    solve_linear_sys on the stacked Bernstein matrix, for several block sizes of the QR updates.
+
+    :param tolerance: Allowed deviation between the coefficients
+    :type tolerance: float
+
+    :return: None
+    """
+    print('\nRunning incremental distortion fit test...')
+    rng = np.random.RandomState(0)
+    expected = [rng.uniform(-100, 100, (3, 27)) for _ in range(20)]
+    measured = [frame + 1e-4 * frame ** 2 + rng.normal(scale=0.1, size=frame.shape) for frame in expected]
+    q_min, q_max, q_star_min, q_star_max = distort.calc_q(np.hstack(measured), np.hstack(expected))
+
+    F = np.vstack([distort.normalized_matrix(distort.normalization(27, frame, q_min, q_max), 5) for frame in measured])
+    U = np.vstack([distort.normalization(27, frame, q_star_min, q_star_max) for frame in expected])
+    coefficients = distort.solve_linear_sys(F, U)
+
+    for block_rows in (1, 100, 1024):
+        fitter = distort.DistortionFitter(q_min, q_max, q_star_min, q_star_max, 5, block_rows)
+        for c, c_exp in zip(measured, expected):
+            fitter.add_frame(c, c_exp)
+        fitted = fitter.solve()
+        print('\nblock_rows={0}: largest coefficient difference {1:.2e}'.format(
+            block_rows, np.max(np.abs(fitted - coefficients))))
+        assert fitter.n_points == F.shape[0]
+        assert np.all(np.abs(fitted - coefficients) <= tolerance)
+    print('\nIncremental distortion fit test passed!')
+
+
 def generate_rotation_matrix(angles):
     """
     Helper function to generate a 3D rotation matrix.
@@ -170,7 +437,8 @@ def normalize_data(observed, ground_truth):
 
     :param observed: Observed data
     :param ground_truth: Ground truth data
-    :return: Normalized observed and ground truth data
+    :return: Normalized observed and ground truth data, N x 3 each
     """
-    q_obs, q_true = distort.calc_q(observed, ground_truth)
-    return distort.normalize(10, observed, q_obs[0], q_obs[1]), distort.normalize(10, ground_truth, q_true[2], q_true[3])
+    q_min, q_max, q_star_min, q_star_max = distort.calc_q(observed, ground_truth)
+    return (distort.normalization(observed.shape[1], observed, q_min, q_max),
+            distort.normalization(ground_truth.shape[1], ground_truth, q_star_min, q_star_max))
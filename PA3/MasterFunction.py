@@ -1,14 +1,35 @@
 # Import necessary modules and functions
+import argparse
 import numpy as np
 from computedk import compute_dk
 from simple import closest_point_simple
 from sorted import closest_point_sorted  # Import the sorted ICP algorithm
+from search_stats import SearchStats, profile_queries
+from pipeline import stream_closest_points
 
-def master_function():
+def print_frames(sk, ck, diff, start=0):
+    """
+    Prints the sample point, closest point and difference of each frame.
+
+    :param start: Index of the first frame, for numbering frames of a block.
+    """
+    for i in range(sk.shape[1]):
+        print('Frame {}:'.format(start + i + 1))
+        print('Sample Point (sk): {:.4f}, {:.4f}, {:.4f}'.format(*sk[:, i]))
+        print('Closest Point (ck): {:.4f}, {:.4f}, {:.4f}'.format(*ck[:, i]))
+        print('Difference (diff): {:.4f}'.format(diff[i]))
+        print('-----------------------------')
+
+def master_function(show_stats=False, profile=None, chunk_size=None):
     """
     Master function to control the other functions. It computes the tip coordinates,
     finds the closest point on the mesh using both simple and sorted ICP algorithms,
     computes differences, and prints the results.
+
+    :param show_stats: Print the search counters and parse/build/query times of each algorithm.
+    :param profile: Prefix for cProfile dumps of each search (<profile>-simple.prof, <profile>-sorted.prof).
+    :param chunk_size: Stream the readings through compute_dk and each search this many frames at a time, printing
+                       each block's results as soon as it is searched, instead of computing every dk first.
     """
     # Get file locations
     bodyA = "PADATA/Problem3-BodyA.txt"
@@ -18,6 +39,21 @@ def master_function():
     output = "PADATA/PA3-B-Debug-Output.txt"
     output_results = "PADATA/PA4-J-Output.txt"
 
+    stats_simple, stats_sorted = (SearchStats(), SearchStats()) if show_stats else (None, None)
+
+    if chunk_size:
+        for title, engine, stats in (("Results using Simple ICP Algorithm:", 'simple', stats_simple),
+                                     ("\nResults using Sorted ICP Algorithm:", 'sorted', stats_sorted)):
+            print(title)
+            n_frames = 0
+            for dk, d, c in stream_closest_points(bodyA, bodyB, sampleReadings, meshFile, engine, chunk_size, stats):
+                print_frames(dk, c, d, n_frames)
+                n_frames += dk.shape[1]
+        if show_stats:
+            print('\nSimple search: {0}'.format(stats_simple))
+            print('Sorted search: {0}'.format(stats_sorted))
+        return
+
     # Compute dk
     dk = compute_dk(bodyA, bodyB, sampleReadings)
 
@@ -26,36 +62,42 @@ def master_function():
         dk = dk.reshape(3, -1)
 
     # Find closest points using simple ICP algorithm
-    d_simple, c_simple = closest_point_simple(meshFile, dk)
+    if profile:
+        d_simple, c_simple = profile_queries(closest_point_simple, meshFile, dk, stats_simple,
+                                             path=profile + '-simple.prof')
+    else:
+        d_simple, c_simple = closest_point_simple(meshFile, dk, stats_simple)
     diff_simple = d_simple  # Distance between sample points and closest points
     sk_simple = dk  # Sample points
     ck_simple = c_simple  # Closest points
 
     # Find closest points using sorted ICP algorithm
-    d_sorted, c_sorted = closest_point_sorted(meshFile, dk)
+    if profile:
+        d_sorted, c_sorted = profile_queries(closest_point_sorted, meshFile, dk, stats_sorted,
+                                             path=profile + '-sorted.prof')
+    else:
+        d_sorted, c_sorted = closest_point_sorted(meshFile, dk, stats_sorted)
     diff_sorted = d_sorted
     sk_sorted = dk
     ck_sorted = c_sorted
 
     # Print the results for simple ICP
     print("Results using Simple ICP Algorithm:")
-    n_frames = sk_simple.shape[1]
-    for i in range(n_frames):
-        print('Frame {}:'.format(i+1))
-        print('Sample Point (sk): {:.4f}, {:.4f}, {:.4f}'.format(*sk_simple[:, i]))
-        print('Closest Point (ck): {:.4f}, {:.4f}, {:.4f}'.format(*ck_simple[:, i]))
-        print('Difference (diff): {:.4f}'.format(diff_simple[i]))
-        print('-----------------------------')
+    print_frames(sk_simple, ck_simple, diff_simple)
 
     # Print the results for sorted ICP
     print("\nResults using Sorted ICP Algorithm:")
-    for i in range(n_frames):
-        print('Frame {}:'.format(i+1))
-        print('Sample Point (sk): {:.4f}, {:.4f}, {:.4f}'.format(*sk_sorted[:, i]))
-        print('Closest Point (ck): {:.4f}, {:.4f}, {:.4f}'.format(*ck_sorted[:, i]))
-        print('Difference (diff): {:.4f}'.format(diff_sorted[i]))
-        print('-----------------------------')
+    print_frames(sk_sorted, ck_sorted, diff_sorted)
+
+    if show_stats:
+        print('\nSimple search: {0}'.format(stats_simple))
+        print('Sorted search: {0}'.format(stats_sorted))
 
 if __name__ == "__main__":
-    master_function()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stats', action='store_true', help='print search counters and phase times')
+    parser.add_argument('--profile', help='dump cProfile stats of each search to <PROFILE>-simple/sorted.prof')
+    parser.add_argument('--chunk', type=int, help='stream the readings this many frames at a time')
+    args = parser.parse_args()
+    master_function(args.stats, args.profile, args.chunk)
 
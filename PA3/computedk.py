@@ -1,115 +1,171 @@
 # compute_dk.py
 import numpy as np
 import re
+from contextlib import closing
+from itertools import islice
 from pointcloud import PointCloud
 from frame import Frame
 
-def compute_dk(bodyA, bodyB, sampleReadings):
+def read_body(body):
     """
-    Calculates the pointer tip coordinates with respect to calibration body 'B' across different frames.
+    Reads a rigid body definition file.
+
+    :param body: Path to the body file.
+    :return: Tuple (D, P) with the marker positions as a PointCloud (3, n) and the tip position (3,).
     """
-    # Read data from bodyA
-    with open(bodyA, 'r') as fid:
-        x = fid.readline()
-        # Extract integer from the first line
-        na_match = re.match(r'(\d+)', x.strip())
-        if na_match:
-            na = int(na_match.group(1))
-        else:
-            raise ValueError(f"Cannot parse number of markers from line: {x}")
-        # Read 'na' lines of marker data
-        DA_data = np.array([np.fromstring(fid.readline().strip(), sep=' ') for _ in range(na)]).T
-        DA = PointCloud(DA_data)
-        # Read the next line for Pa
-        Pa_line = fid.readline()
-        while Pa_line.strip() == '':
-            Pa_line = fid.readline()
-        Pa = np.fromstring(Pa_line.strip(), sep=' ')
-
-    # Read data from bodyB
-    with open(bodyB, 'r') as fid:
+    with open(body, 'r') as fid:
         x = fid.readline()
         # Extract integer from the first line
-        nb_match = re.match(r'(\d+)', x.strip())
-        if nb_match:
-            nb = int(nb_match.group(1))
+        n_match = re.match(r'(\d+)', x.strip())
+        if n_match:
+            n = int(n_match.group(1))
         else:
             raise ValueError(f"Cannot parse number of markers from line: {x}")
-        # Read 'nb' lines of marker data
-        DB_data = np.array([np.fromstring(fid.readline().strip(), sep=' ') for _ in range(nb)]).T
-        DB = PointCloud(DB_data)
-        # Read the next line for Pb (not used here)
-        Pb_line = fid.readline()
-        while Pb_line.strip() == '':
-            Pb_line = fid.readline()
-        Pb = np.fromstring(Pb_line.strip(), sep=' ')
-
-    # Read sample readings
+        # Read 'n' lines of marker data
+        D = PointCloud(np.array([np.fromstring(fid.readline().strip(), sep=' ') for _ in range(n)]).T)
+        # Read the next line for the tip
+        P_line = fid.readline()
+        while P_line.strip() == '':
+            P_line = fid.readline()
+        P = np.fromstring(P_line.strip(), sep=' ')
+    return D, P
+
+def read_sample_frames(sampleReadings):
+    """
+    Reads every marker position of every frame of a sample readings file.
+
+    :param sampleReadings: Path to the sample readings file.
+    :return: Marker positions with shape (nf, ns, 3), in file order (A markers, B markers, then dummy markers).
+    """
     with open(sampleReadings, 'r') as fid:
-        x = fid.readline()
-        # Extract ns and nf from the first line
-        ns_nf = re.findall(r'\d+', x)
-        if len(ns_nf) >= 2:
-            ns, nf = map(int, ns_nf[:2])
-        else:
-            raise ValueError(f"Cannot parse ns and nf from line: {x}")
-        nd = ns - na - nb
-        da = np.zeros((3, na, nf))
-        db = np.zeros((3, nb, nf))
-        dummy = np.zeros((3, nd, nf))
-
-        for j in range(nf):
-            for i in range(na):
-                da_line = fid.readline()
-                da[:, i, j] = np.fromstring(da_line.strip(), sep=' ')
-            for i in range(nb):
-                db_line = fid.readline()
-                db[:, i, j] = np.fromstring(db_line.strip(), sep=' ')
-            for i in range(nd):
-                dummy_line = fid.readline()
-                dummy[:, i, j] = np.fromstring(dummy_line.strip(), sep=' ')
-
-    # Initialize dk
-    dk = np.zeros((3, nf))
-
-    # Compute transformations and dk
-    # for i in range(nf):
-    #     da_i = PointCloud(da[:, :, i])
-    #     db_i = PointCloud(db[:, :, i])
-
-    #     # Register da_i to DA to get F_A
-    #     F_A = da_i.register(DA)
-
-    #     # Register db_i to DB to get F_B
-    #     F_B = db_i.register(DB)
-
-    #     # Compute the inverse of F_B
-    #     F_B_inv = F_B.inv
-
-    #     # Compute the transformation from Body A to Body B
-    #     F = F_B_inv.compose(F_A)
-
-    #     # Apply the transformation to Pa
-    #     Pa_transformed = F.rotation @ Pa + F.translation
-    #     dk[:, i] = np.round(Pa_transformed, 2)
-
-        # Compute transformations and dk
-    for i in range(nf):
-        # Create PointCloud instances
-        da_i = PointCloud(da[:, :, i])
-        db_i = PointCloud(db[:, :, i])
-
-        # Register to find transformations
-        F_A = da_i.register(DA)
-        F_B = db_i.register(DB)
-
-        # Invert F_B
-        F_B_inv = F_B.inv
-
-        # Compute F_AB
-        F_AB = F_B_inv.compose(F_A)
-
-        # Transform Pa
-        dk[:, i] = F_AB.transform_point(Pa)
-
-    return dk
+        ns, nf = read_sample_header(fid, sampleReadings)
+
+        # Rows are comma separated
+        values = np.array(fid.read().replace(',', ' ').split(), dtype=float)
+    return values[:ns * nf * 3].reshape((nf, ns, 3))
+
+def read_sample_header(fid, sampleReadings):
+    """
+    Reads the header line of an open sample readings file.
+
+    :param fid: The open file.
+    :param sampleReadings: Path of the file, for the error message.
+    :return: Tuple (ns, nf) with the number of markers per frame and the number of frames.
+    """
+    x = fid.readline()
+    ns_nf = re.findall(r'\d+', x)
+    if len(ns_nf) < 2:
+        raise ValueError(f"Cannot parse ns and nf from line: {x} in {sampleReadings}")
+    return int(ns_nf[0]), int(ns_nf[1])
+
+def stream_sample_frames(sampleReadings, chunk_size):
+    """
+    Reads a sample readings file a block of frames at a time, so only one block is held in memory.
+
+    :param sampleReadings: Path to the sample readings file.
+    :param chunk_size: Number of frames per block, at least 1.
+    :return: Generator of marker positions with shape (n, ns, 3), n <= chunk_size, in file order.
+    """
+    # Checked here rather than in the generator, so a bad chunk_size fails on the call instead of the first block
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1, got {chunk_size}")
+    return _stream_sample_frames(sampleReadings, chunk_size)
+
+def _stream_sample_frames(sampleReadings, chunk_size):
+    """
+    Generator behind stream_sample_frames.
+    """
+    with open(sampleReadings, 'r') as fid:
+        ns, nf = read_sample_header(fid, sampleReadings)
+        remaining = nf
+        while remaining > 0:
+            n = min(chunk_size, remaining)
+            lines = list(islice(fid, n * ns))
+            if len(lines) < n * ns:
+                raise ValueError(f"{sampleReadings} ends after {nf - remaining + len(lines) // ns} of {nf} frames")
+            yield np.array(''.join(lines).replace(',', ' ').split(), dtype=float).reshape((n, ns, 3))
+            remaining -= n
+
+def read_sample_readings(sampleReadings, na, nb):
+    """
+    Reads the A and B body marker positions of every frame of a sample readings file.
+
+    :param sampleReadings: Path to the sample readings file.
+    :param na: Number of markers on body A.
+    :param nb: Number of markers on body B.
+    :return: Tuple (da, db) of marker positions with shapes (3, na, nf) and (3, nb, nf).
+    """
+    frames = read_sample_frames(sampleReadings).transpose(2, 1, 0)
+    return frames[:, :na, :], frames[:, na:na + nb, :]
+
+def compute_dk_frame(da_i, db_i, DA, DB, Pa):
+    """
+    Calculates the pointer tip coordinates with respect to body B for a single frame.
+
+    :param da_i: Body A marker positions in the frame (3, na).
+    :param db_i: Body B marker positions in the frame (3, nb).
+    :param DA: Body A markers in body coordinates (PointCloud).
+    :param DB: Body B markers in body coordinates (PointCloud).
+    :param Pa: Tip position in body A coordinates (3,).
+    :return: The tip position d_k (3,).
+    """
+    # Register the body definitions to the tracked markers, giving the body-to-tracker transformations
+    F_A = DA.register(PointCloud(da_i))
+    F_B = DB.register(PointCloud(db_i))
+
+    # Compute F_AB and transform Pa
+    F_AB = F_B.inv.compose(F_A)
+    return F_AB.transform_point(Pa)
+
+def compute_dk_block(frames, DA, DB, Pa):
+    """
+    Calculates the pointer tip coordinates with respect to body B for a block of frames, registering every frame of
+    the block at once.
+
+    :param frames: Marker positions of the block (n, ns, 3), as yielded by stream_sample_frames.
+    :param DA: Body A markers in body coordinates (PointCloud).
+    :param DB: Body B markers in body coordinates (PointCloud).
+    :param Pa: Tip position in body A coordinates (3,).
+    :return: The tip positions d_k (3, n).
+    """
+    na, nb = DA.data.shape[1], DB.data.shape[1]
+    markers = frames.transpose(0, 2, 1)
+    F_A = DA.register_batch(markers[:, :, :na], 'horn')
+    F_B = DB.register_batch(markers[:, :, na:na + nb], 'horn')
+    return F_B.inv.compose(F_A).apply(Pa).T
+
+def compute_dk_chunks(bodyA, bodyB, sampleReadings, chunk_size=1024):
+    """
+    Calculates the pointer tip coordinates with respect to body B a block of frames at a time, as the sample readings
+    are parsed. Memory use is bounded by one block however long the recording is, and each block can be searched
+    while the next one is read.
+
+    :param bodyA: Path to the body A file.
+    :param bodyB: Path to the body B file.
+    :param sampleReadings: Path to the sample readings file.
+    :param chunk_size: Number of frames per block, at least 1.
+    :return: Generator of tip positions d_k (3, n) for consecutive blocks of frames.
+    """
+    blocks = stream_sample_frames(sampleReadings, chunk_size)
+    return _compute_dk_chunks(bodyA, bodyB, blocks)
+
+def _compute_dk_chunks(bodyA, bodyB, blocks):
+    """
+    Generator behind compute_dk_chunks.
+    """
+    DA, Pa = read_body(bodyA)
+    DB, Pb = read_body(bodyB)
+    with closing(blocks):
+        for frames in blocks:
+            yield compute_dk_block(frames, DA, DB, Pa)
+
+def compute_dk(bodyA, bodyB, sampleReadings):
+    """
+    Calculates the pointer tip coordinates with respect to calibration body 'B' across different frames.
+
+    :return: The tip positions d_k (3, nf).
+    """
+    DA, Pa = read_body(bodyA)
+    DB, Pb = read_body(bodyB)
+    frames = read_sample_frames(sampleReadings)
+    return compute_dk_block(frames, DA, DB, Pa)
@@ -53,3 +53,103 @@ def distance_calculator_barycentric(p, q, r, a):
     distance = np.linalg.norm(a - closest_point)
 
     return distance, closest_point
+
+def distance_calculator_batch(p, q, r, a):
+    """
+    Calculates the closest point in or on many triangles to many points at once, pairing row i of each argument.
+    Each point is classified into the Voronoi region of its triangle (a vertex, an edge or the face) from the same
+    dot products as distance_calculator_barycentric, using whole-array operations only.
+
+    :param p: Vertex 1 of each triangle (n, 3).
+    :param q: Vertex 2 of each triangle (n, 3).
+    :param r: Vertex 3 of each triangle (n, 3).
+    :param a: Query point of each pair (n, 3).
+    :return: Tuple (distances (n,), closest_points (n, 3)). A degenerate triangle (collinear or coincident vertices)
+             is treated as the segment or point it reduces to.
+    """
+    pq = q - p
+    pr = r - p
+    pa = a - p
+    qa = a - q
+    ra = a - r
+
+    d1 = np.einsum('ij,ij->i', pq, pa)
+    d2 = np.einsum('ij,ij->i', pr, pa)
+    d3 = np.einsum('ij,ij->i', pq, qa)
+    d4 = np.einsum('ij,ij->i', pr, qa)
+    d5 = np.einsum('ij,ij->i', pq, ra)
+    d6 = np.einsum('ij,ij->i', pr, ra)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Face region first; every region tested after it takes precedence where it applies
+        denom = va + vb + vc
+        closest = p + pq * (vb / denom)[:, np.newaxis] + pr * (vc / denom)[:, np.newaxis]
+
+        # Edge qr
+        w = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        region = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+        closest[region] = (q + (r - q) * w[:, np.newaxis])[region]
+
+        # Edge pr
+        w = d2 / (d2 - d6)
+        region = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        closest[region] = (p + pr * w[:, np.newaxis])[region]
+
+        # Vertex r
+        region = (d6 >= 0) & (d5 <= d6)
+        closest[region] = r[region]
+
+        # Edge pq
+        v = d1 / (d1 - d3)
+        region = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        closest[region] = (p + pq * v[:, np.newaxis])[region]
+
+        # Vertex q
+        region = (d3 >= 0) & (d4 <= d3)
+        closest[region] = q[region]
+
+        # Vertex p
+        region = (d1 <= 0) & (d2 <= 0)
+        closest[region] = p[region]
+
+    # The regions above assume a triangle with an area; with (nearly) collinear vertices, the closest point is the
+    # closest of the three edges
+    degenerate = va + vb + vc <= 1e-12 * np.einsum('ij,ij->i', pq, pq) * np.einsum('ij,ij->i', pr, pr)
+    if np.any(degenerate):
+        closest[degenerate] = closest_on_edges(p[degenerate], q[degenerate], r[degenerate], a[degenerate])
+
+    distance = np.linalg.norm(a - closest, axis=1)
+    distance[np.isnan(distance)] = np.inf
+    return distance, closest
+
+def closest_on_segments(s, e, a):
+    """
+    Calculates the closest point on each of many segments to a point, pairing row i of each argument, as
+    projection_on_segment does for one. A segment of zero length gives its end point.
+
+    :param s: Start of each segment (n, 3).
+    :param e: End of each segment (n, 3).
+    :param a: Query point of each pair (n, 3).
+    :return: The closest points (n, 3).
+    """
+    se = e - s
+    length2 = np.einsum('ij,ij->i', se, se)
+    t = np.divide(np.einsum('ij,ij->i', a - s, se), length2, out=np.zeros_like(length2), where=length2 > 0)
+    return s + se * np.clip(t, 0, 1)[:, np.newaxis]
+
+def closest_on_edges(p, q, r, a):
+    """
+    Calculates the closest point on the edges of each of many triangles to a point, pairing row i of each argument.
+
+    :param p: Vertex 1 of each triangle (n, 3).
+    :param q: Vertex 2 of each triangle (n, 3).
+    :param r: Vertex 3 of each triangle (n, 3).
+    :param a: Query point of each pair (n, 3).
+    :return: The closest points (n, 3).
+    """
+    candidates = np.stack((closest_on_segments(p, q, a), closest_on_segments(q, r, a), closest_on_segments(r, p, a)))
+    best = np.argmin(np.linalg.norm(candidates - a, axis=2), axis=0)
+    return candidates[best, np.arange(len(a))]
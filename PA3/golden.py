@@ -0,0 +1,224 @@
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+import numpy as np
+from computedk import compute_dk
+from meshindex import MeshIndex
+from frame import Frame
+from mesh import read_mesh, read_modes, deform
+from pointcloud import PointCloud
+from search_stats import SearchStats, phase
+from simple import search_simple
+from sorted import build_tree, search_sorted
+
+# Largest acceptable error against the answer files, per field: the distance (mm) between our s_k and c_k points
+# and the answer's, and the absolute difference of the distances. The PA3/PA4 answers are printed to 2 decimals and
+# the readings of cases D-F carry noise, which leaves the exact search up to ~0.027 from the answers.
+TOLERANCES = {'d_k': 0.035, 'c_k': 0.035, 'distance': 0.035}
+
+# Engines that are not exact, with the tolerances they are held to instead. The sorted engine only tests the triangle
+# with the nearest centroid and misses by up to 0.93 mm; its limits leave ~25% headroom, so it fails only if it gets
+# worse.
+ENGINE_TOLERANCES = {'sorted': {'c_k': 1.2, 'distance': 1.2}}
+
+
+def run_sorted(DV, triangles, sk, stats=None):
+    """
+    Sorted search including the KDTree build, with the signature of search_simple.
+    """
+    with phase(stats, 'build'):
+        kd_tree = build_tree(DV, triangles)
+    return search_sorted(DV, triangles, kd_tree, sk, stats)
+
+
+def run_indexed(DV, triangles, sk, stats=None):
+    """
+    MeshIndex search including the index build, with the signature of search_simple.
+    """
+    with phase(stats, 'build'):
+        index = MeshIndex(DV, triangles)
+    with phase(stats, 'query'):
+        return index.query(sk, stats=stats)
+
+# Closest-point engines compared by the harness; each takes (DV, triangles, sk, stats) and returns (d, c)
+ENGINES = {'simple': search_simple, 'sorted': run_sorted, 'indexed': run_indexed}
+
+# Engines run when none are named: indexed is exact and takes well under a second for all cases. simple, also exact,
+# takes ~7 minutes, and sorted is approximate; both run with --engine.
+DEFAULT_ENGINES = ('indexed',)
+
+
+def tolerances_for(engine, tolerances=None):
+    """
+    The tolerance of each field for an engine: tolerances (default: TOLERANCES), then the engine's entry in
+    ENGINE_TOLERANCES.
+    """
+    merged = dict(tolerances or TOLERANCES)
+    merged.update(ENGINE_TOLERANCES.get(engine, {}))
+    return merged
+
+
+def find_cases(directory):
+    """
+    Finds every debug case with an answer file, e.g. (3, 'A') for PA3-A-Debug-Answer.txt.
+
+    :param directory: Directory containing the PA3/PA4/PA5 data files.
+    :return: Sorted list of (problem, letter) tuples.
+    """
+    cases = []
+    for path in glob.glob(os.path.join(directory, 'PA*-*-Debug-Answer.txt')):
+        match = re.match(r'PA(\d)-(\w)-Debug-Answer\.txt$', os.path.basename(path))
+        if match:
+            cases.append((int(match.group(1)), match.group(2)))
+    return sorted(cases)
+
+
+def read_answer(answerFile):
+    """
+    Reads an answer (or output) file.
+
+    :param answerFile: Path to the file.
+    :return: Tuple (s, c, d, weights) with the sample points s_k (3, n), the closest points c_k (3, n), their
+             distances (n,), and the mode weights of a deformable mesh (empty for PA3 and PA4).
+    """
+    with open(answerFile, 'r') as fid:
+        fields = fid.readline().split()
+        n, n_modes = int(fields[0]), int(fields[2])
+        weights = np.array(fid.readline().split(), dtype=float) if n_modes else np.zeros(0)
+        rows = np.array([fid.readline().split()[:7] for _ in range(n)], dtype=float)
+    return rows[:, :3].T, rows[:, 3:6].T, rows[:, 6], weights
+
+
+def case_files(directory, problem, letter):
+    """
+    Paths of the files of one case.
+
+    :return: Dictionary with the bodyA, bodyB, mesh, modes (PA5 only), readings and answer paths.
+    """
+    files = {
+        'bodyA': os.path.join(directory, 'Problem{0}-BodyA.txt'.format(problem)),
+        'bodyB': os.path.join(directory, 'Problem{0}-BodyB.txt'.format(problem)),
+        'mesh': os.path.join(directory, 'Problem{0}MeshFile.sur'.format(problem)),
+        'modes': None,
+        'readings': os.path.join(directory, 'PA{0}-{1}-Debug-SampleReadingsTest.txt'.format(problem, letter)),
+        'answer': os.path.join(directory, 'PA{0}-{1}-Debug-Answer.txt'.format(problem, letter)),
+    }
+    modes = os.path.join(directory, 'Problem{0}Modes.txt'.format(problem))
+    if os.path.exists(modes):
+        files['modes'] = modes
+    return files
+
+
+def check_case(directory, problem, letter, engines=None, tolerances=None):
+    """
+    Runs one case through compute_dk and each closest-point engine and compares the results with the answer file.
+
+    PA4 and PA5 find the registration F_reg of the bone by ICP, and PA5 also the mode weights of the deformed mesh;
+    neither is implemented here. F_reg is instead fitted from our d_k to the answer's s_k, so the d_k error is the
+    residual of that fit, and the mesh is deformed with the answer's mode weights. For PA3, F_reg is the identity.
+
+    :param directory: Directory containing the data files.
+    :param problem: 3, 4 or 5.
+    :param letter: Case letter, e.g. 'A'.
+    :param engines: Names of the engines in ENGINES to run (default: DEFAULT_ENGINES).
+    :param tolerances: Tolerance of each field (default: TOLERANCES); ENGINE_TOLERANCES still apply on top.
+    :return: Dictionary with the case name, the d_k error, the compute_dk time, and per engine the c_k and distance
+             errors, the tolerances applied, the build and query times and whether every field passed.
+    """
+    files = case_files(directory, problem, letter)
+    s_answer, c_answer, d_answer, weights = read_answer(files['answer'])
+
+    start = time.perf_counter()
+    dk = compute_dk(files['bodyA'], files['bodyB'], files['readings'])
+    dk_time = time.perf_counter() - start
+
+    if problem == 3:
+        F_reg = Frame(np.eye(3), np.zeros(3))
+    else:
+        F_reg = PointCloud(dk).register(PointCloud(s_answer))
+    sk = F_reg.apply(dk)
+    dk_error = float(np.max(np.linalg.norm(sk - s_answer, axis=0)))
+
+    DV, triangles = read_mesh(files['mesh'])
+    if len(weights):
+        DV = deform(read_modes(files['modes']), weights)
+
+    result = {'case': 'PA{0}-{1}'.format(problem, letter), 'd_k': dk_error, 'dk_time': dk_time, 'engines': {}}
+    for name in engines or DEFAULT_ENGINES:
+        stats = SearchStats()
+        d, c = ENGINES[name](DV, triangles, sk, stats)
+        errors = {'c_k': float(np.max(np.linalg.norm(c - c_answer, axis=0))),
+                  'distance': float(np.max(np.abs(d - d_answer)))}
+        limits = tolerances_for(name, tolerances)
+        result['engines'][name] = dict(errors, tolerances=limits, build_time=stats.times['build'],
+                                       query_time=stats.times['query'],
+                                       passed=dk_error <= limits['d_k'] and
+                                       all(errors[field] <= limits[field] for field in errors))
+    return result
+
+
+def report(results, tolerances=None):
+    """
+    Prints the errors and times of every case and engine, followed by the totals per engine.
+
+    :param results: Results of check_case.
+    :param tolerances: Tolerance of each field, shown in the header (default: TOLERANCES); the engines with their own
+                       tolerances get a header line each.
+    """
+    print('{0:<8}{1:>10}{2:>12}{3:>10}{4:>10}{5:>12}{6:>12}{7:>12}  result'.format(
+        'case', 'engine', 'd_k', 'c_k', 'distance', 'dk time', 'build', 'query'))
+    rows = [('tolerance', tolerances or TOLERANCES)]
+    if results:
+        rows += [(name, engine['tolerances']) for name, engine in results[0]['engines'].items()
+                 if name in ENGINE_TOLERANCES]
+    for label, limits in rows:
+        print('{0:<8}{1:>10}{2:>12.3f}{3:>10.3f}{4:>10.3f}'.format('', label, limits['d_k'], limits['c_k'],
+                                                                 limits['distance']))
+    totals = {}
+    for result in results:
+        for name, engine in result['engines'].items():
+            print('{0:<8}{1:>10}{2:>12.4f}{3:>10.4f}{4:>10.4f}{5:>9.1f} ms{6:>9.1f} ms{7:>9.1f} ms  {8}'.format(
+                result['case'], name, result['d_k'], engine['c_k'], engine['distance'], 1000 * result['dk_time'],
+                1000 * engine['build_time'], 1000 * engine['query_time'], 'ok' if engine['passed'] else 'FAILED'))
+            total = totals.setdefault(name, {'passed': 0, 'cases': 0, 'time': 0.0})
+            total['cases'] += 1
+            total['passed'] += engine['passed']
+            total['time'] += engine['build_time'] + engine['query_time']
+
+    print()
+    for name, total in totals.items():
+        print('{0:<10}{1}/{2} cases within tolerance, {3:.1f} ms build + query'.format(
+            name, total['passed'], total['cases'], 1000 * total['time']))
+
+
+def main():
+    """
+    Command line entry point, e.g.
+        python golden.py --engine sorted --problem 3 --case A --case B
+    Runs DEFAULT_ENGINES unless engines are named. Exits with status 1 if any engine is outside its tolerances on any
+    case.
+    """
+    parser = argparse.ArgumentParser(description='Compare the closest-point engines with the PA3/PA4/PA5 answers')
+    parser.add_argument('directory', nargs='?', default='PADATA', help='directory with the data files')
+    parser.add_argument('--engine', action='append', choices=sorted(ENGINES), help='engine to run; may be repeated (default: {0})'.format(', '.join(DEFAULT_ENGINES)))
+    parser.add_argument('--problem', type=int, action='append', choices=(3, 4, 5), help='problem; may be repeated')
+    parser.add_argument('--case', action='append', help='case letter; may be repeated')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    cases = [(problem, letter) for problem, letter in find_cases(args.directory)
+             if (not args.problem or problem in args.problem) and (not args.case or letter in args.case)]
+    results = [check_case(args.directory, problem, letter, args.engine) for problem, letter in cases]
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as fid:
+            json.dump(results, fid, indent=2)
+
+    sys.exit(0 if all(engine['passed'] for result in results for engine in result['engines'].values()) else 1)
+
+if __name__ == "__main__":
+    main()
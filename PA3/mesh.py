@@ -0,0 +1,45 @@
+import re
+import numpy as np
+
+def read_mesh(meshFile):
+    """
+    Reads a surface mesh file.
+
+    :param meshFile: Path to the .sur mesh file.
+    :return: Tuple (DV, triangles) with the vertices as columns (3, n_vert) and the vertex indices of each
+             triangle (n_tr, 3).
+    """
+    with open(meshFile, 'r') as fid:
+        n_vert = int(fid.readline().strip())
+        DV = np.array([list(map(float, fid.readline().strip().split())) for _ in range(n_vert)]).T
+        n_tr = int(fid.readline().strip())
+        triangles = np.array([list(map(int, fid.readline().strip().split()[:3])) for _ in range(n_tr)])
+    return DV, triangles
+
+def read_modes(modesFile):
+    """
+    Reads a deformable mesh's modes file: the average vertex positions (mode 0) followed by the vertex
+    displacements of each mode.
+
+    :param modesFile: Path to the modes file.
+    :return: Modes with shape (n_modes + 1, 3, n_vert); modes[0] are the average vertices.
+    """
+    with open(modesFile, 'r') as fid:
+        header = fid.readline()
+        n_vert = int(re.search(r'Nvertices=(\d+)', header).group(1))
+        n_modes = int(re.search(r'Nmodes=(\d+)', header).group(1))
+        modes = np.zeros((n_modes + 1, 3, n_vert))
+        for m in range(n_modes + 1):
+            fid.readline()  # 'Mode m :...' title line
+            modes[m] = np.array([fid.readline().replace(',', ' ').split() for _ in range(n_vert)], dtype=float).T
+    return modes
+
+def deform(modes, weights):
+    """
+    Vertices of a deformed mesh: the average vertices plus the weighted sum of the mode displacements.
+
+    :param modes: Modes as returned by read_modes.
+    :param weights: Weight of each mode (n_modes,).
+    :return: Vertices (3, n_vert).
+    """
+    return modes[0] + np.tensordot(np.asarray(weights, dtype=float), modes[1:], axes=1)
@@ -0,0 +1,99 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy.spatial import cKDTree
+from distancecalc import distance_calculator_batch
+
+class MeshIndex:
+    """
+    Read-only closest-point index of a triangle mesh. Queries are exact: each point is tested against the triangles
+    with the k nearest centroids, and k grows for the points where a triangle further away could still be closer.
+
+    The index is never modified after construction (its arrays are made read-only), so one instance can be queried
+    from many threads at once without copying the mesh. query splits large batches across a thread pool; the KDTree
+    search and the batch triangle kernel run in NumPy/SciPy code that releases the GIL, so the threads run in
+    parallel.
+    """
+    def __init__(self, DV, triangles, k=8):
+        """
+        :param DV: Mesh vertices (3, n_vert).
+        :param triangles: Vertex indices of each triangle (n_tr, 3).
+        :param k: Number of nearest centroids tested first for every query.
+        """
+        self.vertices = np.ascontiguousarray(DV[:, triangles].transpose(1, 2, 0))  # (n_tr, 3 vertices, 3)
+        self.centroids = self.vertices.mean(axis=1)
+        # Every point of a triangle is within radius of its centroid, so a triangle is no closer to a query than its
+        # centroid distance minus the largest radius
+        self.max_radius = float(np.max(np.linalg.norm(self.vertices - self.centroids[:, np.newaxis], axis=2)))
+        self.tree = cKDTree(self.centroids)
+        self.n_triangles = len(self.vertices)
+        self.k = min(k, self.n_triangles)
+        for array in (self.vertices, self.centroids):
+            array.flags.writeable = False
+
+    def query_block(self, points):
+        """
+        Finds the closest point on the mesh for each of a block of points, in the calling thread.
+
+        :param points: Query points (n, 3).
+        :return: Tuple (d, c, tested) with the distances (n,), the closest points (n, 3) and the number of triangles
+                 tested for each point (n,).
+        """
+        n = len(points)
+        d = np.empty(n)
+        c = np.empty((n, 3))
+        tested = np.zeros(n, dtype=int)
+        pending = np.arange(n)
+        k = self.k
+        while len(pending):
+            centroid_distances, candidates = self.tree.query(points[pending], k=k)
+            centroid_distances = centroid_distances.reshape((len(pending), k))
+            candidates = candidates.reshape((len(pending), k))
+
+            triangles = self.vertices[candidates.ravel()]
+            distances, closest = distance_calculator_batch(triangles[:, 0], triangles[:, 1], triangles[:, 2],
+                                                           np.repeat(points[pending], k, axis=0))
+            distances = distances.reshape((len(pending), k))
+            best = np.argmin(distances, axis=1)
+            rows = np.arange(len(pending))
+            d[pending] = distances[rows, best]
+            c[pending] = closest.reshape((len(pending), k, 3))[rows, best]
+            tested[pending] = k
+
+            # A triangle beyond the k nearest centroids is at least this far away
+            bound = centroid_distances[:, -1] - self.max_radius
+            if k == self.n_triangles:
+                break
+            pending = pending[d[pending] > bound]
+            k = min(4 * k, self.n_triangles)
+        return d, c, tested
+
+    def query(self, sk, workers=None, block_size=256, stats=None):
+        """
+        Finds the closest point on the mesh for each query point, splitting the points into blocks searched by a
+        thread pool.
+
+        :param sk: Query points (3, n).
+        :param workers: Number of threads (default: one per CPU); 1 searches in the calling thread.
+        :param block_size: Number of points per block.
+        :param stats: Optional SearchStats; counters are added after every block has been searched, from the calling
+                      thread only.
+        :return: Tuple (d, c) with the distance to and position of the closest point for each query, as search_simple.
+        """
+        points = np.ascontiguousarray(np.asarray(sk, dtype=float).T)
+        blocks = [points[start:start + block_size] for start in range(0, len(points), block_size)]
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(blocks) <= 1:
+            results = [self.query_block(block) for block in blocks]
+        else:
+            with ThreadPoolExecutor(max_workers=min(workers, len(blocks))) as pool:
+                results = list(pool.map(self.query_block, blocks))
+
+        if not results:
+            return np.zeros(0), np.zeros((3, 0))
+        d = np.concatenate([result[0] for result in results])
+        c = np.concatenate([result[1] for result in results])
+        if stats is not None:
+            for tested in np.concatenate([result[2] for result in results]):
+                stats.count_query(int(tested), self.n_triangles)
+        return d, c.T
@@ -0,0 +1,114 @@
+import queue
+import threading
+from contextlib import closing
+from computedk import compute_dk_chunks
+from mesh import read_mesh
+from meshindex import MeshIndex
+from search_stats import phase
+from simple import search_simple
+from sorted import build_tree, search_sorted
+
+# Marks the end of the blocks passed between the reader thread and the search
+_DONE = object()
+
+def make_query(engine, DV, triangles, stats=None):
+    """
+    Builds the index of a closest-point engine once, for querying block after block.
+
+    :param engine: 'simple', 'sorted' or 'indexed' (MeshIndex, searching each block with a thread pool).
+    :param DV: Mesh vertices (3, n_vert).
+    :param triangles: Vertex indices of each triangle (n_tr, 3).
+    :param stats: Optional SearchStats collecting counters and build/query times.
+    :return: Function mapping query points sk (3, n) to the tuple (d, c) of search_simple/search_sorted.
+    """
+    if engine == 'simple':
+        return lambda sk: search_simple(DV, triangles, sk, stats)
+    if engine == 'sorted':
+        with phase(stats, 'build'):
+            kd_tree = build_tree(DV, triangles)
+        return lambda sk: search_sorted(DV, triangles, kd_tree, sk, stats)
+    if engine == 'indexed':
+        with phase(stats, 'build'):
+            index = MeshIndex(DV, triangles)
+
+        def query(sk):
+            with phase(stats, 'query'):
+                return index.query(sk, stats=stats)
+        return query
+    raise ValueError(f"Unknown engine {engine}; expected 'simple', 'sorted' or 'indexed'")
+
+def prefetch(blocks, depth=2):
+    """
+    Runs a generator in a background thread, keeping up to depth blocks ready ahead of the consumer. Parsing and
+    registering the next blocks then overlaps with searching the current one. An exception raised by the generator is
+    re-raised in the consumer. When the consumer stops early, the generator is closed once the thread has finished the
+    block it is working on, so files it holds open are released.
+
+    :param blocks: Iterable of blocks.
+    :param depth: Number of blocks buffered ahead; bounds the memory held.
+    :return: Generator of the same blocks, in order.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def offer(item):
+        # Waits for room in the buffer, giving up once the consumer has stopped
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for block in blocks:
+                if not offer(block):
+                    return
+            offer(_DONE)
+        except BaseException as e:
+            offer(e)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            block = buffer.get()
+            if block is _DONE:
+                return
+            if isinstance(block, BaseException):
+                raise block
+            yield block
+    finally:
+        # The consumer may stop early; let the reader thread exit instead of blocking on a full buffer, then close the
+        # generator from this thread, as a generator cannot be closed while another thread is running it
+        stop.set()
+        thread.join()
+        close = getattr(blocks, 'close', None)
+        if close is not None:
+            close()
+
+def stream_closest_points(bodyA, bodyB, sampleReadings, meshFile, engine='sorted', chunk_size=1024, stats=None):
+    """
+    Streams a sample recording through compute_dk and a closest-point engine a block of frames at a time. The blocks
+    of d_k are produced in a background thread while the previous block is searched, memory use is bounded by a few
+    blocks, and the results of each block are available as soon as it has been searched.
+
+    :param bodyA: Path to the body A file.
+    :param bodyB: Path to the body B file.
+    :param sampleReadings: Path to the sample readings file.
+    :param meshFile: Path to the .sur mesh file.
+    :param engine: 'simple', 'sorted' or 'indexed'.
+    :param chunk_size: Number of frames per block.
+    :param stats: Optional SearchStats collecting counters and parse/build/query times.
+    :return: Generator of tuples (dk, d, c) per block: the tip positions (3, n), their distances to the mesh (n,)
+             and the closest points (3, n).
+    """
+    with phase(stats, 'parse'):
+        DV, triangles = read_mesh(meshFile)
+    query = make_query(engine, DV, triangles, stats)
+    with closing(prefetch(compute_dk_chunks(bodyA, bodyB, sampleReadings, chunk_size))) as blocks:
+        for dk in blocks:
+            d, c = query(dk)
+            yield dk, d, c
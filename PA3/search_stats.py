@@ -0,0 +1,96 @@
+import contextlib
+import cProfile
+import pstats
+import time
+
+# Shared no-op context manager used when no stats are being collected
+_DISABLED = contextlib.nullcontext()
+
+
+class SearchStats:
+    """
+    Counters for a closest-point search: where the time went (parse, index build, query) and how much of the mesh
+    each query had to look at. Pass an instance as the stats argument of a search function; searches run without one
+    do no bookkeeping.
+    """
+    def __init__(self):
+        self.times = {'parse': 0.0, 'build': 0.0, 'query': 0.0}
+        self.queries = 0
+        self.triangles_tested = 0
+        self.triangles_total = 0
+        # Only engines walking their own index can count nodes; scipy's KDTree does not expose its traversal
+        self.nodes_visited = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Adds the wall time of the with block to the named phase.
+
+        :param name: 'parse', 'build' or 'query'.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+
+    def count_query(self, triangles_tested, n_triangles, nodes_visited=None):
+        """
+        Records one query.
+
+        :param triangles_tested: Number of triangles the exact distance was computed for.
+        :param n_triangles: Number of triangles in the mesh.
+        :param nodes_visited: Number of index nodes visited, if the engine can count them.
+        """
+        self.queries += 1
+        self.triangles_tested += triangles_tested
+        self.triangles_total += n_triangles
+        if nodes_visited is not None:
+            self.nodes_visited = (self.nodes_visited or 0) + nodes_visited
+
+    @property
+    def pruning_rate(self):
+        """Fraction of the mesh's triangles skipped over all queries."""
+        if self.triangles_total == 0:
+            return 0.0
+        return 1.0 - self.triangles_tested / self.triangles_total
+
+    def __repr__(self):
+        nodes = 'n/a' if self.nodes_visited is None else self.nodes_visited
+        return ('SearchStats(queries={0}, triangles_tested={1}, pruning_rate={2:.4f}, nodes_visited={3}, '
+                'parse={4:.4f}s, build={5:.4f}s, query={6:.4f}s)').format(
+                    self.queries, self.triangles_tested, self.pruning_rate, nodes,
+                    self.times['parse'], self.times['build'], self.times['query'])
+
+
+def phase(stats, name):
+    """
+    Times a phase into stats, or does nothing when stats is None.
+
+    :param stats: SearchStats or None.
+    :param name: 'parse', 'build' or 'query'.
+    """
+    if stats is None:
+        return _DISABLED
+    return stats.phase(name)
+
+
+def profile_queries(search, *args, path=None, sort='cumulative', limit=25):
+    """
+    Runs one call of a search function under cProfile, e.g.
+        profile_queries(closest_point_sorted, meshFile, dk, path='sorted.prof')
+
+    :param search: The search function.
+    :param args: Its arguments.
+    :param path: File to dump the raw stats to (readable with pstats or snakeviz), or None to only print them.
+    :param sort: pstats sort key for the printed summary.
+    :param limit: Number of functions printed, or None to skip printing.
+    :return: The search result.
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(search, *args)
+    if path is not None:
+        profiler.dump_stats(path)
+    if limit is not None:
+        pstats.Stats(profiler).sort_stats(sort).print_stats(limit)
+    return result
@@ -1,34 +1,46 @@
 import numpy as np
 from distancecalc import distance_calculator_barycentric
+from mesh import read_mesh
+from search_stats import phase
 
-def closest_point_simple(meshFile, dk):
+def closest_point_simple(meshFile, dk, stats=None):
     """
     Finds the closest point on a given surface mesh using a brute-force linear search.
+
+    :param stats: Optional SearchStats collecting counters and parse/query times.
+    """
+    with phase(stats, 'parse'):
+        DV, triangles = read_mesh(meshFile)
+    return search_simple(DV, triangles, dk, stats)
+
+def search_simple(DV, triangles, sk, stats=None):
     """
-    # Read mesh data
-    with open(meshFile, 'r') as fid:
-        n_vert = int(fid.readline().strip())
-        DV = np.array([list(map(float, fid.readline().strip().split())) for _ in range(n_vert)]).T
-        n_tr = int(fid.readline().strip())
-        triangles = np.array([list(map(int, fid.readline().strip().split()[:3])) for _ in range(n_tr)])
+    Brute-force search over every triangle of an already loaded mesh.
 
-    # Initialize variables
-    sk = dk
+    :param DV: Mesh vertices (3, n_vert).
+    :param triangles: Vertex indices of each triangle (n_tr, 3).
+    :param sk: Query points (3, n_frames).
+    :param stats: Optional SearchStats collecting counters and query time.
+    :return: Tuple (d, c) with the distance to and position of the closest point for each query.
+    """
     n_frames = sk.shape[1]
     c = np.zeros((3, n_frames))
     d = np.zeros(n_frames)
 
     # For each frame, find the closest point
-    for j in range(n_frames):
-        min_dist = float('inf')
-        min_c = None
-        for tri in triangles:
-            p, q, r = DV[:, tri[0]], DV[:, tri[1]], DV[:, tri[2]]
-            dist, c_temp = distance_calculator_barycentric(p, q, r, sk[:, j])
-            if dist < min_dist:
-                min_dist = dist
-                min_c = c_temp
-        d[j] = min_dist
-        c[:, j] = min_c
+    with phase(stats, 'query'):
+        for j in range(n_frames):
+            min_dist = float('inf')
+            min_c = None
+            for tri in triangles:
+                p, q, r = DV[:, tri[0]], DV[:, tri[1]], DV[:, tri[2]]
+                dist, c_temp = distance_calculator_barycentric(p, q, r, sk[:, j])
+                if dist < min_dist:
+                    min_dist = dist
+                    min_c = c_temp
+            d[j] = min_dist
+            c[:, j] = min_c
+            if stats is not None:
+                stats.count_query(len(triangles), len(triangles))
 
     return d, c
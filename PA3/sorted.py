@@ -1,33 +1,51 @@
 import numpy as np
 from scipy.spatial import KDTree
 from distancecalc import distance_calculator_barycentric
+from mesh import read_mesh
+from search_stats import phase
 
-def closest_point_sorted(meshFile, dk):
+def closest_point_sorted(meshFile, dk, stats=None):
     """
     Finds the closest point on a given surface mesh using a KDTree for efficient searching.
+
+    :param stats: Optional SearchStats collecting counters and parse/build/query times.
+    """
+    with phase(stats, 'parse'):
+        DV, triangles = read_mesh(meshFile)
+    with phase(stats, 'build'):
+        kd_tree = build_tree(DV, triangles)
+    return search_sorted(DV, triangles, kd_tree, dk, stats)
+
+def build_tree(DV, triangles):
     """
-    # Read mesh data
-    with open(meshFile, 'r') as fid:
-        n_vert = int(fid.readline().strip())
-        DV = np.array([list(map(float, fid.readline().strip().split())) for _ in range(n_vert)]).T
-        n_tr = int(fid.readline().strip())
-        triangles = np.array([list(map(int, fid.readline().strip().split()[:3])) for _ in range(n_tr)])
+    Builds a KDTree over the triangle centroids of a mesh.
+    """
+    triangle_centers = np.mean(DV[:, triangles], axis=2).T  # Calculate centroids, averaging the 3 vertices of each triangle
+    return KDTree(triangle_centers)
 
-    # Construct KDTree
-    triangle_centers = np.mean(DV[:, triangles], axis=1).T  # Calculate centroids
-    kd_tree = KDTree(triangle_centers)
+def search_sorted(DV, triangles, kd_tree, sk, stats=None):
+    """
+    Finds the closest point for each query using a KDTree built by build_tree.
 
-    # Initialize variables
-    sk = dk
+    :param DV: Mesh vertices (3, n_vert).
+    :param triangles: Vertex indices of each triangle (n_tr, 3).
+    :param kd_tree: KDTree over the triangle centroids.
+    :param sk: Query points (3, n_frames).
+    :param stats: Optional SearchStats collecting counters and query time.
+    :return: Tuple (d, c) with the distance to and position of the closest point for each query.
+    """
     n_frames = sk.shape[1]
     c = np.zeros((3, n_frames))
     d = np.zeros(n_frames)
 
     # For each frame, find the closest triangle and point
-    for j in range(n_frames):
-        _, idx = kd_tree.query(sk[:, j])  # Closest triangle center
-        tri = triangles[idx]
-        p, q, r = DV[:, tri[0]], DV[:, tri[1]], DV[:, tri[2]]
-        d[j], c[:, j] = distance_calculator_barycentric(p, q, r, sk[:, j])
+    with phase(stats, 'query'):
+        for j in range(n_frames):
+            _, idx = kd_tree.query(sk[:, j])  # Closest triangle center
+            tri = triangles[idx]
+            p, q, r = DV[:, tri[0]], DV[:, tri[1]], DV[:, tri[2]]
+            d[j], c[:, j] = distance_calculator_barycentric(p, q, r, sk[:, j])
+            if stats is not None:
+                stats.count_query(1, len(triangles))
 
     return d, c
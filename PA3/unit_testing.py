@@ -0,0 +1,117 @@
+import os
+import numpy as np
+import computedk
+import distancecalc
+import pipeline
+from mesh import read_mesh
+from meshindex import MeshIndex
+from projectiononseg import projection_on_segment
+from simple import search_simple
+
+# Debug data the file based tests run on
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'PADATA')
+BODY_A = os.path.join(DATA_DIR, 'Problem3-BodyA.txt')
+BODY_B = os.path.join(DATA_DIR, 'Problem3-BodyB.txt')
+READINGS = os.path.join(DATA_DIR, 'PA3-A-Debug-SampleReadingsTest.txt')
+
+
+def test_compute_dk_chunks():
+    """
+    Checks that streaming the readings in blocks, directly and through prefetch, gives the d_k of compute_dk, and that
+    a chunk_size below 1 is rejected on the call.
+
+    :return: None
+    """
+    print('\nRunning streamed compute_dk test...')
+    dk = computedk.compute_dk(BODY_A, BODY_B, READINGS)
+    for chunk_size in (1, 4, 1024):
+        blocks = list(computedk.compute_dk_chunks(BODY_A, BODY_B, READINGS, chunk_size))
+        assert all(block.shape[1] <= chunk_size for block in blocks)
+        assert np.allclose(np.hstack(blocks), dk, rtol=0, atol=1e-9)
+        assert np.array_equal(np.hstack(list(pipeline.prefetch(iter(blocks)))), np.hstack(blocks))
+
+    for chunk_size in (0, -1):
+        try:
+            computedk.compute_dk_chunks(BODY_A, BODY_B, READINGS, chunk_size)
+        except ValueError as e:
+            print('\nchunk_size={0}: {1}'.format(chunk_size, e))
+        else:
+            raise AssertionError('chunk_size={0} was accepted'.format(chunk_size))
+    print('\nStreamed compute_dk test passed!')
+
+
+def test_prefetch_closes_generator():
+    """
+    Stops consuming prefetch after a few blocks and checks that the generator it runs is closed.
+
+    :return: None
+    """
+    print('\nRunning prefetch early stop test...')
+    closed = []
+
+    def blocks():
+        try:
+            for i in range(100):
+                yield i
+        finally:
+            closed.append(True)
+
+    consumer = pipeline.prefetch(blocks())
+    assert [next(consumer) for _ in range(3)] == [0, 1, 2]
+    consumer.close()
+    assert closed == [True]
+    print('\nPrefetch early stop test passed!')
+
+
+def test_distance_calculator_batch(tolerance=1e-9):
+    """
+    Compares distance_calculator_batch with distance_calculator_barycentric on random triangles and query points, and
+    on degenerate triangles (a repeated vertex, collinear vertices, a single point) with the closest point on their
+    edges, found with projection_on_segment.
+
+    :param tolerance: Allowed deviation of the distances and closest points.
+    :return: None
+    """
+    print('\nRunning batch triangle distance test...')
+    rng = np.random.RandomState(0)
+    n = 1000
+    p, q, r = rng.normal(size=(3, n, 3))
+    a = 2 * rng.normal(size=(n, 3))
+
+    d, c = distancecalc.distance_calculator_batch(p, q, r, a)
+    for i in range(n):
+        d_i, c_i = distancecalc.distance_calculator_barycentric(p[i], q[i], r[i], a[i])
+        assert abs(d[i] - d_i) <= tolerance and np.all(np.abs(c[i] - c_i) <= tolerance)
+
+    # Repeated vertex, collinear vertices (inside and beyond the segment pq) and a single point
+    r = p + (q - p) * rng.uniform(-1, 2, (n, 1))
+    r[:100] = p[:100]
+    q[100:150] = r[100:150] = p[100:150]
+    d, c = distancecalc.distance_calculator_batch(p, q, r, a)
+    for i in range(n):
+        edges = [(s, e) for s, e in ((p[i], q[i]), (q[i], r[i]), (r[i], p[i])) if np.any(s != e)]
+        candidates = [projection_on_segment(a[i], s, e) for s, e in edges] or [p[i]]
+        expected = min(np.linalg.norm(a[i] - candidate) for candidate in candidates)
+        assert abs(d[i] - expected) <= tolerance and abs(np.linalg.norm(a[i] - c[i]) - d[i]) <= tolerance
+    print('\nBatch triangle distance test passed!')
+
+
+def test_mesh_index_threads(tolerance=1e-9):
+    """
+    Queries MeshIndex with 4 worker threads on small blocks, so the blocks are searched concurrently, and compares the
+    closest points with the brute-force search_simple on the PA3 mesh.
+
+    :param tolerance: Allowed deviation of the distances and closest points.
+    :return: None
+    """
+    print('\nRunning threaded mesh index test...')
+    DV, triangles = read_mesh(os.path.join(DATA_DIR, 'Problem3MeshFile.sur'))
+    rng = np.random.RandomState(0)
+    sk = DV[:, rng.randint(DV.shape[1], size=30)] + rng.normal(scale=5, size=(3, 30))
+
+    d, c = MeshIndex(DV, triangles).query(sk, workers=4, block_size=4)
+    d_simple, c_simple = search_simple(DV, triangles, sk)
+    print('\nLargest distance difference: {0:.2e}'.format(np.max(np.abs(d - d_simple))))
+    assert np.all(np.abs(d - d_simple) <= tolerance)
+    assert np.all(np.abs(c - c_simple) <= tolerance)
+    print('\nThreaded mesh index test passed!')
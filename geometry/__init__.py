@@ -0,0 +1,9 @@
+"""
+Geometry core shared by the PA1, PA2 and PA3 pipelines: rigid frame transformations, point clouds and batched
+registration. The assignment directories are not packages, so each of them has a repo_paths module that makes
+the repository root importable; it is imported before this package.
+"""
+from .frame import Frame, FrameBatch
+from .pointcloud import PointCloud
+from .registration import BACKENDS, register_batch
+from .transforms import HomogeneousBatch, QuaternionBatch, collapse, apply_chain
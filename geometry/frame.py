@@ -0,0 +1,155 @@
+import numpy as np
+
+
+def as_float_array(data):
+    """
+    Returns data as a float64 array, copying only if it is not one already.
+    """
+    return np.asarray(data, dtype=np.float64)
+
+
+class Frame:
+    """
+    Rigid frame transformation F = [rotation, translation], mapping a point x to rotation x + translation.
+    """
+    __slots__ = ('rotation', 'translation')
+
+    def __init__(self, rotation, translation):
+        """
+        :param rotation: Rotation matrix of the transformation
+        :param translation: Translation vector of the transformation; stored as a column
+
+        :type rotation: numpy.array of shape (3, 3)
+        :type translation: numpy.array of shape (3, 1) or (3,)
+        """
+        self.rotation = as_float_array(rotation)
+        self.translation = as_float_array(translation).reshape((-1, 1))
+
+    # Names used by PA1
+    @property
+    def r(self):
+        return self.rotation
+
+    @property
+    def p(self):
+        return self.translation
+
+    @property
+    def inv(self):
+        """
+        The inverse transformation. The rotation of a rigid transformation is orthonormal, so its inverse is its
+        transpose.
+        :return: A Frame transformation with components [rotation, translation] corresponding to the inverse of the
+                 current transformation
+        :rtype: Frame
+        """
+        r_inv = self.rotation.T
+        return Frame(r_inv, -r_inv.dot(self.translation))
+
+    def compose(self, f):
+        """
+        Frame composition with another frame f, i.e. the transformation applying f first and then this frame.
+        :param f: The Frame to compose with
+        :type f: Frame
+
+        :return: The composed transformation
+        :rtype: Frame
+        """
+        return Frame(self.rotation.dot(f.rotation), self.rotation.dot(f.translation) + self.translation)
+
+    def apply(self, points):
+        """
+        Applies the transformation to a single point or to points stored as columns.
+        :param points: A point (3,) or column vectors (3, N)
+        :type points: numpy.array
+
+        :return: The transformed point(s), with the same shape as points
+        :rtype: numpy.array
+        """
+        points = as_float_array(points)
+        if points.ndim == 1:
+            return self.rotation.dot(points) + self.translation[:, 0]
+        return self.rotation.dot(points) + self.translation
+
+    # Names used by PA1 and PA3
+    apply_to_point = apply
+    apply_to_cloud = apply
+    transform_point = apply
+
+    def __repr__(self):
+        return 'Frame(rotation={0}, translation={1})'.format(self.rotation.tolist(), self.translation.ravel().tolist())
+
+
+class FrameBatch:
+    """
+    A stack of F rigid frame transformations, held as one (F, 3, 3) array of rotations and one (F, 3, 1) array of
+    translations so that every operation runs over the whole stack at once.
+    """
+    __slots__ = ('rotations', 'translations')
+
+    def __init__(self, rotations, translations):
+        """
+        :param rotations: Rotation matrices, F x 3 x 3
+        :param translations: Translation vectors, F x 3 x 1 or F x 3
+        """
+        self.rotations = as_float_array(rotations)
+        self.translations = as_float_array(translations).reshape((len(self.rotations), 3, 1))
+
+    @classmethod
+    def from_frames(cls, frames):
+        """
+        Stacks a sequence of Frame objects.
+        :rtype: FrameBatch
+        """
+        return cls(np.stack([f.rotation for f in frames]), np.stack([f.translation for f in frames]))
+
+    def __len__(self):
+        return len(self.rotations)
+
+    def __getitem__(self, index):
+        """
+        The frame at index as a Frame (views into the stack, no copy), or a FrameBatch for a slice.
+        """
+        if isinstance(index, slice):
+            return FrameBatch(self.rotations[index], self.translations[index])
+        return Frame(self.rotations[index], self.translations[index])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def inv(self):
+        """
+        The inverse of every transformation.
+        :rtype: FrameBatch
+        """
+        r_inv = self.rotations.transpose(0, 2, 1)
+        return FrameBatch(r_inv, -r_inv @ self.translations)
+
+    def compose(self, f):
+        """
+        Composes every transformation with f (applied first).
+        :param f: A single Frame applied to every transformation, or a FrameBatch of the same length
+        :type f: Frame or FrameBatch
+
+        :rtype: FrameBatch
+        """
+        if isinstance(f, Frame):
+            return FrameBatch(self.rotations @ f.rotation, self.rotations @ f.translation + self.translations)
+        return FrameBatch(self.rotations @ f.rotations, self.rotations @ f.translations + self.translations)
+
+    def apply(self, points):
+        """
+        Applies every transformation to the points.
+        :param points: The same points for every frame (3,) or (3, N), or one set per frame (F, 3, N)
+
+        :return: The transformed points, F x 3 or F x 3 x N
+        :rtype: numpy.array
+        """
+        points = as_float_array(points)
+        if points.ndim == 1:
+            return (self.rotations @ points[:, np.newaxis] + self.translations)[:, :, 0]
+        return self.rotations @ points + self.translations
+
+    def __repr__(self):
+        return 'FrameBatch(n_frames={0})'.format(len(self))
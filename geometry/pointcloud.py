@@ -0,0 +1,101 @@
+import numpy as np
+import scipy.linalg as scialg
+from .frame import Frame, FrameBatch, as_float_array
+from .registration import BACKENDS, register_batch
+
+
+class PointCloud:
+    """
+    Class representing a point cloud. Consists of a float64 array of column vectors representing each point in the
+    cloud, and pertinent methods for registration and frame transformations. The data is not copied when it is
+    already a float64 array, so clouds can be views into larger frame arrays.
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data=None):
+        """
+        Initializes the point cloud, either empty or with the data provided
+        :param data: Numpy array of column vectors, with each column representing each point in the point cloud
+        :type data: numpy.array([numpy.float64][]), M x N (usually 3 x N)
+        """
+        self.data = None if data is None else as_float_array(data)
+
+    def register(self, target_cloud, backend=None):
+        """
+        Performs rigid-body registration with respect to another point cloud target_cloud, and returns the
+        corresponding frame transformation.
+        :param target_cloud: The point cloud being mapped to
+        :param backend: None for the SVD method on the 3 x 3 cross-covariance, or the name of a batch backend in
+                        registration.BACKENDS
+        :type target_cloud: PointCloud
+
+        :return: The Frame transformation F = [rot_matrix, trans_vector] from current frame to target_cloud
+        :rtype: Frame
+        """
+        if backend is not None:
+            rotations, translations = register_batch(self.data, target_cloud.data[np.newaxis], backend)
+            return Frame(rotations[0], translations[0])
+
+        # Calculate centroids of self and target clouds
+        centroid_self = np.mean(self.data, axis=1, keepdims=True)
+        centroid_target = np.mean(target_cloud.data, axis=1, keepdims=True)
+
+        demeaned_self = self.data - centroid_self
+        demeaned_target = target_cloud.data - centroid_target
+
+        # Compute cross-covariance matrix and solve for rotation using SVD
+        cross_covariance = demeaned_self.dot(demeaned_target.T)
+        u_mat, singular_vals, v_t_mat = scialg.svd(cross_covariance)
+
+        u_mat = u_mat.T
+        v_t_mat = v_t_mat.T
+
+        reflection_adjustment = np.identity(v_t_mat.shape[1])
+        reflection_adjustment[-1, -1] = scialg.det(v_t_mat.dot(u_mat))
+
+        rot_matrix = v_t_mat.dot(reflection_adjustment.dot(u_mat))
+
+        trans_vector = centroid_target - rot_matrix.dot(centroid_self)
+
+        return Frame(rot_matrix, trans_vector)
+
+    def register_batch(self, targets, backend='arun'):
+        """
+        Registers this cloud to a stack of target clouds at once.
+        :param targets: Stack of target clouds, one per frame, each laid out like PointCloud.data
+        :param backend: Name of a batch backend in registration.BACKENDS
+        :type targets: numpy.array, F x 3 x N
+
+        :return: The transformation onto each target
+        :rtype: FrameBatch
+        """
+        return FrameBatch(*register_batch(self.data, targets, backend))
+
+    def transform(self, frame_transformation):
+        """
+        Evaluate a frame transformation applied to the current point cloud.
+        :param frame_transformation: The Frame transformation to transform with; a FrameBatch gives one transformed
+                                     set of points per frame (F x 3 x N)
+        :type frame_transformation: Frame
+
+        :return: The resulting point cloud
+        :rtype: PointCloud
+        """
+        return type(self)(frame_transformation.apply(self.data))
+
+    def add(self, new_cloud):
+        """
+        Adds the data in the PointCloud new_cloud to the current PointCloud, and outputs their union.
+
+        :param new_cloud: The PointCloud to add
+        :type new_cloud: PointCloud
+
+        :return: The union of the two PointClouds, with the data from new_cloud after the data of the original
+        :rtype: PointCloud
+        """
+        if self.data is None:
+            return type(self)(new_cloud.data)
+        return type(self)(np.concatenate((self.data, new_cloud.data), axis=1))
+
+    def __repr__(self):
+        return 'PointCloud(n_points={0})'.format(0 if self.data is None else self.data.shape[1])
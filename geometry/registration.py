@@ -0,0 +1,101 @@
+import numpy as np
+from .transforms import quaternion_to_rotation
+
+
+def rotations_arun(source, targets):
+    """
+    Rotations by Arun's method: SVD of the 3 x 3 cross-covariance with a reflection fix (as in PointCloud.register).
+    :param source: Demeaned model points, 3 x N
+    :param targets: Stack of target clouds, F x 3 x N (need not be demeaned)
+
+    :return: Rotation matrices, F x 3 x 3
+    """
+    cross_covariance = np.einsum('in,fjn->fij', source, targets)
+    u_mat, singular_vals, v_t_mat = np.linalg.svd(cross_covariance)
+
+    u_t = u_mat.transpose(0, 2, 1)
+    v_mat = v_t_mat.transpose(0, 2, 1)
+
+    # Flip the last axis wherever the solution would be a reflection
+    reflection_adjustment = np.ones((targets.shape[0], 3))
+    reflection_adjustment[:, -1] = np.linalg.det(v_mat @ u_t)
+
+    return (v_mat * reflection_adjustment[:, np.newaxis, :]) @ u_t
+
+
+def rotations_horn(source, targets):
+    """
+    Rotations by Horn's method: the unit quaternion is the eigenvector of the largest eigenvalue of a symmetric 4 x 4
+    matrix built from the cross-covariance (as in PA3 pointcloud.register, with a symmetric eigensolver).
+    :param source: Demeaned model points, 3 x N
+    :param targets: Stack of target clouds, F x 3 x N (need not be demeaned)
+
+    :return: Rotation matrices, F x 3 x 3
+    """
+    H = np.einsum('in,fjn->fij', source, targets)
+    trace = np.trace(H, axis1=1, axis2=2)
+    delta = np.stack((H[:, 1, 2] - H[:, 2, 1], H[:, 2, 0] - H[:, 0, 2], H[:, 0, 1] - H[:, 1, 0]), axis=1)
+
+    N = np.empty((len(H), 4, 4))
+    N[:, 0, 0] = trace
+    N[:, 0, 1:] = delta
+    N[:, 1:, 0] = delta
+    N[:, 1:, 1:] = H + H.transpose(0, 2, 1) - trace[:, np.newaxis, np.newaxis] * np.eye(3)
+
+    # eigh returns the eigenvalues in ascending order
+    _, eigenvectors = np.linalg.eigh(N)
+    return quaternion_to_rotation(eigenvectors[:, :, 3])
+
+
+def rotations_quaternion_m(source, targets):
+    """
+    Rotations by the stacked quaternion constraint of PA1: every correspondence adds the rows M(a, b) q = 0 and q is
+    the right singular vector of the smallest singular value of the stacked 4N x 4 matrix.
+    :param source: Demeaned model points, 3 x N
+    :param targets: Stack of target clouds, F x 3 x N (need not be demeaned)
+
+    :return: Rotation matrices, F x 3 x 3
+    """
+    b = targets - np.mean(targets, axis=2, keepdims=True)
+    diff = (b - source).transpose(0, 2, 1)
+    total = (b + source).transpose(0, 2, 1)
+    n_frames, n_points = diff.shape[:2]
+
+    # Each correspondence contributes [[0, (b - a)^T], [b - a, skew(b + a)]]
+    M = np.zeros((n_frames, n_points, 4, 4))
+    M[:, :, 0, 1:] = diff
+    M[:, :, 1:, 0] = diff
+    M[:, :, 1, 2] = -total[:, :, 2]
+    M[:, :, 1, 3] = total[:, :, 1]
+    M[:, :, 2, 1] = total[:, :, 2]
+    M[:, :, 2, 3] = -total[:, :, 0]
+    M[:, :, 3, 1] = -total[:, :, 1]
+    M[:, :, 3, 2] = total[:, :, 0]
+
+    _, _, v_t_mat = np.linalg.svd(M.reshape((n_frames, 4 * n_points, 4)), full_matrices=False)
+    return quaternion_to_rotation(v_t_mat[:, 3, :])
+
+
+BACKENDS = {
+    'arun': rotations_arun,
+    'horn': rotations_horn,
+    'quaternion_m': rotations_quaternion_m,
+}
+
+
+def register_batch(source, targets, backend='arun'):
+    """
+    Registers one source cloud to a stack of target clouds.
+    :param source: Numpy array of column vectors for the source cloud, 3 x N
+    :param targets: Stack of target clouds, F x 3 x N
+    :param backend: Name of a backend in BACKENDS
+
+    :return: The rotation matrices and translation vectors mapping source onto each target
+    :rtype: (numpy.array F x 3 x 3, numpy.array F x 3 x 1)
+    """
+    source = np.asarray(source, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64)
+    centroid_source = np.mean(source, axis=1, keepdims=True)
+    rotations = BACKENDS[backend](source - centroid_source, targets)
+    translations = np.mean(targets, axis=2, keepdims=True) - rotations @ centroid_source
+    return rotations, translations
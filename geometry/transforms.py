@@ -0,0 +1,257 @@
+import numpy as np
+from .frame import Frame, FrameBatch, as_float_array
+
+
+class HomogeneousBatch:
+    """
+    A stack of rigid transformations as homogeneous 4 x 4 matrices. Composition is a single batched matrix product,
+    so a chain of transformations can be collapsed into one matrix per frame before it is applied to the points.
+    """
+    __slots__ = ('matrices',)
+
+    def __init__(self, matrices):
+        """
+        :param matrices: Homogeneous matrices, F x 4 x 4 (a single 4 x 4 matrix is treated as F = 1)
+        """
+        matrices = as_float_array(matrices)
+        self.matrices = matrices.reshape((-1, 4, 4))
+
+    @classmethod
+    def from_frames(cls, frames):
+        """
+        Converts a Frame, a FrameBatch or a QuaternionBatch.
+        :rtype: HomogeneousBatch
+        """
+        if isinstance(frames, HomogeneousBatch):
+            return frames
+        if isinstance(frames, QuaternionBatch):
+            frames = frames.to_frames()
+        if isinstance(frames, Frame):
+            frames = FrameBatch(frames.rotation[np.newaxis], frames.translation[np.newaxis])
+
+        matrices = np.zeros((len(frames), 4, 4))
+        matrices[:, :3, :3] = frames.rotations
+        matrices[:, :3, 3:] = frames.translations
+        matrices[:, 3, 3] = 1.0
+        return cls(matrices)
+
+    def __len__(self):
+        return len(self.matrices)
+
+    @property
+    def inv(self):
+        """
+        The inverse of every transformation, using the transpose of the rotation block.
+        :rtype: HomogeneousBatch
+        """
+        r_inv = self.matrices[:, :3, :3].transpose(0, 2, 1)
+        matrices = np.zeros_like(self.matrices)
+        matrices[:, :3, :3] = r_inv
+        matrices[:, :3, 3:] = -r_inv @ self.matrices[:, :3, 3:]
+        matrices[:, 3, 3] = 1.0
+        return HomogeneousBatch(matrices)
+
+    def compose(self, f):
+        """
+        Composes every transformation with f (applied first). A single transformation on either side is broadcast
+        over the other's frames.
+        :param f: Frame, FrameBatch, QuaternionBatch or HomogeneousBatch
+
+        :rtype: HomogeneousBatch
+        """
+        return HomogeneousBatch(self.matrices @ HomogeneousBatch.from_frames(f).matrices)
+
+    def apply(self, points):
+        """
+        Applies every transformation to the points.
+        :param points: The same points for every frame (3,) or (3, N), or one set per frame (F, 3, N)
+
+        :return: The transformed points, F x 3 or F x 3 x N
+        :rtype: numpy.array
+        """
+        points = as_float_array(points)
+        rotations, translations = self.matrices[:, :3, :3], self.matrices[:, :3, 3:]
+        if points.ndim == 1:
+            return (rotations @ points[:, np.newaxis] + translations)[:, :, 0]
+        return rotations @ points + translations
+
+    def to_frames(self):
+        """
+        :return: The transformations as a FrameBatch (views into the matrices)
+        :rtype: FrameBatch
+        """
+        return FrameBatch(self.matrices[:, :3, :3], self.matrices[:, :3, 3:])
+
+    def __repr__(self):
+        return 'HomogeneousBatch(n_frames={0})'.format(len(self))
+
+
+class QuaternionBatch:
+    """
+    A stack of rigid transformations as unit quaternions q = (q0, q1, q2, q3), q0 the scalar part, and translations.
+    Composing two rotations takes 16 multiplications instead of the 27 of a matrix product, which adds up over long
+    chains; the result is converted to matrices once, when it is applied to many points.
+    """
+    __slots__ = ('quaternions', 'translations')
+
+    def __init__(self, quaternions, translations):
+        """
+        :param quaternions: Unit quaternions, F x 4
+        :param translations: Translation vectors, F x 3
+        """
+        self.quaternions = as_float_array(quaternions).reshape((-1, 4))
+        self.translations = as_float_array(translations).reshape((-1, 3))
+
+    @classmethod
+    def from_frames(cls, frames):
+        """
+        Converts a Frame, a FrameBatch or a HomogeneousBatch.
+        :rtype: QuaternionBatch
+        """
+        if isinstance(frames, QuaternionBatch):
+            return frames
+        if isinstance(frames, HomogeneousBatch):
+            frames = frames.to_frames()
+        if isinstance(frames, Frame):
+            frames = FrameBatch(frames.rotation[np.newaxis], frames.translation[np.newaxis])
+        return cls(rotation_to_quaternion(frames.rotations), frames.translations[:, :, 0])
+
+    def __len__(self):
+        return len(self.quaternions)
+
+    @property
+    def inv(self):
+        """
+        The inverse of every transformation: the conjugate rotation and the correspondingly rotated translation.
+        :rtype: QuaternionBatch
+        """
+        conjugates = self.quaternions * np.array([1.0, -1.0, -1.0, -1.0])
+        return QuaternionBatch(conjugates, -rotate(conjugates, self.translations))
+
+    def compose(self, f):
+        """
+        Composes every transformation with f (applied first).
+        :param f: Frame, FrameBatch, HomogeneousBatch or QuaternionBatch
+
+        :rtype: QuaternionBatch
+        """
+        f = QuaternionBatch.from_frames(f)
+        return QuaternionBatch(quaternion_product(self.quaternions, f.quaternions),
+                               rotate(self.quaternions, f.translations) + self.translations)
+
+    def apply(self, points):
+        """
+        Applies every transformation to the points.
+        :param points: The same points for every frame (3,) or (3, N), or one set per frame (F, 3, N)
+
+        :return: The transformed points, F x 3 or F x 3 x N
+        :rtype: numpy.array
+        """
+        return HomogeneousBatch.from_frames(self).apply(points)
+
+    def to_frames(self):
+        """
+        :rtype: FrameBatch
+        """
+        return FrameBatch(quaternion_to_rotation(self.quaternions), self.translations)
+
+    def __repr__(self):
+        return 'QuaternionBatch(n_frames={0})'.format(len(self))
+
+
+def quaternion_product(p, q):
+    """
+    Hamilton product p q of stacks of quaternions (F x 4, either may have F = 1); the rotation of q is applied first.
+    """
+    p0, p1, p2, p3 = p[:, 0], p[:, 1], p[:, 2], p[:, 3]
+    q0, q1, q2, q3 = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    return np.stack((p0*q0 - p1*q1 - p2*q2 - p3*q3,
+                     p0*q1 + p1*q0 + p2*q3 - p3*q2,
+                     p0*q2 - p1*q3 + p2*q0 + p3*q1,
+                     p0*q3 + p1*q2 - p2*q1 + p3*q0), axis=1)
+
+
+def rotate(q, v):
+    """
+    Rotates vectors v (F x 3) by unit quaternions q (F x 4): v + 2 q0 (u x v) + 2 u x (u x v), with u = (q1, q2, q3).
+    """
+    u = q[:, 1:]
+    uv = np.cross(u, v)
+    return v + 2 * q[:, :1] * uv + 2 * np.cross(u, uv)
+
+
+def quaternion_to_rotation(q):
+    """
+    Rotation matrices of unit quaternions q = (q0, q1, q2, q3), with q0 the scalar part.
+    :param q: Quaternions, F x 4
+
+    :return: Rotation matrices, F x 3 x 3
+    """
+    q0, q1, q2, q3 = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    q02, q12, q22, q32 = q0**2, q1**2, q2**2, q3**2
+    return np.stack((
+        np.stack((q02+q12-q22-q32, 2*(q1*q2-q0*q3), 2*(q1*q3+q0*q2)), axis=1),
+        np.stack((2*(q1*q2+q0*q3), q02-q12+q22-q32, 2*(q2*q3-q0*q1)), axis=1),
+        np.stack((2*(q1*q3-q0*q2), 2*(q2*q3+q0*q1), q02-q12-q22+q32), axis=1),
+    ), axis=1)
+
+
+def rotation_to_quaternion(rotations):
+    """
+    Unit quaternions of rotation matrices, choosing for each matrix the numerically largest component first
+    (Shepperd's method) so the conversion is stable for every rotation angle.
+    :param rotations: Rotation matrices, F x 3 x 3
+
+    :return: Quaternions with non-negative scalar part, F x 4
+    """
+    R = rotations
+    trace = np.trace(R, axis1=1, axis2=2)
+    # 4 q_i^2 for each component, from the diagonal
+    squares = np.stack((1 + trace,
+                        1 + 2 * R[:, 0, 0] - trace,
+                        1 + 2 * R[:, 1, 1] - trace,
+                        1 + 2 * R[:, 2, 2] - trace), axis=1)
+    largest = np.argmax(squares, axis=1)
+
+    # Off-diagonal sums and differences give 4 q_i q_j
+    products = np.empty((len(R), 4, 4))
+    products[:, 0, 1] = products[:, 1, 0] = R[:, 2, 1] - R[:, 1, 2]
+    products[:, 0, 2] = products[:, 2, 0] = R[:, 0, 2] - R[:, 2, 0]
+    products[:, 0, 3] = products[:, 3, 0] = R[:, 1, 0] - R[:, 0, 1]
+    products[:, 1, 2] = products[:, 2, 1] = R[:, 0, 1] + R[:, 1, 0]
+    products[:, 1, 3] = products[:, 3, 1] = R[:, 0, 2] + R[:, 2, 0]
+    products[:, 2, 3] = products[:, 3, 2] = R[:, 1, 2] + R[:, 2, 1]
+    index = np.arange(4)
+    products[:, index, index] = squares
+
+    # Row i of products is 4 q_i q; dividing by 4 q_i = 2 sqrt(4 q_i^2) recovers q
+    rows = products[np.arange(len(R)), largest]
+    q = rows / (2 * np.sqrt(squares[np.arange(len(R)), largest]))[:, np.newaxis]
+    return q * np.where(q[:, :1] < 0, -1.0, 1.0)
+
+
+def collapse(*chain):
+    """
+    Collapses a chain of transformations into one homogeneous matrix per frame. The chain is written in the order of
+    compose, so the last transformation is applied first: collapse(F_reg, registrations) maps x to
+    F_reg(registrations(x)). Single transformations are broadcast over the batches in the chain.
+    :param chain: Frame, FrameBatch, HomogeneousBatch or QuaternionBatch objects
+
+    :rtype: HomogeneousBatch
+    """
+    result = HomogeneousBatch.from_frames(chain[-1])
+    for f in reversed(chain[:-1]):
+        result = HomogeneousBatch.from_frames(f).compose(result)
+    return result
+
+
+def apply_chain(chain, points):
+    """
+    Applies a chain of transformations to points by collapsing it first, so the points are only transformed once.
+    :param chain: Sequence of transformations as passed to collapse
+    :param points: (3,), (3, N) or (F, 3, N) points
+
+    :return: The transformed points, F x 3 or F x 3 x N
+    :rtype: numpy.array
+    """
+    return collapse(*chain).apply(points)